@@ -0,0 +1,85 @@
+"""
+Agregaty faktur liczone przyrostowo: magazyn.py dodaje i odejmuje tylko faktury, które
+zmieniły się w danym zapisie, a gotowe sumy czytają /stats w server.py i podsumowanie w zwrot.py.
+Kwoty w groszach (int) — wielokrotne dodawanie i odejmowanie nie gubi precyzji.
+"""
+
+import re
+
+_DATA_ISO = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+
+def _grosze(faktura):
+    try:
+        return round(float(faktura.get('kwota_faktury') or 0) * 100)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _data(tekst):
+    """(rok, miesiąc) z daty RRRR-MM-DD albo None — bez strptime, daty z ekstrakcji są już w ISO."""
+    m = _DATA_ISO.match(tekst or '')
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+class Agregaty:
+    """
+    Suma i liczba faktur, koszyki miesięczne (wg daty wykonania usługi — jak wykres w UI)
+    i kwartalne (wg daty wystawienia — jak rozliczenie), zawsze z rokiem w kluczu.
+    """
+
+    def __init__(self, stan=None):
+        stan = stan or {}
+        self.liczba = stan.get('liczba', 0)
+        self.grosze = stan.get('grosze', 0)
+        self.miesiace = {k: list(v) for k, v in stan.get('miesiace', {}).items()}  # 'RRRR-MM' -> [grosze, liczba]
+        self.kwartaly = {k: list(v) for k, v in stan.get('kwartaly', {}).items()}  # 'RRRR-Qn' -> [grosze, liczba]
+        self.daty = dict(stan.get('daty', {}))  # data wykonania -> liczba faktur (min/max po usunięciach)
+
+    @staticmethod
+    def _zmien(koszyki, klucz, grosze, znak):
+        koszyk = koszyki.setdefault(klucz, [0, 0])
+        koszyk[0] += znak * grosze
+        koszyk[1] += znak
+        if koszyk[1] == 0:
+            del koszyki[klucz]
+
+    def dodaj(self, faktura, znak=1):
+        grosze = _grosze(faktura)
+        self.liczba += znak
+        self.grosze += znak * grosze
+
+        wykonanie = faktura.get('data_wykonania_uslugi')
+        if _data(wykonanie):
+            rok, miesiac = _data(wykonanie)
+            self._zmien(self.miesiace, f"{rok}-{miesiac:02d}", grosze, znak)
+            self.daty[wykonanie] = self.daty.get(wykonanie, 0) + znak
+            if self.daty[wykonanie] == 0:
+                del self.daty[wykonanie]
+
+        if _data(faktura.get('data_wystawienia')):
+            rok, miesiac = _data(faktura.get('data_wystawienia'))
+            self._zmien(self.kwartaly, f"{rok}-Q{(miesiac - 1) // 3 + 1}", grosze, znak)
+
+    def usun(self, faktura):
+        self.dodaj(faktura, znak=-1)
+
+    def stan(self):
+        """Postać do zapisu w JSON razem z magazynem."""
+        return {'liczba': self.liczba, 'grosze': self.grosze, 'miesiace': self.miesiace,
+                'kwartaly': self.kwartaly, 'daty': self.daty}
+
+    def slownik(self):
+        """Odpowiedź /stats — pola jak DashboardStats w UI, kwoty w PLN."""
+        return {
+            'totalAmount': self.grosze / 100,
+            'invoiceCount': self.liczba,
+            'averageAmount': self.grosze / 100 / self.liczba if self.liczba else 0,
+            'dateRange': {'from': min(self.daty, default=''), 'to': max(self.daty, default='')},
+            'monthlyBreakdown': [{'month': k, 'total': v[0] / 100, 'count': v[1]}
+                                 for k, v in sorted(self.miesiace.items())],
+            'quarterlyBreakdown': [{'year': int(k[:4]), 'quarter': int(k[-1]), 'total': v[0] / 100, 'count': v[1]}
+                                   for k, v in sorted(self.kwartaly.items())],
+        }
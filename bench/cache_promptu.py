@@ -0,0 +1,59 @@
+"""
+Sprawdzenie prompt cachingu na żywym API: długość prefiksu (narzędzia + system) z count_tokens
+i usage dwóch kolejnych zapytań z różnymi dokumentami — drugie musi czytać prefiks z cache.
+Wymaga klucza w config.json. Uruchom z katalogu projektu: python bench/cache_promptu.py [--zbiorczo]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zwrot  # noqa: E402
+
+DOKUMENTY = [
+    "FAKTURA nr 01/05/2025 Szczecin, dnia 31.05.2025\nData wykonania uslugi: 30.05.2025\n"
+    "Terapia logopedyczna Ilosc: 1 Cena jedn.: 130,00 zl\nDo zaplaty: 130,00 zl",
+    "FAKTURA nr 02/05/2025 Szczecin, dnia 31.05.2025\nData wykonania uslugi: 29.05.2025\n"
+    "Terapia logopedyczna Ilosc: 2 Cena jedn.: 130,00 zl\nDo zaplaty: 260,00 zl",
+]
+
+
+def parametry(tekst, zbiorczo):
+    if zbiorczo:
+        return zwrot._parametry_zapytania(zwrot.INSTRUKCJE_EKSTRAKCJI_ZBIORCZEJ, zwrot.NARZEDZIE_FAKTURY_ZBIORCZE,
+                                          f'<dokument id="1">\n{tekst}\n</dokument>', 8192)
+    return zwrot._parametry_faktury(tekst)
+
+
+def tokeny_prefiksu(client, zbiorczo):
+    """count_tokens całego zapytania minus sama wiadomość użytkownika ≈ prefiks objęty cache_control."""
+    p = parametry(DOKUMENTY[0], zbiorczo)
+    calosc = client.messages.count_tokens(model=p['model'], system=p['system'], tools=p['tools'],
+                                          messages=p['messages']).input_tokens
+    wiadomosc = client.messages.count_tokens(model=p['model'], messages=p['messages']).input_tokens
+    return calosc - wiadomosc
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--zbiorczo', action='store_true', help='prompt zapytania zbiorczego')
+    args = parser.parse_args()
+
+    client = zwrot.skonfiguruj_model_ai()
+    if client is None:
+        sys.exit(1)
+    prefiks = tokeny_prefiksu(client, args.zbiorczo)
+    print(f"Prefiks: {prefiks} tokenów (minimum {zwrot.MIN_TOKENOW_CACHE}, "
+          f"szacunek lokalny systemu: {zwrot.szacuj_tokeny(parametry('', args.zbiorczo)['system'][0]['text'])})")
+
+    odczyty = []
+    for nr, tekst in enumerate(DOKUMENTY, 1):
+        usage = client.messages.create(**parametry(tekst, args.zbiorczo)).usage
+        odczyty.append(usage.cache_read_input_tokens or 0)
+        print(f"Zapytanie {nr}: wejście {usage.input_tokens}, zapis do cache "
+              f"{usage.cache_creation_input_tokens or 0}, odczyt z cache {odczyty[-1]}")
+    if not odczyty[-1]:
+        print("❌ Drugie zapytanie nie skorzystało z cache promptu")
+        sys.exit(1)
+    print("✅ Drugie zapytanie czyta prefiks z cache")
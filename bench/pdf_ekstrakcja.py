@@ -0,0 +1,87 @@
+"""
+Benchmark ekstrakcji tekstu z PDF: przepustowość vs liczba procesów w puli.
+Korpus to syntetyczne, wielostronicowe faktury generowane w locie (bez dodatkowych bibliotek).
+Uruchom z katalogu projektu: python bench/pdf_ekstrakcja.py [--dokumenty 40] [--strony 30]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ekstrakcja  # noqa: E402
+import zwrot  # noqa: E402
+
+
+def _linie_strony(nr_dokumentu, nr_strony):
+    return [
+        f"FAKTURA nr {nr_strony + 1:02d}/{nr_dokumentu % 12 + 1:02d}/2025",
+        "Gabinet Logopedyczny, ul. Przykladowa 1, 70-001 Szczecin",
+        "Data wystawienia: 2025-05-31   Data wykonania uslugi: 2025-05-30",
+        "Nazwa uslugi: Terapia logopedyczna   Ilosc: 1   Cena jedn.: 130,00 zl",
+        "Do zaplaty: 130,00 zl   Slownie: sto trzydziesci zlotych 00/100",
+    ] + [f"Pozycja dodatkowa {i}: konsultacja, opis, uwagi, warunki platnosci" for i in range(40)]
+
+
+def syntetyczny_pdf(nr_dokumentu, liczba_stron):
+    """Minimalny, poprawny PDF z tekstem (Helvetica) — bez reportlab."""
+    obiekty = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    strony = []
+    for nr_strony in range(liczba_stron):
+        linie = _linie_strony(nr_dokumentu, nr_strony)
+        tresc = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({l}) '" for l in linie) + " ET"
+        tresc = tresc.encode('latin-1')
+        obiekty.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(tresc), tresc))
+        obiekty.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(obiekty))
+        strony.append(len(obiekty))
+    kids = b" ".join(b"%d 0 R" % n for n in strony)
+    obiekty[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(strony))
+
+    wynik = bytearray(b"%PDF-1.4\n")
+    przesuniecia = []
+    for i, obiekt in enumerate(obiekty, start=1):
+        przesuniecia.append(len(wynik))
+        wynik += b"%d 0 obj\n%s\nendobj\n" % (i, obiekt)
+    xref = len(wynik)
+    wynik += b"xref\n0 %d\n0000000000 65535 f \n" % (len(obiekty) + 1)
+    wynik += b"".join(b"%010d 00000 n \n" % p for p in przesuniecia)
+    wynik += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(obiekty) + 1, xref)
+    return bytes(wynik)
+
+
+def zmierz(korpus, procesy):
+    """Czas odczytu całego korpusu; procesy=0 oznacza stary tryb w wątku głównym."""
+    start = time.perf_counter()
+    if procesy == 0:
+        for pdf_bytes in korpus:
+            zwrot.odczytaj_tekst_z_pliku_pdf(pdf_bytes)
+    else:
+        with ekstrakcja.PulaEkstrakcji(procesy) as pula:
+            with ThreadPoolExecutor(max_workers=procesy) as ex:
+                list(ex.map(lambda b: zwrot.odczytaj_tekst_z_pliku_pdf(b, pula=pula), korpus))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dokumenty', type=int, default=40)
+    parser.add_argument('--strony', type=int, default=30)
+    args = parser.parse_args()
+
+    korpus = [syntetyczny_pdf(i, args.strony) for i in range(args.dokumenty)]
+    stron = args.dokumenty * args.strony
+    print(f"Korpus: {args.dokumenty} dokumentów x {args.strony} stron, "
+          f"{sum(map(len, korpus)) / 1e6:.1f} MB, {os.cpu_count()} rdzeni\n")
+    print(f"{'procesy':>8} {'czas [s]':>10} {'strony/s':>10} {'przyspieszenie':>15}")
+
+    bazowy = zmierz(korpus, 0)
+    print(f"{'wątek':>8} {bazowy:>10.2f} {stron / bazowy:>10.0f} {1.0:>15.2f}")
+    procesy = 1
+    while procesy <= (os.cpu_count() or 1):
+        czas = zmierz(korpus, procesy)
+        print(f"{procesy:>8} {czas:>10.2f} {stron / czas:>10.0f} {bazowy / czas:>15.2f}")
+        procesy *= 2
@@ -0,0 +1,100 @@
+"""
+Test obciążeniowy server.py: latencja /status w trakcie długiego /merge-pdfs.
+Domyślnie porównuje HTTPServer i ThreadingHTTPServer w procesie, z symulowanym scalaniem (sleep).
+Z --url mierzy działający serwer (prawdziwe scalanie z Dysku):
+python bench/serwer_obciazenie.py [--scalanie 5] [--zapytania 200] [--url http://localhost:8765]
+"""
+
+import argparse
+import http.server
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server  # noqa: E402
+
+
+def _pobierz(url, timeout=120):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        r.read()
+    return time.perf_counter() - start
+
+
+def _scal(url):
+    """/merge-pdfs jako zadanie w tle: czekamy, aż /jobs/<id> przestanie być 'running'."""
+    start = time.perf_counter()
+    with urllib.request.urlopen(f'{url}/merge-pdfs', timeout=120) as r:
+        odpowiedz = json.load(r)
+    while odpowiedz.get('job'):
+        time.sleep(0.1)
+        with urllib.request.urlopen(f"{url}/jobs/{odpowiedz['job']}", timeout=10) as r:
+            if json.load(r)['state'] != 'running':
+                break
+    return time.perf_counter() - start
+
+
+def zmierz(url, zapytania):
+    """Odpala /merge-pdfs w tle i odpytuje /status; zwraca (latencje /status w ms, czas scalania)."""
+    czas_scalania = []
+    scalanie = threading.Thread(target=lambda: czas_scalania.append(_scal(url)))
+    scalanie.start()
+    time.sleep(0.2)  # scalanie ma już trwać, zanim zaczniemy mierzyć
+
+    latencje = []
+    for _ in range(zapytania):
+        if not scalanie.is_alive():
+            break
+        latencje.append(_pobierz(f'{url}/status') * 1000)
+        time.sleep(0.01)
+    scalanie.join()
+    return latencje, czas_scalania[0]
+
+
+def _serwer_w_procesie(klasa, czas_scalania):
+    """Serwer na wolnym porcie z Handlerem, którego /merge-pdfs tylko śpi."""
+    class Handler(server.Handler):
+        def _merge_pdfs(self):
+            time.sleep(czas_scalania)
+            self._json(200, {'status': 'ok'})
+
+        def log_message(self, format, *args):
+            pass
+
+    srv = klasa(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f'http://127.0.0.1:{srv.server_address[1]}'
+
+
+def _raport(nazwa, latencje, czas):
+    if not latencje:
+        print(f"{nazwa:>22} {'—':>8} {'—':>8} {'—':>8} {0:>6} {czas:>12.2f}")
+        return
+    p95 = sorted(latencje)[int(len(latencje) * 0.95) - 1] if len(latencje) >= 20 else max(latencje)
+    print(f"{nazwa:>22} {statistics.median(latencje):>8.1f} {p95:>8.1f} {max(latencje):>8.1f} "
+          f"{len(latencje):>6} {czas:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scalanie', type=float, default=3.0, help='symulowany czas /merge-pdfs [s]')
+    parser.add_argument('--zapytania', type=int, default=200)
+    parser.add_argument('--url', help='zmierz działający serwer zamiast symulacji')
+    args = parser.parse_args()
+
+    print(f"{'serwer':>22} {'p50 [ms]':>8} {'p95 [ms]':>8} {'max [ms]':>8} {'n':>6} {'scalanie [s]':>12}")
+    if args.url:
+        _raport(args.url, *zmierz(args.url.rstrip('/'), args.zapytania))
+    else:
+        for klasa in (http.server.HTTPServer, http.server.ThreadingHTTPServer):
+            srv, url = _serwer_w_procesie(klasa, args.scalanie)
+            try:
+                _raport(klasa.__name__, *zmierz(url, args.zapytania))
+            finally:
+                srv.shutdown()
+                srv.server_close()
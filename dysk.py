@@ -0,0 +1,175 @@
+"""
+Wspólne operacje na Dysku Google dla zwrot.py i server.py.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
+
+# Tylko pola, których faktycznie używamy — mniejsze odpowiedzi przy dużych folderach.
+POLA_PLIKU = 'id, name, md5Checksum, modifiedTime, size'
+ROZMIAR_STRONY = 1000  # maksimum dla files().list
+
+# Pobieranie: plik do PROG_PAMIECI zostaje w RAM, większy ląduje w pliku tymczasowym.
+# Każdy fragment to osobne zapytanie z nagłówkiem Range, w całości trzymane w pamięci —
+# domyślne 100 MB z googleapiclient oznaczałoby cały skan naraz w RAM.
+PROG_PAMIECI = 8 * 1024 * 1024
+ROZMIAR_FRAGMENTU = 16 * 1024 * 1024
+
+# Wspólny magazyn pobranych PDF-ów (refresh w zwrot.py i /merge-pdfs w server.py czytają przez niego).
+KATALOG_BLOBOW = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_pdf')
+LIMIT_BLOBOW = 500 * 1024 * 1024
+
+
+def zapytanie_pdf(folder_id):
+    """Query dla plików PDF w folderze (bez kosza)."""
+    return f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
+
+
+def listuj_pliki(service, query, pola=POLA_PLIKU):
+    """
+    Generator po WSZYSTKICH plikach spełniających `query`, strona po stronie (nextPageToken).
+    Wywołujący może zacząć przetwarzanie, zanim listing się skończy.
+    """
+    token = None
+    while True:
+        odp = service.files().list(
+            q=query, pageSize=ROZMIAR_STRONY, pageToken=token,
+            fields=f"nextPageToken, files({pola})"
+        ).execute()
+        yield from odp.get('files', [])
+        token = odp.get('nextPageToken')
+        if not token:
+            return
+
+
+_lokalne = threading.local()
+
+
+def http_watku(service):
+    """httplib2 nie jest thread-safe — każdy wątek pobierający dostaje własne połączenie z tymi samymi creds."""
+    return _http_dla(service._http.credentials)
+
+
+def _http_dla(credentials):
+    http = getattr(_lokalne, 'http', None)
+    if http is None:
+        http = AuthorizedHttp(credentials, http=httplib2.Http())
+        _lokalne.http = http
+    return http
+
+
+def zapytanie_watku(http, *args, **kwargs):
+    """requestBuilder dla build(): każde zapytanie serwisu idzie przez połączenie bieżącego wątku."""
+    return HttpRequest(_http_dla(http.credentials), *args, **kwargs)
+
+
+def pobierz_plik(service, file_id, http=None, chunksize=ROZMIAR_FRAGMENTU):
+    """
+    Pobiera plik strumieniowo do SpooledTemporaryFile i zwraca uchwyt przewinięty na początek.
+    Czytelnicy (np. PdfReader) dostają uchwyt zamiast kopii bajtów; wywołujący zamyka go po użyciu.
+    `http` pozwala podać osobne połączenie dla wątku (httplib2 nie jest thread-safe).
+    """
+    request = service.files().get_media(fileId=file_id)
+    if http is not None:
+        request.http = http
+    fh = tempfile.SpooledTemporaryFile(max_size=PROG_PAMIECI)
+    try:
+        downloader = MediaIoBaseDownload(fh, request, chunksize=chunksize)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+    except BaseException:
+        fh.close()
+        raise
+    fh.seek(0)
+    return fh
+
+
+def sha256_pliku(fh, blok=1024 * 1024):
+    """SHA-256 liczony blokami z uchwytu (bez wczytywania całości); przewija uchwyt z powrotem."""
+    skrot = hashlib.sha256()
+    for kawalek in iter(lambda: fh.read(blok), b''):
+        skrot.update(kawalek)
+    fh.seek(0)
+    return skrot.hexdigest()
+
+
+class MagazynBlobow:
+    """
+    Lokalny magazyn PDF-ów adresowany przez (file id, md5Checksum) — nowa wersja pliku na Dysku
+    ma inne md5, więc nigdy nie dostaniemy starej treści. Powyżej `limit` bajtów usuwane są
+    najdawniej używane pliki (mtime odświeżany przy każdym odczycie).
+    """
+
+    def __init__(self, katalog=KATALOG_BLOBOW, limit=LIMIT_BLOBOW):
+        self.katalog = katalog
+        self.limit = limit
+        self._lock = threading.Lock()
+
+    def sciezka(self, plik):
+        """Ścieżka bloba w magazynie (None dla plików bez md5Checksum) — plik mógł już zostać przycięty."""
+        if not plik.get('md5Checksum'):
+            return None
+        return os.path.join(self.katalog, f"{plik['id']}_{plik['md5Checksum']}.pdf")
+
+    def otworz(self, service, plik, http=None):
+        """
+        Zwraca otwarty uchwyt ('rb') do treści pliku; z Dysku pobiera tylko przy braku w magazynie.
+        Pliki bez md5Checksum nie są cache'owane — idą przez pobierz_plik().
+        """
+        sciezka = self.sciezka(plik)
+        if sciezka is None:
+            return pobierz_plik(service, plik['id'], http=http)
+        try:
+            fh = open(sciezka, 'rb')
+            os.utime(sciezka)
+            return fh
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(self.katalog, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.katalog, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                request = service.files().get_media(fileId=plik['id'])
+                if http is not None:
+                    request.http = http
+                downloader = MediaIoBaseDownload(out, request, chunksize=ROZMIAR_FRAGMENTU)
+                done = False
+                while not done:
+                    _, done = downloader.next_chunk()
+            # Otwieramy przed przycięciem — usunięcie ścieżki nie unieważnia otwartego uchwytu.
+            os.replace(tmp, sciezka)
+            fh = open(sciezka, 'rb')
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.przytnij()
+        return fh
+
+    def przytnij(self):
+        """Usuwa najdawniej używane pliki, aż magazyn zmieści się w limicie."""
+        with self._lock:
+            try:
+                wpisy = [e for e in os.scandir(self.katalog) if e.name.endswith('.pdf')]
+            except FileNotFoundError:
+                return
+            staty = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in wpisy), reverse=True)
+            rozmiar = 0
+            for i, (_, wielkosc, sciezka) in enumerate(staty):
+                rozmiar += wielkosc
+                if i > 0 and rozmiar > self.limit:  # najświeższy plik zostaje zawsze
+                    try:
+                        os.remove(sciezka)
+                    except FileNotFoundError:
+                        pass
+
+
+MAGAZYN = MagazynBlobow()
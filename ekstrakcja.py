@@ -0,0 +1,161 @@
+"""
+Odczyt tekstu z PDF-ów w procesach roboczych (PyPDF2 jest CPU-bound i trzyma GIL).
+Moduł importuje tylko PyPDF2 — proces roboczy nie ładuje klientów Dysku ani Claude.
+"""
+
+import concurrent.futures
+import io
+import itertools
+import multiprocessing
+import queue
+import threading
+
+import PyPDF2
+
+# Priorytety w kolejce puli: pierwszy zakres każdego dokumentu idzie przed dalszymi zakresami
+# innych dokumentów — długi PDF nie blokuje jednostronicowych faktur wrzuconych po nim.
+PIERWSZY_ZAKRES = 0
+DALSZY_ZAKRES = 1
+_STOP = -1
+
+
+def _czytnik(zrodlo):
+    """PdfReader ze ścieżki (blob z dysk.MAGAZYN) albo z bajtów."""
+    return PyPDF2.PdfReader(zrodlo if isinstance(zrodlo, str) else io.BytesIO(zrodlo))
+
+
+def _teksty(reader, od, do):
+    czesci = []
+    for page in reader.pages[od:do]:
+        page_text = page.extract_text()
+        if page_text:
+            czesci.append(page_text)
+    return czesci
+
+
+def tekst_ze_stron(zrodlo, od=0, do=None):
+    """Lista tekstów stron [od, do)."""
+    return _teksty(_czytnik(zrodlo), od, do)
+
+
+def pierwszy_zakres(zrodlo, do):
+    """(liczba stron, teksty stron [0, do)) — pierwsze zadanie dokumentu liczy też jego strony."""
+    reader = _czytnik(zrodlo)
+    return len(reader.pages), _teksty(reader, 0, do)
+
+
+def _petla_robotnika(polaczenie):
+    """Proces roboczy: (funkcja, argumenty) -> (True, wynik) albo (False, opis błędu), aż do zamknięcia połączenia."""
+    while True:
+        try:
+            funkcja, args = polaczenie.recv()
+        except EOFError:
+            return
+        try:
+            odpowiedz = (True, funkcja(*args))
+        except Exception as e:
+            odpowiedz = (False, f"{type(e).__name__}: {e}")
+        polaczenie.send(odpowiedz)
+
+
+class PulaEkstrakcji:
+    """
+    Procesy robocze z kolejką priorytetową. Każdy proces ma w procesie rodzica wątek-nadzorcę:
+    limit czasu zadania liczy się od wysłania go do procesu (nie od wstawienia do kolejki),
+    a proces, który limit przekroczy, jest ubijany i przy następnym zadaniu startuje nowy.
+    Procesy startują leniwie — pula bez zadań nie kosztuje nic poza wątkami.
+    """
+
+    def __init__(self, procesy):
+        self.procesy = procesy
+        self._kolejka = queue.PriorityQueue()
+        self._licznik = itertools.count()
+        self._zywe = set()
+        self._lock = threading.Lock()
+        self._zamknieta = False
+        for _ in range(procesy):
+            threading.Thread(target=self._nadzoruj, daemon=True).start()
+
+    def zlec(self, funkcja, args, limit_czasu, priorytet=PIERWSZY_ZAKRES):
+        """
+        Future z wynikiem funkcja(*args) z procesu roboczego. `funkcja` musi być funkcją
+        z poziomu modułu (idzie przez pickle). Po `limit_czasu` sekundach pracy — TimeoutError.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._zamknieta:
+                raise RuntimeError('Pula ekstrakcji jest zamknięta')
+            self._kolejka.put((priorytet, next(self._licznik), (funkcja, args, limit_czasu, future)))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.zamknij()
+
+    def zamknij(self):
+        """Anuluje zadania z kolejki i ubija procesy (także te w trakcie pracy)."""
+        with self._lock:
+            if self._zamknieta:
+                return
+            self._zamknieta = True
+            while True:
+                try:
+                    *_, zadanie = self._kolejka.get_nowait()
+                except queue.Empty:
+                    break
+                zadanie[-1].cancel()
+            for _ in range(self.procesy):
+                self._kolejka.put((_STOP, next(self._licznik), None))
+            zywe = list(self._zywe)
+        for proces in zywe:
+            proces.kill()
+
+    def _uruchom(self):
+        rodzic, dziecko = multiprocessing.Pipe()
+        proces = multiprocessing.Process(target=_petla_robotnika, args=(dziecko,), daemon=True)
+        proces.start()
+        dziecko.close()
+        with self._lock:
+            self._zywe.add(proces)
+        return proces, rodzic
+
+    def _zatrzymaj(self, proces, polaczenie):
+        proces.kill()
+        proces.join()
+        polaczenie.close()
+        with self._lock:
+            self._zywe.discard(proces)
+
+    def _nadzoruj(self):
+        proces = polaczenie = None
+        try:
+            while True:
+                *_, zadanie = self._kolejka.get()
+                if zadanie is None:
+                    return
+                funkcja, args, limit_czasu, future = zadanie
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if proces is None:
+                    proces, polaczenie = self._uruchom()
+                try:
+                    polaczenie.send((funkcja, args))
+                    if not polaczenie.poll(limit_czasu):
+                        raise TimeoutError(f"Przekroczono limit {limit_czasu}s")
+                    ok, wynik = polaczenie.recv()
+                except (TimeoutError, EOFError, OSError) as e:
+                    # Proces zawieszony na patologicznym PDF-ie albo martwy — nie oddajemy go do puli.
+                    self._zatrzymaj(proces, polaczenie)
+                    proces = polaczenie = None
+                    future.set_exception(e if isinstance(e, TimeoutError)
+                                         else RuntimeError(f"Proces ekstrakcji przerwany: {e!r}"))
+                    continue
+                if ok:
+                    future.set_result(wynik)
+                else:
+                    future.set_exception(RuntimeError(wynik))
+        finally:
+            if proces is not None:
+                self._zatrzymaj(proces, polaczenie)
@@ -0,0 +1,250 @@
+"""
+Magazyn faktur wspólny dla zwrot.py (zapis) i server.py (odczyt /invoices, /stats).
+SQLite w trybie WAL: serwer czyta, gdy zwrot.py zapisuje, a zapis zmienia tylko wiersze,
+które się zmieniły (upsert po numerze faktury i ID pliku źródłowego).
+Każdy zapis ze zmianami podbija rewizję; faktury dodane lub zmienione dostają numer tej rewizji,
+usunięte zostawiają nagrobek — dzięki temu klient z rewizją N dostaje tylko różnicę.
+faktury_dane.json to eksport dla zgodności wstecz (statyczne UI), zapisywany atomowo.
+Przy okazji zapis aktualizuje agregaty (agregaty.py) o różnicę — /stats ich nie przelicza.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from agregaty import Agregaty
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BAZA_PLIK = os.path.join(SCRIPT_DIR, 'faktury.db')
+DANE_PLIK = os.path.join(SCRIPT_DIR, 'faktury_dane.json')
+ZRODLO_IMPORTU = 'import'  # file id faktur z samego faktury_dane.json (bez stanu rewizji): 'import/#<pozycja>'
+
+SCHEMAT = """
+CREATE TABLE IF NOT EXISTS faktury (
+    file_id TEXT NOT NULL,
+    numer TEXT NOT NULL,  -- numer faktury; bez numeru albo przy powtórce '#<pozycja w pliku>'
+    data_wystawienia TEXT,
+    data_wykonania_uslugi TEXT,
+    kwota_faktury REAL,
+    dane TEXT NOT NULL,  -- pełna faktura jako JSON
+    rewizja INTEGER NOT NULL,
+    pozycja INTEGER NOT NULL,  -- kolejność w eksporcie
+    PRIMARY KEY (file_id, numer)
+);
+CREATE INDEX IF NOT EXISTS faktury_wykonanie ON faktury (data_wykonania_uslugi);
+CREATE INDEX IF NOT EXISTS faktury_wystawienie ON faktury (data_wystawienia);
+CREATE INDEX IF NOT EXISTS faktury_rewizja ON faktury (rewizja);
+CREATE TABLE IF NOT EXISTS usuniete (id TEXT PRIMARY KEY, rewizja INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (klucz TEXT PRIMARY KEY, wartosc TEXT NOT NULL);
+"""
+
+_lokalne = threading.local()  # połączenie sqlite3 nie może przechodzić między wątkami
+_lock = threading.Lock()
+_gotowe = set()  # bazy ze schematem i importem sprawdzonym w tym procesie
+
+
+def klucze_faktur(file_id, faktury):
+    """Stabilne id faktur z jednego pliku: '<file id>/<numer>', a bez numeru albo przy powtórce — pozycja w pliku."""
+    klucze = []
+    for i, faktura in enumerate(faktury):
+        klucz = f"{file_id}/{faktura.get('numer') or f'#{i}'}"
+        if klucz in klucze:
+            klucz = f"{file_id}/#{i}"
+        klucze.append(klucz)
+    return klucze
+
+
+def _polacz(sciezka):
+    """
+    Połączenie bieżącego wątku z bazą. Schemat, tryb WAL i import faktury_dane.json — raz na proces
+    i bazę; ThreadingHTTPServer otwiera połączenie w każdym nowym wątku, a czytelnik nie może
+    przy tym brać blokady zapisu. Bez ścieżki — BAZA_PLIK w chwili wywołania.
+    """
+    sciezka = sciezka or BAZA_PLIK
+    polaczenia = getattr(_lokalne, 'polaczenia', None)
+    if polaczenia is None:
+        polaczenia = _lokalne.polaczenia = {}
+    conn = polaczenia.get(sciezka)
+    if conn is None:
+        conn = sqlite3.connect(sciezka, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with _lock:
+            if sciezka not in _gotowe:
+                _przygotuj(conn, sciezka)
+                _gotowe.add(sciezka)
+        polaczenia[sciezka] = conn
+    return conn
+
+
+def _przygotuj(conn, sciezka):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMAT)
+    if conn.execute("SELECT 1 FROM meta WHERE klucz = 'rewizja'").fetchone():
+        return
+    with _transakcja(conn, zapis=True):
+        if _meta(conn, 'rewizja') is None:  # drugi proces mógł zdążyć przed nami
+            _importuj_dane(conn, os.path.join(os.path.dirname(sciezka), os.path.basename(DANE_PLIK)))
+
+
+@contextmanager
+def _transakcja(conn, zapis=False):
+    """
+    Odczyt: spójny snapshot (WAL nie blokuje go zapisem). Zapis: BEGIN IMMEDIATE — odczyt stanu
+    i zapis różnicy bez wtrącenia drugiego zapisującego procesu.
+    """
+    conn.execute('BEGIN IMMEDIATE' if zapis else 'BEGIN')
+    try:
+        yield
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def _meta(conn, klucz, domyslna=None):
+    wiersz = conn.execute('SELECT wartosc FROM meta WHERE klucz = ?', (klucz,)).fetchone()
+    return json.loads(wiersz[0]) if wiersz else domyslna
+
+
+def _ustaw_meta(conn, klucz, wartosc):
+    conn.execute('INSERT INTO meta (klucz, wartosc) VALUES (?, ?) '
+                 'ON CONFLICT (klucz) DO UPDATE SET wartosc = excluded.wartosc', (klucz, json.dumps(wartosc)))
+
+
+def _importuj_dane(conn, sciezka_danych):
+    """
+    Nowa baza: faktury z faktury_dane.json z id wg pozycji, żeby UI i /stats nie pokazywały zer
+    do pierwszego odświeżenia (które zastąpi je fakturami z prawdziwymi id).
+    """
+    try:
+        with open(sciezka_danych, 'r', encoding='utf-8') as f:
+            faktury = json.load(f)
+    except (OSError, ValueError):
+        faktury = []
+    if not isinstance(faktury, list):
+        faktury = []
+    agregaty = Agregaty()
+    for pozycja, faktura in enumerate(faktury):
+        _upsert(conn, f'{ZRODLO_IMPORTU}/#{pozycja}', faktura, 1, pozycja)
+        agregaty.dodaj(faktura)
+    _ustaw_meta(conn, 'rewizja', 1 if faktury else 0)
+    _ustaw_meta(conn, 'agregaty', agregaty.stan())
+
+
+def _dane(faktura):
+    return json.dumps(faktura, ensure_ascii=False)
+
+
+def _upsert(conn, klucz, faktura, rewizja, pozycja):
+    file_id, numer = klucz.split('/', 1)  # id z klucze_faktur(); ID plików z Dysku nie zawierają '/'
+    conn.execute(
+        'INSERT INTO faktury (file_id, numer, data_wystawienia, data_wykonania_uslugi, kwota_faktury, dane, rewizja, pozycja) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (file_id, numer) DO UPDATE SET data_wystawienia = excluded.data_wystawienia, '
+        'data_wykonania_uslugi = excluded.data_wykonania_uslugi, kwota_faktury = excluded.kwota_faktury, '
+        'dane = excluded.dane, rewizja = excluded.rewizja, pozycja = excluded.pozycja',
+        (file_id, numer, faktura.get('data_wystawienia'), faktura.get('data_wykonania_uslugi'),
+         faktura.get('kwota_faktury'), _dane(faktura), rewizja, pozycja))
+
+
+def _zapisz_atomowo(sciezka, dane, **opcje):
+    tmp = sciezka + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dane, f, ensure_ascii=False, **opcje)
+    os.replace(tmp, sciezka)
+
+
+def _faktury(conn, warunek='', parametry=()):
+    """(id, faktura) w kolejności eksportu, opcjonalnie z warunkiem WHERE."""
+    wiersze = conn.execute(f"SELECT file_id || '/' || numer, dane FROM faktury {warunek} ORDER BY pozycja", parametry)
+    return [(klucz, json.loads(dane)) for klucz, dane in wiersze]
+
+
+def zapisz(faktury, sciezka=None, eksport=None):
+    """
+    Zapisuje pełny zbiór faktur: lista (id, faktura) w kolejności eksportu.
+    Każda faktura to odczyt po kluczu głównym i porównanie zapisanego JSON-a; dekodowane są tylko
+    wiersze zmienione albo usunięte (dla agregatów). Rewizja rośnie tylko, gdy coś się zmieniło.
+    Zwraca bieżącą rewizję.
+    """
+    conn = _polacz(sciezka)
+    with _transakcja(conn, zapis=True):
+        poprzednia = _meta(conn, 'rewizja', 0)
+        nowa = poprzednia + 1
+        agregaty = Agregaty(_meta(conn, 'agregaty'))
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS biezace (file_id TEXT, numer TEXT, PRIMARY KEY (file_id, numer))')
+        conn.execute('DELETE FROM temp.biezace')
+
+        zmiany = 0
+        for pozycja, (klucz, faktura) in enumerate(faktury):
+            file_id, numer = klucz.split('/', 1)
+            conn.execute('INSERT OR IGNORE INTO temp.biezace VALUES (?, ?)', (file_id, numer))
+            wiersz = conn.execute('SELECT dane, pozycja FROM faktury WHERE file_id = ? AND numer = ?',
+                                  (file_id, numer)).fetchone()
+            if wiersz is not None and wiersz[0] == _dane(faktura):
+                if wiersz[1] != pozycja:
+                    conn.execute('UPDATE faktury SET pozycja = ? WHERE file_id = ? AND numer = ?',
+                                 (pozycja, file_id, numer))
+                continue
+            if wiersz is not None:
+                agregaty.usun(json.loads(wiersz[0]))
+            agregaty.dodaj(faktura)
+            _upsert(conn, klucz, faktura, nowa, pozycja)
+            conn.execute('DELETE FROM usuniete WHERE id = ?', (klucz,))
+            zmiany += 1
+
+        usuniete = conn.execute(
+            'SELECT file_id, numer, dane FROM faktury f WHERE NOT EXISTS '
+            '(SELECT 1 FROM temp.biezace b WHERE b.file_id = f.file_id AND b.numer = f.numer)').fetchall()
+        for file_id, numer, dane in usuniete:
+            conn.execute('DELETE FROM faktury WHERE file_id = ? AND numer = ?', (file_id, numer))
+            conn.execute('INSERT OR REPLACE INTO usuniete (id, rewizja) VALUES (?, ?)', (f'{file_id}/{numer}', nowa))
+            agregaty.usun(json.loads(dane))
+            zmiany += 1
+
+        rewizja = nowa if zmiany else poprzednia
+        if zmiany:
+            _ustaw_meta(conn, 'rewizja', rewizja)
+            _ustaw_meta(conn, 'agregaty', agregaty.stan())
+    eksportuj(eksport, sciezka)
+    return rewizja
+
+
+def eksportuj(cel=None, sciezka=None):
+    """Widok JSON (lista faktur jak dawniej faktury_dane.json), zapisywany atomowo pod `cel` (domyślnie DANE_PLIK)."""
+    _zapisz_atomowo(cel or DANE_PLIK, [faktura for _, faktura in _faktury(_polacz(sciezka))], indent=4)
+
+
+def wszystkie(sciezka=None):
+    """(rewizja, lista faktur z polem 'id') w kolejności eksportu."""
+    conn = _polacz(sciezka)
+    with _transakcja(conn):
+        return _meta(conn, 'rewizja', 0), [dict(faktura, id=klucz) for klucz, faktura in _faktury(conn)]
+
+
+def zmiany_od(rewizja, sciezka=None):
+    """(rewizja, zmienione/dodane faktury z polem 'id', id usuniętych) od podanej rewizji."""
+    conn = _polacz(sciezka)
+    with _transakcja(conn):
+        zmienione = [dict(faktura, id=klucz) for klucz, faktura in _faktury(conn, 'WHERE rewizja > ?', (rewizja,))]
+        usuniete = [k for (k,) in conn.execute('SELECT id FROM usuniete WHERE rewizja > ?', (rewizja,))]
+        return _meta(conn, 'rewizja', 0), zmienione, usuniete
+
+
+def w_okresie(od, do, pole='data_wystawienia', sciezka=None):
+    """(rewizja, faktury z polem 'id', dla których od <= pole < do) — przez indeks daty."""
+    if pole not in ('data_wystawienia', 'data_wykonania_uslugi'):
+        raise ValueError(f'Nieznane pole daty: {pole}')
+    conn = _polacz(sciezka)
+    with _transakcja(conn):
+        faktury = _faktury(conn, f'WHERE {pole} >= ? AND {pole} < ?', (od, do))
+        return _meta(conn, 'rewizja', 0), [dict(faktura, id=klucz) for klucz, faktura in faktury]
+
+
+def statystyki(sciezka=None):
+    """(rewizja, słownik agregatów) — gotowe sumy z ostatniego zapisu."""
+    conn = _polacz(sciezka)
+    with _transakcja(conn):
+        return _meta(conn, 'rewizja', 0), Agregaty(_meta(conn, 'agregaty')).slownik()
@@ -3,17 +3,27 @@ Lokalny serwer do odpalania luxmed.py z przegladarki.
 Uruchom dwuklikiem na 'Start ZwrotApp.command' lub: python server.py
 """
 
+import email.utils
+import gzip
+import hashlib
 import http.server
 import json
 import subprocess
 import sys
 import os
-import io
 import mimetypes
-import shutil
+import queue
+import sqlite3
 import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import magazyn
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_ROOT = os.path.join(SCRIPT_DIR, 'web', 'dist')
 STATIC_PREFIX = '/ZwrotKosztowLeczenia/'
@@ -24,16 +34,25 @@ try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
     from googleapiclient.discovery import build
-    from googleapiclient.http import MediaIoBaseDownload
     from pypdf import PdfWriter, PdfReader
+    import dysk
     DRIVE_AVAILABLE = True
 except ImportError:
     DRIVE_AVAILABLE = False
 
+try:
+    import brotli  # opcjonalnie: bez niego serwujemy tylko gzip
+except ImportError:
+    brotli = None
+
+# Statyka z web/dist: cache w pamięci (unieważniany po mtime), ETag, warianty gzip/br.
+KOMPRESOWANE_TYPY = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_ROZMIAR_KOMPRESJI = 1024
+CACHE_ZASOBOW = 'public, max-age=31536000, immutable'  # assets/ Vite ma hash treści w nazwie
+CACHE_POZOSTALYCH = 'no-cache'  # index.html, faktury_dane.json: zawsze rewalidacja przez ETag
+
 PORT = 8765
 LUXMED_PROCESS = None
-REFRESH_PROCESS = None
-REFRESH_COMPLETED = None  # None | 'success' | 'failure'
 SCOPES = ['https://www.googleapis.com/auth/drive']
 FOLDER_NAZWA = 'Faktury logopeda'
 TOKEN_PLIK = 'token.json'
@@ -41,10 +60,32 @@ CREDS_PLIK = 'credentials.json'
 
 _DRIVE_SERVICE = None
 _FOLDER_ID = None
+_CLAUDE_CLIENT = None  # klient Anthropic z pulą połączeń, współdzielony przez kolejne odświeżenia
+_PULA_EKSTRAKCJI = None  # procesy odczytu PDF żyją tyle co serwer — start procesu (spawn na macOS) raz
+
+# ThreadingHTTPServer obsługuje zapytania równolegle — globalny stan tylko pod lockami.
+# Odświeżanie, scalanie i usuwanie to zadania w tle (MenedzerZadan) — po jednym każdego rodzaju naraz.
+_STAN_LOCK = threading.Lock()        # LUXMED_PROCESS
+_DRIVE_LOCK = threading.Lock()       # leniwa inicjalizacja _DRIVE_SERVICE, _FOLDER_ID, _CLAUDE_CLIENT i _PULA_EKSTRAKCJI
+HISTORIA_ZADAN = 50                  # tyle zakończonych zadań pamiętamy dla /jobs/<id>
+PREFIKS_POSTEPU = '@@postep '        # musi się zgadzać z zwrot.PREFIKS_POSTEPU
+
+# /events (Server-Sent Events): zmiany stanu zadań i faktury z każdego przetworzonego pliku.
+SSE_KEEPALIVE = 15       # sekundy ciszy, po których wysyłamy komentarz (i wykrywamy zamknięte połączenie)
+SSE_KOLEJKA_KLIENTA = 256  # klient, który tyle nie odebrał, jest odłączany — przeglądarka połączy się ponownie
+
+# Scalanie PDF-ów: pobieranie i parsowanie równolegle, dopisywanie do poprzedniego wyniku.
+WATKI_SCALANIA = 8
+SCALANIE_STAN_PLIK = os.path.join(SCRIPT_DIR, '.scalanie_stan.json')
 
 
 def get_drive_service():
     """OAuth user-flow. Cache'owany globalnie — creds odświeżają się in-place."""
+    with _DRIVE_LOCK:
+        return _drive_service()
+
+
+def _drive_service():
     global _DRIVE_SERVICE
     if _DRIVE_SERVICE is not None:
         return _DRIVE_SERVICE
@@ -67,20 +108,581 @@ def get_drive_service():
         with open(token_path, 'w') as token:
             token.write(creds.to_json())
 
-    _DRIVE_SERVICE = build('drive', 'v3', credentials=creds)
+    # Serwis współdzielony przez wątki serwera, ale każde zapytanie idzie przez połączenie swojego wątku.
+    _DRIVE_SERVICE = build('drive', 'v3', credentials=creds, requestBuilder=dysk.zapytanie_watku)
     return _DRIVE_SERVICE
 
 
 def find_folder_id(service):
     """Znajdź ID folderu 'Faktury logopeda' na GDrive. Cache'owany — folder nie zmienia ID."""
     global _FOLDER_ID
-    if _FOLDER_ID is not None:
+    with _DRIVE_LOCK:
+        if _FOLDER_ID is not None:
+            return _FOLDER_ID
+        query = f"mimeType='application/vnd.google-apps.folder' and name='{FOLDER_NAZWA}' and trashed=false"
+        results = service.files().list(q=query, fields="files(id)").execute()
+        items = results.get('files', [])
+        _FOLDER_ID = items[0]['id'] if items else None
         return _FOLDER_ID
-    query = f"mimeType='application/vnd.google-apps.folder' and name='{FOLDER_NAZWA}' and trashed=false"
-    results = service.files().list(q=query, fields="files(id)").execute()
-    items = results.get('files', [])
-    _FOLDER_ID = items[0]['id'] if items else None
-    return _FOLDER_ID
+
+
+def _zwrot():
+    """
+    zwrot.py jako moduł — importowany przy pierwszym odświeżeniu, potem z sys.modules
+    (anthropic i PyPDF2 nie spowalniają startu serwera). None, gdy brak bibliotek.
+    """
+    try:
+        import zwrot
+    except ImportError:
+        return None
+    return zwrot
+
+
+def get_claude_client(zwrot):
+    """Klient Anthropic tworzony raz — kolejne odświeżenia używają tych samych połączeń TLS."""
+    global _CLAUDE_CLIENT
+    with _DRIVE_LOCK:
+        if _CLAUDE_CLIENT is None:
+            _CLAUDE_CLIENT = zwrot.skonfiguruj_model_ai()
+        return _CLAUDE_CLIENT
+
+
+def get_pula_ekstrakcji(zwrot):
+    """Pula ekstrakcji PDF tworzona raz; jej procesy startują przy pierwszym dużym PDF-ie i zostają."""
+    global _PULA_EKSTRAKCJI
+    with _DRIVE_LOCK:
+        if _PULA_EKSTRAKCJI is None:
+            _PULA_EKSTRAKCJI = zwrot.ekstrakcja.PulaEkstrakcji(zwrot.PROCESY_EKSTRAKCJI)
+        return _PULA_EKSTRAKCJI
+
+
+class CacheStatyki:
+    """
+    Pliki z web/dist w pamięci: treść, silny ETag i skompresowane warianty liczone raz.
+    Wpis jest przeliczany, gdy zmieni się mtime albo rozmiar pliku (nowy build, nowe faktury_dane.json).
+    """
+
+    def __init__(self, katalog=STATIC_ROOT):
+        self.katalog = katalog
+        self._wpisy = {}
+        self._lock = threading.Lock()
+
+    def pobierz(self, sciezka):
+        """Wpis dla pliku: {'typ', 'etag', 'last_modified', 'warianty': {kodowanie: bajty}}. OSError, gdy brak pliku."""
+        st = os.stat(sciezka)
+        klucz = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            wpis = self._wpisy.get(sciezka)
+        if wpis is not None and wpis['klucz'] == klucz:
+            return wpis
+
+        with open(sciezka, 'rb') as f:
+            dane = f.read()
+        typ = mimetypes.guess_type(sciezka)[0] or 'application/octet-stream'
+        warianty = {'identity': dane}
+        if typ.startswith(KOMPRESOWANE_TYPY) and len(dane) >= MIN_ROZMIAR_KOMPRESJI:
+            warianty['gzip'] = gzip.compress(dane, compresslevel=9, mtime=0)
+            if brotli is not None:
+                warianty['br'] = brotli.compress(dane)
+        wpis = {
+            'klucz': klucz,
+            'typ': typ,
+            'etag': hashlib.sha256(dane).hexdigest()[:32],
+            'last_modified': email.utils.formatdate(st.st_mtime, usegmt=True),
+            'warianty': {k: v for k, v in warianty.items() if k == 'identity' or len(v) < len(dane)},
+        }
+        with self._lock:
+            self._wpisy[sciezka] = wpis
+        return wpis
+
+    def rozgrzej(self):
+        """Wczytuje i kompresuje cały build przy starcie — pierwsze wejście na UI nie czeka na gzip/br."""
+        for katalog, _, pliki in os.walk(self.katalog):
+            for nazwa in pliki:
+                try:
+                    self.pobierz(os.path.join(katalog, nazwa))
+                except OSError:
+                    pass
+
+
+STATYKA = CacheStatyki()
+
+
+def _wybierz_kodowanie(accept_encoding, dostepne):
+    """Najlepsze kodowanie z Accept-Encoding, które mamy gotowe (br > gzip > identity); q=0 wyklucza."""
+    akceptowane = set()
+    for czesc in (accept_encoding or '').split(','):
+        nazwa, *parametry = czesc.split(';')
+        q = 1.0
+        for parametr in parametry:
+            klucz, _, wartosc = parametr.strip().partition('=')
+            if klucz == 'q':
+                try:
+                    q = float(wartosc)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            akceptowane.add(nazwa.strip().lower())
+    for kodowanie in ('br', 'gzip'):
+        if kodowanie in dostepne and (kodowanie in akceptowane or '*' in akceptowane):
+            return kodowanie
+    return 'identity'
+
+
+class Zdarzenia:
+    """Rozgłaszanie zdarzeń do klientów /events — każdy klient ma własną, ograniczoną kolejkę."""
+
+    def __init__(self, rozmiar_kolejki=SSE_KOLEJKA_KLIENTA):
+        self.rozmiar_kolejki = rozmiar_kolejki
+        self._klienci = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def wiadomosc(typ, dane):
+        return f"event: {typ}\ndata: {json.dumps(dane, ensure_ascii=False)}\n\n".encode()
+
+    def subskrybuj(self):
+        kolejka = queue.Queue(maxsize=self.rozmiar_kolejki)
+        with self._lock:
+            self._klienci.add(kolejka)
+        return kolejka
+
+    def odsubskrybuj(self, kolejka):
+        with self._lock:
+            self._klienci.discard(kolejka)
+
+    def aktywny(self, kolejka):
+        with self._lock:
+            return kolejka in self._klienci
+
+    def publikuj(self, typ, dane):
+        wiadomosc = self.wiadomosc(typ, dane)
+        with self._lock:
+            for kolejka in list(self._klienci):
+                try:
+                    kolejka.put_nowait(wiadomosc)
+                except queue.Full:
+                    self._klienci.discard(kolejka)  # nie nadąża — handler zamknie połączenie
+
+
+ZDARZENIA = Zdarzenia()
+
+
+class Anulowano(Exception):
+    """Zadanie przerwane przez /jobs/<id>/cancel."""
+
+
+class Zadanie:
+    """Zadanie w tle: postęp per plik, czas każdego etapu, wynik albo błąd, anulowanie."""
+
+    def __init__(self, rodzaj):
+        self.id = uuid.uuid4().hex[:12]
+        self.rodzaj = rodzaj
+        self.stan = 'running'  # running | success | failure | cancelled
+        self.gotowe = 0
+        self.wszystkie = None
+        self.plik = None
+        self.wynik = None
+        self.blad = None
+        self.start = time.monotonic()
+        self.koniec = None
+        self.etapy = {}  # nazwa -> sekundy
+        self._etap = None  # (nazwa, start)
+        self._anulowane = threading.Event()
+        self._przy_anulowaniu = None
+        self._lock = threading.Lock()
+
+    def etap(self, nazwa):
+        """Zamyka bieżący etap (dolicza jego czas) i zaczyna następny."""
+        with self._lock:
+            self._zamknij_etap()
+            self._etap = (nazwa, time.monotonic())
+        self._powiadom()
+
+    def _powiadom(self):
+        ZDARZENIA.publikuj('job', self.jako_slownik())
+
+    def _zamknij_etap(self):
+        if self._etap:
+            nazwa, start = self._etap
+            self.etapy[nazwa] = round(self.etapy.get(nazwa, 0) + time.monotonic() - start, 3)
+            self._etap = None
+
+    def postep(self, gotowe, wszystkie=None, plik=None):
+        with self._lock:
+            self.gotowe, self.wszystkie, self.plik = gotowe, wszystkie, plik
+        self._powiadom()
+
+    def sprawdz(self):
+        """Punkt anulowania — wołany między plikami."""
+        if self._anulowane.is_set():
+            raise Anulowano()
+
+    def przy_anulowaniu(self, funkcja):
+        """`funkcja` zostanie wywołana przy anulowaniu (np. terminate() podprocesu)."""
+        self._przy_anulowaniu = funkcja
+        if self._anulowane.is_set():
+            funkcja()
+
+    def anuluj(self):
+        if self.stan != 'running':
+            return False
+        self._anulowane.set()
+        if self._przy_anulowaniu is not None:
+            self._przy_anulowaniu()
+        return True
+
+    def zakoncz(self, stan, wynik=None, blad=None):
+        with self._lock:
+            self._zamknij_etap()
+            self.stan, self.wynik, self.blad = stan, wynik, blad
+            self.koniec = time.monotonic()
+        self._powiadom()
+
+    def jako_slownik(self):
+        with self._lock:
+            etapy = dict(self.etapy)
+            if self._etap:
+                nazwa, start = self._etap
+                etapy[nazwa] = round(etapy.get(nazwa, 0) + time.monotonic() - start, 3)
+            return {
+                'id': self.id,
+                'kind': self.rodzaj,
+                'state': self.stan,
+                'stage': self._etap[0] if self._etap else None,
+                'done': self.gotowe,
+                'total': self.wszystkie,
+                'file': self.plik,
+                'stages': etapy,
+                'elapsed': round((self.koniec or time.monotonic()) - self.start, 3),
+                'result': self.wynik,
+                'error': self.blad,
+            }
+
+
+class MenedzerZadan:
+    """Uruchamia zadania w wątkach; drugie zadanie tego samego rodzaju dostaje już trwające."""
+
+    def __init__(self, historia=HISTORIA_ZADAN):
+        self.historia = historia
+        self._zadania = OrderedDict()
+        self._lock = threading.Lock()
+
+    def uruchom(self, rodzaj, funkcja):
+        """Startuje `funkcja(zadanie)` w tle. Zwraca (zadanie, czy_nowe)."""
+        with self._lock:
+            trwajace = self._aktywne(rodzaj)
+            if trwajace is not None:
+                return trwajace, False
+            zadanie = Zadanie(rodzaj)
+            self._zadania[zadanie.id] = zadanie
+            while len(self._zadania) > self.historia:
+                najstarsze = next(iter(self._zadania))
+                if self._zadania[najstarsze].stan == 'running':
+                    break
+                del self._zadania[najstarsze]
+        zadanie._powiadom()
+        threading.Thread(target=self._wykonaj, args=(zadanie, funkcja), daemon=True).start()
+        return zadanie, True
+
+    def _wykonaj(self, zadanie, funkcja):
+        try:
+            wynik = funkcja(zadanie)
+            zadanie.sprawdz()
+        except Anulowano:
+            zadanie.zakoncz('cancelled')
+        except Exception as e:
+            zadanie.zakoncz('failure', blad=str(e))
+        else:
+            zadanie.zakoncz('success', wynik=wynik)
+        print(f"[ZwrotApp] zadanie {zadanie.rodzaj} {zadanie.id}: {zadanie.stan} "
+              f"({zadanie.koniec - zadanie.start:.1f}s, etapy: {zadanie.etapy})")
+
+    def _aktywne(self, rodzaj):
+        for zadanie in self._zadania.values():
+            if zadanie.rodzaj == rodzaj and zadanie.stan == 'running':
+                return zadanie
+        return None
+
+    def pobierz(self, id_zadania):
+        with self._lock:
+            return self._zadania.get(id_zadania)
+
+    def migawka(self):
+        """Trwające zadania i ostatnie zadanie każdego rodzaju — stan startowy dla nowego klienta /events."""
+        with self._lock:
+            wybrane = {}
+            for zadanie in self._zadania.values():
+                if zadanie.stan == 'running' or zadanie.rodzaj not in wybrane or wybrane[zadanie.rodzaj].stan != 'running':
+                    wybrane[zadanie.rodzaj] = zadanie
+            return list(wybrane.values())
+
+    def ostatnie(self, rodzaj):
+        with self._lock:
+            for zadanie in reversed(self._zadania.values()):
+                if zadanie.rodzaj == rodzaj:
+                    return zadanie
+        return None
+
+
+ZADANIA = MenedzerZadan()
+
+
+def _wyczysc_dane_faktur():
+    """Pusty zbiór faktur — przez magazyn, żeby klienci /invoices?since= dostali nagrobki."""
+    try:
+        magazyn.zapisz([])
+        magazyn.eksportuj(os.path.join(STATIC_ROOT, 'faktury_dane.json'))
+    except (OSError, sqlite3.Error):
+        pass
+
+
+def _zastosuj_zdarzenie(zadanie, zdarzenie):
+    """Zdarzenie z zwrot.raportuj() -> etap albo postęp zadania; faktury pliku idą od razu do /events."""
+    if 'etap' in zdarzenie:
+        zadanie.etap(zdarzenie['etap'])
+        return
+    if zdarzenie.get('faktury'):
+        ZDARZENIA.publikuj('invoices', {'job': zadanie.id, 'file': zdarzenie.get('plik'),
+                                        'invoices': zdarzenie['faktury']})
+    zadanie.postep(zdarzenie.get('gotowe', 0), zdarzenie.get('wszystkie'), zdarzenie.get('plik'))
+
+
+def _odswiez(zadanie):
+    """
+    Zadanie 'refresh': przetwarzaj_faktury_z_dysku() w procesie serwera, z już zbudowanym
+    serwisem Drive, znanym ID folderu i ciepłym klientem Claude. Bez bibliotek AI/PDF
+    w interpreterze serwera — zwrot.py --sync w podprocesie (venv).
+    """
+    zadanie.etap('autoryzacja')
+    # Pre-flight: zapewnij świeży token.json (browser flow OAuth w podprocesie wisiałby w ciszy).
+    # Pusty folder wychodzi z samego przebiegu (manifest + delta) — bez osobnego listingu.
+    if not DRIVE_AVAILABLE:
+        return _odswiez_w_podprocesie(zadanie)
+    try:
+        service = get_drive_service()
+        folder_id = find_folder_id(service)
+    except Exception as e:
+        raise RuntimeError(f'Autoryzacja Google: {e}') from e
+    if not folder_id:
+        raise RuntimeError(f"Nie znaleziono folderu '{FOLDER_NAZWA}'")
+
+    zwrot = _zwrot()
+    if zwrot is None:
+        return _odswiez_w_podprocesie(zadanie)
+    client = get_claude_client(zwrot)
+    if client is None:
+        raise RuntimeError(f"Nie udało się skonfigurować klienta Claude (sprawdź {zwrot.CONFIG_PLIK})")
+
+    def _raport(zdarzenie):
+        zadanie.sprawdz()  # Anulowano przerywa przebieg w wątku głównym potoku
+        _zastosuj_zdarzenie(zadanie, zdarzenie)
+
+    # MenedzerZadan pilnuje jednego odświeżania naraz, więc globalny hook nie ma konkurencji.
+    zwrot.RAPORT_POSTEPU = _raport
+    try:
+        wynik = zwrot.przetwarzaj_faktury_z_dysku(service, client, tryb_sync=True, folder_id=folder_id,
+                                                  pula=get_pula_ekstrakcji(zwrot))
+    finally:
+        zwrot.RAPORT_POSTEPU = None
+    zadanie.sprawdz()
+    if wynik is None:
+        # None z zwrot.py: błąd API Dysku albo żadnej odczytanej faktury — szczegóły już w logu.
+        raise RuntimeError('Przetwarzanie nie zapisało danych (błąd Dysku albo brak odczytanych faktur)')
+    odpowiedz = _publikuj_dane(zadanie)
+    if not magazyn.statystyki()[1]['invoiceCount']:
+        odpowiedz['message'] = 'Brak faktur na Drive'
+    return odpowiedz
+
+
+def _publikuj_dane(zadanie):
+    zadanie.etap('publikacja')
+    if os.path.isdir(STATIC_ROOT):
+        magazyn.eksportuj(os.path.join(STATIC_ROOT, 'faktury_dane.json'))
+    return {'message': 'Dane zaktualizowane', 'files': zadanie.gotowe}
+
+
+def _odswiez_w_podprocesie(zadanie):
+    """zwrot.py --sync --postep w podprocesie; postęp czytany ze stdout."""
+    zadanie.etap('uruchamianie')
+    venv_python = os.path.join(SCRIPT_DIR, 'venv', 'bin', 'python3')
+    python = venv_python if os.path.exists(venv_python) else sys.executable
+    proces = subprocess.Popen(
+        [python, os.path.join(SCRIPT_DIR, 'zwrot.py'), '--sync', '--postep'],
+        cwd=SCRIPT_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+    )
+    zadanie.przy_anulowaniu(proces.terminate)
+    with proces.stdout:
+        for linia in proces.stdout:
+            if not linia.startswith(PREFIKS_POSTEPU):
+                continue
+            try:
+                zdarzenie = json.loads(linia[len(PREFIKS_POSTEPU):])
+            except ValueError:
+                continue
+            _zastosuj_zdarzenie(zadanie, zdarzenie)
+    rc = proces.wait()
+    zadanie.sprawdz()
+    if rc != 0:
+        raise RuntimeError(f'zwrot.py zakończył się kodem {rc}')
+    return _publikuj_dane(zadanie)
+
+
+def _scal(zadanie):
+    """Zadanie 'merge': lista plików z Dysku i scal_pdfy() na Pulpit."""
+    zadanie.etap('listowanie')
+    service = get_drive_service()
+    folder_id = find_folder_id(service)
+    if not folder_id:
+        raise RuntimeError(f"Nie znaleziono folderu '{FOLDER_NAZWA}'")
+    pliki = sorted(dysk.listuj_pliki(service, dysk.zapytanie_pdf(folder_id), pola='id, name, md5Checksum'),
+                   key=lambda f: f['name'])
+    if not pliki:
+        raise RuntimeError('Brak plików PDF w folderze')
+
+    output_path = Path.home() / 'Desktop' / 'faktury_logopeda.pdf'
+    wynik = scal_pdfy(service, pliki, output_path, zadanie=zadanie)
+    return {'path': str(output_path), 'files': len(pliki), **wynik}
+
+
+def _usun_z_dysku(zadanie):
+    """Zadanie 'delete': przenosi wszystkie pliki folderu do kosza i czyści dane faktur."""
+    zadanie.etap('listowanie')
+    service = get_drive_service()
+    folder_id = find_folder_id(service)
+    if not folder_id:
+        raise RuntimeError(f"Nie znaleziono folderu '{FOLDER_NAZWA}'")
+
+    query = f"'{folder_id}' in parents and trashed=false"
+    pliki = list(dysk.listuj_pliki(service, query, pola='id, name'))
+
+    zadanie.etap('usuwanie')
+    deleted = 0
+    failed = []
+    for i, plik in enumerate(pliki, start=1):
+        zadanie.sprawdz()
+        try:
+            service.files().update(fileId=plik['id'], body={'trashed': True}).execute()
+            deleted += 1
+        except Exception:
+            failed.append(plik['name'])
+        zadanie.postep(i, len(pliki), plik['name'])
+
+    if failed:
+        raise RuntimeError(f'Brak uprawnień do usunięcia {len(failed)} z {len(pliki)} plików '
+                           f'— usuń ręcznie w Google Drive (ikona ↗)')
+
+    _wyczysc_dane_faktur()
+    return {'deleted': deleted}
+
+
+def _wczytaj_stan_scalania(output_path):
+    """Stan poprzedniego scalania — ważny tylko, jeśli plik wynikowy nie zmienił się od tamtej pory."""
+    try:
+        with open(SCALANIE_STAN_PLIK, 'r', encoding='utf-8') as f:
+            stan = json.load(f)
+        st = os.stat(output_path)
+    except (OSError, ValueError):
+        return None
+    if stan.get('path') != str(output_path) or stan.get('size') != st.st_size or stan.get('mtime_ns') != st.st_mtime_ns:
+        return None
+    return stan
+
+
+def _zapisz_stan_scalania(output_path, zrodla, rozmiar_wejscia):
+    st = os.stat(output_path)
+    stan = {'path': str(output_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'zrodla': zrodla, 'rozmiar_wejscia': rozmiar_wejscia}
+    tmp = SCALANIE_STAN_PLIK + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(stan, f)
+    os.replace(tmp, SCALANIE_STAN_PLIK)
+
+
+def _zamknij_wczytany(wczytanie):
+    """Callback wczytania z scal_pdfy, którego wyniku nikt nie odebrał — zamyka uchwyt pliku."""
+    if not wczytanie.cancelled() and wczytanie.exception() is None:
+        wczytanie.result()[0].close()
+
+
+def scal_pdfy(service, pliki, output_path, zadanie=None):
+    """
+    Scala `pliki` (już posortowane) do `output_path`. Pobieranie i parsowanie idą w puli wątków,
+    strony dokładane są w kolejności listy. Jeśli poprzedni wynik zawiera dokładnie początek
+    obecnej listy (te same id i md5), jest klonowany i dopisywane są tylko nowe pliki.
+    Faktury od jednego wystawcy osadzają te same fonty i logo — identyczne obiekty są
+    scalane w jeden, a strumienie treści kompresowane (limit rozmiaru załącznika w LuxMed).
+    Z `zadanie` raportuje postęp per plik, czas etapów i pozwala przerwać scalanie.
+    Zwraca słownik: strony, dopisane pliki, rozmiar źródeł i wyniku w bajtach.
+    """
+    zrodla = [[p['id'], p.get('md5Checksum')] for p in pliki]
+    stan = _wczytaj_stan_scalania(output_path)
+    poprzednie = stan['zrodla'] if stan else []
+    if poprzednie and all(md5 for _, md5 in poprzednie) and zrodla[:len(poprzednie)] == poprzednie:
+        rozmiar_wejscia = stan.get('rozmiar_wejscia', 0)
+        if len(poprzednie) == len(zrodla):
+            return {'pages': len(PdfReader(output_path).pages), 'appended': 0,
+                    'input_bytes': rozmiar_wejscia, 'output_bytes': stan['size']}
+        writer = PdfWriter(clone_from=str(output_path))
+        nowe = pliki[len(poprzednie):]
+    else:
+        writer = PdfWriter()
+        nowe = pliki
+        rozmiar_wejscia = 0
+
+    def _wczytaj(plik):
+        fh = dysk.MAGAZYN.otworz(service, plik, http=dysk.http_watku(service))
+        rozmiar = fh.seek(0, os.SEEK_END)
+        fh.seek(0)
+        reader = PdfReader(fh)
+        len(reader.pages)  # parsowanie drzewa stron w wątku roboczym, równolegle z pobieraniem kolejnych
+        return fh, reader, rozmiar
+
+    # PdfReader czyta obiekty leniwie z uchwytu — pliki zamykamy dopiero po writer.write().
+    uchwyty = []
+    tmp = f"{output_path}.part"
+    if zadanie:
+        zadanie.etap('pobieranie')
+    ex = ThreadPoolExecutor(max_workers=WATKI_SCALANIA)
+    # Wyniki odbieramy w kolejności listy, a pozostałe pobrania trwają w tle.
+    wczytania = [ex.submit(_wczytaj, plik) for plik in nowe]
+    try:
+        for i, wczytanie in enumerate(wczytania, start=1):
+            fh, reader, rozmiar = wczytanie.result()
+            uchwyty.append(fh)
+            if zadanie:
+                zadanie.postep(i, len(nowe), nowe[i - 1]['name'])
+                zadanie.sprawdz()
+            rozmiar_wejscia += rozmiar
+            for page in reader.pages:
+                # Kompresja na stronie writera — dopiero po add_page() jest ona częścią wyniku.
+                writer.add_page(page).compress_content_streams()
+        if zadanie:
+            zadanie.etap('zapis')
+        writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+        with open(tmp, 'wb') as out:
+            writer.write(out)
+        os.replace(tmp, output_path)
+    finally:
+        # Przy błędzie albo anulowaniu nie czekamy na resztę pobrań: oczekujące odpadają, a uchwyty
+        # z wczytań nieodebranych (gotowych albo jeszcze trwających) zamyka callback.
+        ex.shutdown(wait=False, cancel_futures=True)
+        for wczytanie in wczytania[len(uchwyty):]:
+            wczytanie.add_done_callback(_zamknij_wczytany)
+        for fh in uchwyty:
+            fh.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    _zapisz_stan_scalania(output_path, zrodla, rozmiar_wejscia)
+    return {'pages': len(writer.pages), 'appended': len(nowe),
+            'input_bytes': rozmiar_wejscia, 'output_bytes': os.path.getsize(output_path)}
+
 
 class Handler(http.server.BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -105,6 +707,14 @@ class Handler(http.server.BaseHTTPRequestHandler):
             self._delete_desktop_folder()
         elif self.path == '/check-desktop-folder':
             self._check_desktop_folder()
+        elif self.path.startswith('/jobs/'):
+            self._job(self.path)
+        elif self.path == '/events':
+            self._events()
+        elif self.path == '/invoices' or self.path.startswith('/invoices?'):
+            self._invoices(urllib.parse.urlsplit(self.path).query)
+        elif self.path == '/stats':
+            self._stats()
         elif self.path == '/' or self.path == STATIC_PREFIX.rstrip('/') or self.path == STATIC_PREFIX:
             self._serve_static('index.html')
         elif self.path.startswith(STATIC_PREFIX):
@@ -127,19 +737,35 @@ class Handler(http.server.BaseHTTPRequestHandler):
             self._cors()
             self.end_headers()
             return
-        ctype, _ = mimetypes.guess_type(full_path)
-        ctype = ctype or 'application/octet-stream'
         try:
-            with open(full_path, 'rb') as f:
-                data = f.read()
+            wpis = STATYKA.pobierz(full_path)
         except OSError:
             self.send_response(500)
             self._cors()
             self.end_headers()
             return
-        self.send_response(200)
+
+        kodowanie = _wybierz_kodowanie(self.headers.get('Accept-Encoding'), wpis['warianty'])
+        # ETag per reprezentacja — skompresowany wariant to inne bajty niż oryginał.
+        etag = f'"{wpis["etag"]}"' if kodowanie == 'identity' else f'"{wpis["etag"]}-{kodowanie}"'
+        kompresowalny = len(wpis['warianty']) > 1
+
+        znane = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        niezmieniony = etag in znane or f'W/{etag}' in znane or '*' in znane
+        self.send_response(304 if niezmieniony else 200)
         self._cors()
-        self.send_header('Content-Type', ctype)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', wpis['last_modified'])
+        self.send_header('Cache-Control', CACHE_ZASOBOW if rel_path.startswith('assets/') else CACHE_POZOSTALYCH)
+        if kompresowalny:
+            self.send_header('Vary', 'Accept-Encoding')
+        if niezmieniony:
+            self.end_headers()
+            return
+        data = wpis['warianty'][kodowanie]
+        self.send_header('Content-Type', wpis['typ'])
+        if kodowanie != 'identity':
+            self.send_header('Content-Encoding', kodowanie)
         self.send_header('Content-Length', str(len(data)))
         self.end_headers()
         self.wfile.write(data)
@@ -149,25 +775,79 @@ class Handler(http.server.BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
 
-    def _json(self, code, data):
+    def _json(self, code, data, naglowki=None):
         self.send_response(code)
         self._cors()
         self.send_header('Content-Type', 'application/json')
+        for nazwa, wartosc in (naglowki or {}).items():
+            self.send_header(nazwa, wartosc)
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
 
+    def _invoices(self, query):
+        """
+        GET /invoices — wszystkie faktury z rewizją; ETag to rewizja, więc If-None-Match daje 304.
+        GET /invoices?since=N — tylko dodane/zmienione i id usuniętych od rewizji N.
+        GET /invoices?from=RRRR-MM-DD&to=RRRR-MM-DD — faktury wystawione w [from, to), np. kwartał.
+        """
+        parametry = urllib.parse.parse_qs(query)
+        if 'from' in parametry or 'to' in parametry:
+            rewizja, faktury = magazyn.w_okresie(parametry.get('from', [''])[0], parametry.get('to', ['9999'])[0])
+            self._json(200, {'revision': rewizja, 'invoices': faktury})
+            return
+        since = parametry.get('since', [None])[0]
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                self._json(400, {'status': 'error', 'message': 'since musi być liczbą'})
+                return
+            rewizja, zmienione, usuniete = magazyn.zmiany_od(since)
+            # Rewizja klienta z przyszłości = stan magazynu odtworzony od zera — wtedy pełna lista niżej.
+            if since <= rewizja:
+                self._json(200, {'revision': rewizja, 'changed': zmienione, 'removed': usuniete})
+                return
+
+        rewizja, faktury = magazyn.wszystkie()
+        if self._niezmieniona_rewizja(rewizja):
+            return
+        self._json(200, {'revision': rewizja, 'invoices': faktury},
+                   naglowki={'ETag': f'"r{rewizja}"', 'Cache-Control': 'no-cache'})
+
+    def _stats(self):
+        """GET /stats — agregaty utrzymywane przez magazyn przy zapisie (agregaty.py), bez liczenia per zapytanie."""
+        rewizja, statystyki = magazyn.statystyki()
+        if self._niezmieniona_rewizja(rewizja, prefiks='s'):
+            return
+        self._json(200, dict(statystyki, revision=rewizja),
+                   naglowki={'ETag': f'"s{rewizja}"', 'Cache-Control': 'no-cache'})
+
+    def _niezmieniona_rewizja(self, rewizja, prefiks='r'):
+        """304 z ETagiem rewizji, jeśli klient ją już ma; inaczej False i odpowiedź zostaje wywołującemu."""
+        etag = f'"{prefiks}{rewizja}"'
+        if etag not in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            return False
+        self.send_response(304)
+        self._cors()
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
     def _launch_luxmed(self):
+        with _STAN_LOCK:
+            kod, odpowiedz = self._uruchom_luxmed()
+        self._json(kod, odpowiedz)
+
+    def _uruchom_luxmed(self):
         global LUXMED_PROCESS
         if LUXMED_PROCESS and LUXMED_PROCESS.poll() is None:
-            self._json(200, {'status': 'already_running', 'message': 'LuxMed juz dziala'})
-            return
+            return 200, {'status': 'already_running', 'message': 'LuxMed juz dziala'}
 
         script_dir = os.path.dirname(os.path.abspath(__file__))
         luxmed_path = os.path.join(script_dir, 'luxmed.py')
 
         if not os.path.exists(luxmed_path):
-            self._json(404, {'status': 'error', 'message': 'Nie znaleziono luxmed.py'})
-            return
+            return 404, {'status': 'error', 'message': 'Nie znaleziono luxmed.py'}
 
         # Uzyj Pythona z venva projektu (ma selenium)
         venv_python = os.path.join(script_dir, 'venv', 'bin', 'python3')
@@ -177,164 +857,80 @@ class Handler(http.server.BaseHTTPRequestHandler):
             [python, luxmed_path],
             cwd=script_dir
         )
-        self._json(200, {'status': 'started', 'message': 'LuxMed uruchomiony'})
+        return 200, {'status': 'started', 'message': 'LuxMed uruchomiony'}
 
     def _trigger_refresh(self):
-        global REFRESH_PROCESS, REFRESH_COMPLETED
-        if REFRESH_PROCESS and REFRESH_PROCESS.poll() is None:
-            self._json(200, {'status': 'triggered', 'message': 'Odświeżanie już trwa'})
-            return
-        # Pre-flight: zapewnij świeży token.json zanim spawn'ujemy subprocess
-        # (zwrot.py subprocess ma stdout/stderr na DEVNULL — browser flow wisiałby w ciszy).
-        # Przy okazji: jeśli folder Drive jest pusty — short-circuit bez subprocess.
-        if DRIVE_AVAILABLE:
-            try:
-                service = get_drive_service()
-                folder_id = find_folder_id(service)
-                if folder_id:
-                    query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
-                    results = service.files().list(q=query, pageSize=1, fields="files(id)").execute()
-                    if not results.get('files'):
-                        for path in (os.path.join(SCRIPT_DIR, 'faktury_dane.json'),
-                                     os.path.join(STATIC_ROOT, 'faktury_dane.json')):
-                            try:
-                                with open(path, 'w', encoding='utf-8') as f:
-                                    f.write('[]')
-                            except OSError:
-                                pass
-                        REFRESH_COMPLETED = 'success'
-                        self._json(200, {'status': 'triggered', 'message': 'Brak faktur na Drive'})
-                        return
-            except Exception as e:
-                self._json(500, {'status': 'error', 'message': f'Autoryzacja Google: {e}'})
-                return
-        venv_python = os.path.join(SCRIPT_DIR, 'venv', 'bin', 'python3')
-        python = venv_python if os.path.exists(venv_python) else sys.executable
-        REFRESH_COMPLETED = None
-        REFRESH_PROCESS = subprocess.Popen(
-            [python, os.path.join(SCRIPT_DIR, 'zwrot.py')],
-            cwd=SCRIPT_DIR,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        self._json(200, {'status': 'triggered', 'message': 'Przetwarzanie faktur uruchomione'})
+        zadanie, nowe = ZADANIA.uruchom('refresh', _odswiez)
+        message = 'Przetwarzanie faktur uruchomione' if nowe else 'Odświeżanie już trwa'
+        self._json(200, {'status': 'triggered', 'message': message, 'job': zadanie.id})
 
     def _workflow_status(self):
-        global REFRESH_PROCESS, REFRESH_COMPLETED
-        if REFRESH_PROCESS is None and REFRESH_COMPLETED is None:
+        zadanie = ZADANIA.ostatnie('refresh')
+        if zadanie is None:
             self._json(200, {'status': 'unknown', 'conclusion': ''})
             return
-        if REFRESH_PROCESS is not None:
-            rc = REFRESH_PROCESS.poll()
-            if rc is None:
-                self._json(200, {'status': 'in_progress', 'conclusion': ''})
-                return
-            if rc == 0:
-                src = os.path.join(SCRIPT_DIR, 'faktury_dane.json')
-                dst = os.path.join(STATIC_ROOT, 'faktury_dane.json')
-                try:
-                    if os.path.exists(src):
-                        shutil.copy(src, dst)
-                    REFRESH_COMPLETED = 'success'
-                except OSError:
-                    REFRESH_COMPLETED = 'failure'
-            else:
-                REFRESH_COMPLETED = 'failure'
-            REFRESH_PROCESS = None
-        self._json(200, {'status': 'completed', 'conclusion': REFRESH_COMPLETED or ''})
+        stan = zadanie.jako_slownik()
+        if stan['state'] == 'running':
+            self._json(200, {'status': 'in_progress', 'conclusion': '', 'job': stan})
+            return
+        self._json(200, {'status': 'completed', 'conclusion': stan['state'], 'job': stan})
 
     def _status(self):
-        global LUXMED_PROCESS
-        running = LUXMED_PROCESS is not None and LUXMED_PROCESS.poll() is None
+        with _STAN_LOCK:
+            running = LUXMED_PROCESS is not None and LUXMED_PROCESS.poll() is None
         self._json(200, {'luxmed_running': running, 'server': 'ok'})
 
     def _merge_pdfs(self):
         if not DRIVE_AVAILABLE:
             self._json(500, {'status': 'error', 'message': 'Brak bibliotek (google-api, pypdf)'})
             return
-        try:
-            service = get_drive_service()
-            folder_id = find_folder_id(service)
-            if not folder_id:
-                self._json(404, {'status': 'error', 'message': f"Nie znaleziono folderu '{FOLDER_NAZWA}'"})
-                return
-
-            query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
-            results = service.files().list(q=query, pageSize=100, fields="files(id, name)").execute()
-            pliki = results.get('files', [])
-            if not pliki:
-                self._json(404, {'status': 'error', 'message': 'Brak plików PDF w folderze'})
-                return
-
-            pliki.sort(key=lambda f: f['name'])
-            writer = PdfWriter()
-
-            for plik in pliki:
-                request = service.files().get_media(fileId=plik['id'])
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
-                reader = PdfReader(io.BytesIO(fh.getvalue()))
-                for page in reader.pages:
-                    writer.add_page(page)
-
-            output_path = Path.home() / 'Desktop' / 'faktury_logopeda.pdf'
-            with open(output_path, 'wb') as out:
-                writer.write(out)
-
-            self._json(200, {
-                'status': 'ok',
-                'path': str(output_path),
-                'pages': len(writer.pages),
-                'files': len(pliki)
-            })
-        except Exception as e:
-            self._json(500, {'status': 'error', 'message': str(e)})
+        zadanie, _ = ZADANIA.uruchom('merge', _scal)
+        self._json(202, {'status': 'started', 'job': zadanie.id})
 
     def _delete_drive_files(self):
         if not DRIVE_AVAILABLE:
             self._json(500, {'status': 'error', 'message': 'Brak bibliotek (google-api)'})
             return
-        try:
-            service = get_drive_service()
-            folder_id = find_folder_id(service)
-            if not folder_id:
-                self._json(404, {'status': 'error', 'message': f"Nie znaleziono folderu '{FOLDER_NAZWA}'"})
-                return
-
-            query = f"'{folder_id}' in parents and trashed=false"
-            results = service.files().list(q=query, pageSize=100, fields="files(id, name)").execute()
-            pliki = results.get('files', [])
-
-            deleted = 0
-            failed = []
-            for plik in pliki:
-                try:
-                    service.files().update(fileId=plik['id'], body={'trashed': True}).execute()
-                    deleted += 1
-                except Exception:
-                    failed.append(plik['name'])
-
-            if failed:
-                self._json(500, {
-                    'status': 'error',
-                    'message': f'Brak uprawnień do usunięcia {len(failed)} z {len(pliki)} plików — usuń ręcznie w Google Drive (ikona ↗)'
-                })
-                return
+        zadanie, _ = ZADANIA.uruchom('delete', _usun_z_dysku)
+        self._json(202, {'status': 'started', 'job': zadanie.id})
 
-            for path in (os.path.join(SCRIPT_DIR, 'faktury_dane.json'),
-                         os.path.join(STATIC_ROOT, 'faktury_dane.json')):
+    def _events(self):
+        """Strumień SSE: najpierw bieżący stan zadań, potem każda zmiana na żywo."""
+        kolejka = ZDARZENIA.subskrybuj()
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self._cors()
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            for zadanie in ZADANIA.migawka():
+                self.wfile.write(Zdarzenia.wiadomosc('job', zadanie.jako_slownik()))
+            self.wfile.flush()
+            while True:
                 try:
-                    with open(path, 'w', encoding='utf-8') as f:
-                        f.write('[]')
-                except OSError:
-                    pass
-
-            self._json(200, {'status': 'ok', 'deleted': len(pliki)})
-        except Exception as e:
-            self._json(500, {'status': 'error', 'message': str(e)})
+                    wiadomosc = kolejka.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    wiadomosc = b': keepalive\n\n'  # przy zamkniętym połączeniu zapis rzuci wyjątek
+                self.wfile.write(wiadomosc)
+                self.wfile.flush()
+                if kolejka.empty() and not ZDARZENIA.aktywny(kolejka):
+                    break  # odłączony za wolne odbieranie — EventSource połączy się ponownie i dostanie migawkę
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            ZDARZENIA.odsubskrybuj(kolejka)
+
+    def _job(self, path):
+        """GET /jobs/<id> — stan zadania; GET /jobs/<id>/cancel — anulowanie."""
+        czesci = path.strip('/').split('/')
+        zadanie = ZADANIA.pobierz(czesci[1]) if len(czesci) > 1 else None
+        if zadanie is None or len(czesci) > 3 or (len(czesci) == 3 and czesci[2] != 'cancel'):
+            self._json(404, {'status': 'error', 'message': 'Nie ma takiego zadania'})
+            return
+        if len(czesci) == 3:
+            zadanie.anuluj()
+        self._json(200, zadanie.jako_slownik())
 
     def _delete_desktop_folder(self):
         try:
@@ -366,9 +962,13 @@ if __name__ == '__main__':
     print(f"ZwrotApp serwer na http://localhost:{PORT}")
     print("Nie zamykaj tego okna. Mozesz je zminimalizowac.")
     print()
-    server = http.server.HTTPServer(('127.0.0.1', PORT), Handler)
+    # Wątek na zapytanie: długie /merge-pdfs czy pre-flight Drive nie blokują /status i statyki.
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', PORT), Handler)
+    threading.Thread(target=STATYKA.rozgrzej, daemon=True).start()
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\nZatrzymano serwer.")
         server.server_close()
+        if _PULA_EKSTRAKCJI is not None:
+            _PULA_EKSTRAKCJI.zamknij()
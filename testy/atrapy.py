@@ -0,0 +1,233 @@
+"""
+Atrapy usług zewnętrznych do testów offline: Dysk Google (files + Changes API) z dziennikiem
+zmian, pobieranie treści bez HTTP, Claude (messages.create i Message Batches API)
+i syntetyczne PDF-y z bench/pdf_ekstrakcja.py.
+"""
+
+import copy
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+from pdf_ekstrakcja import syntetyczny_pdf  # noqa: E402,F401
+
+TYP_PDF = 'application/pdf'
+TYP_FOLDERU = 'application/vnd.google-apps.folder'
+
+
+class _Wywolanie:
+    """Odpowiednik HttpRequest: wynik dopiero z execute()."""
+
+    def __init__(self, wynik):
+        self._wynik = wynik
+
+    def execute(self):
+        return copy.deepcopy(self._wynik)
+
+
+class _Pliki:
+    def __init__(self, dysk):
+        self._dysk = dysk
+
+    def list(self, q, fields=None, pageSize=100, pageToken=None, **_):
+        pageSize = min(pageSize, self._dysk.maks_strona or pageSize)
+        nazwa = re.search(r"name='([^']*)'", q)
+        rodzic = re.search(r"'([^']+)' in parents", q)
+        pliki = [p for p in self._dysk.pliki.values() if not p['trashed']]
+        if TYP_FOLDERU in q:
+            pliki = [p for p in pliki if p['mimeType'] == TYP_FOLDERU and (not nazwa or p['name'] == nazwa.group(1))]
+        else:
+            pliki = [p for p in pliki if p['mimeType'] == TYP_PDF and (not rodzic or rodzic.group(1) in p['parents'])]
+        self._dysk.listowania += 1
+        start = int(pageToken or 0)
+        odp = {'files': [self._dysk.metadane(p['id']) for p in pliki[start:start + pageSize]]}
+        if start + pageSize < len(pliki):
+            odp['nextPageToken'] = str(start + pageSize)
+        return _Wywolanie(odp)
+
+    def get_media(self, fileId):
+        return types.SimpleNamespace(fileId=fileId, http=None, tresc=self._dysk.tresci[fileId])
+
+
+class _Zmiany:
+    def __init__(self, dysk):
+        self._dysk = dysk
+
+    def getStartPageToken(self):
+        return _Wywolanie({'startPageToken': str(len(self._dysk.dziennik))})
+
+    def list(self, pageToken, pageSize=100, **_):
+        pageSize = min(pageSize, self._dysk.maks_strona or pageSize)
+        start = int(pageToken)
+        odp = {'changes': self._dysk.dziennik[start:start + pageSize]}
+        if start + pageSize < len(self._dysk.dziennik):
+            odp['nextPageToken'] = str(start + pageSize)
+        else:
+            odp['newStartPageToken'] = str(len(self._dysk.dziennik))
+        return _Wywolanie(odp)
+
+
+class AtrapaDysku:
+    """
+    Serwis Drive w pamięci: folder z PDF-ami i dziennik zmian (Changes API). Każda metoda
+    zmieniająca plik dopisuje wpis do dziennika tak, jak robi to Dysk — token to pozycja w dzienniku.
+    """
+
+    def __init__(self, folder='Faktury logopeda', folder_id='F'):
+        self.folder_id = folder_id
+        self.pliki = {}
+        self.tresci = {}
+        self.dziennik = []
+        self.listowania = 0
+        self.maks_strona = None  # mniejsze strony niż pageSize — sprawdza stronicowanie wywołującego
+        self._http = types.SimpleNamespace(credentials=None)
+        self.pliki[folder_id] = {'id': folder_id, 'name': folder, 'mimeType': TYP_FOLDERU,
+                                 'parents': [], 'trashed': False}
+
+    def files(self):
+        return _Pliki(self)
+
+    def changes(self):
+        return _Zmiany(self)
+
+    def metadane(self, file_id):
+        plik = self.pliki[file_id]
+        return {k: v for k, v in plik.items() if v is not None}
+
+    def _zapisz_zmiane(self, file_id):
+        self.dziennik.append({'fileId': file_id, 'removed': False, 'file': self.metadane(file_id)})
+
+    def dodaj(self, file_id, tresc, nazwa=None, md5=True):
+        """Nowy PDF w folderze; md5=False — plik bez md5Checksum (np. skrót Dysku)."""
+        self.tresci[file_id] = tresc
+        self.pliki[file_id] = {'id': file_id, 'name': nazwa or f'{file_id}.pdf', 'mimeType': TYP_PDF,
+                               'parents': [self.folder_id], 'trashed': False, 'size': str(len(tresc)),
+                               'md5Checksum': f'md5-{file_id}-1' if md5 else None, 'modifiedTime': '1'}
+        self._zapisz_zmiane(file_id)
+
+    def zmien_tresc(self, file_id, tresc):
+        plik = self.pliki[file_id]
+        wersja = int(plik['modifiedTime']) + 1
+        self.tresci[file_id] = tresc
+        plik.update(size=str(len(tresc)), modifiedTime=str(wersja),
+                    md5Checksum=plik['md5Checksum'] and f'md5-{file_id}-{wersja}')
+        self._zapisz_zmiane(file_id)
+
+    def zmien_nazwe(self, file_id, nazwa):
+        self.pliki[file_id].update(name=nazwa, modifiedTime=str(int(self.pliki[file_id]['modifiedTime']) + 1))
+        self._zapisz_zmiane(file_id)
+
+    def do_kosza(self, file_id):
+        self.pliki[file_id]['trashed'] = True
+        self._zapisz_zmiane(file_id)
+
+    def przenies(self, file_id, folder_id):
+        self.pliki[file_id]['parents'] = [folder_id]
+        self._zapisz_zmiane(file_id)
+
+    def usun(self, file_id):
+        del self.pliki[file_id]
+        self.dziennik.append({'fileId': file_id, 'removed': True})
+
+
+class AtrapaPobierania:
+    """Zamiennik MediaIoBaseDownload dla zapytań z AtrapaDysku.files().get_media()."""
+
+    def __init__(self, fh, request, chunksize=None):
+        self._fh = fh
+        self._request = request
+
+    def next_chunk(self):
+        self._fh.write(self._request.tresc)
+        return None, True
+
+
+class Restart(Exception):
+    """Symulowane przerwanie procesu (np. Ctrl+C) w trakcie odpytywania zlecenia."""
+
+
+class _Batches:
+    def __init__(self, api, przerwij):
+        self._api = api
+        self._przerwij = przerwij
+
+    def create(self, requests):
+        batch_id = f'msgbatch_{len(self._api.zlecenia) + 1}'
+        self._api.zlecenia[batch_id] = {'zapytania': list(requests), 'odpytania': 0}
+        return types.SimpleNamespace(id=batch_id, processing_status='in_progress')
+
+    def retrieve(self, batch_id):
+        if self._przerwij:
+            raise Restart(batch_id)
+        zlecenie = self._api.zlecenia[batch_id]
+        zlecenie['odpytania'] += 1
+        koniec = zlecenie['odpytania'] >= self._api.odpytan_do_konca
+        wszystkie = len(zlecenie['zapytania'])
+        bledy = sum(self._api.odpowiedz(z['custom_id'], z['params']) is None for z in zlecenie['zapytania'])
+        return types.SimpleNamespace(
+            id=batch_id, processing_status='ended' if koniec else 'in_progress',
+            request_counts=types.SimpleNamespace(processing=0 if koniec else wszystkie,
+                                                 succeeded=wszystkie - bledy if koniec else 0,
+                                                 errored=bledy if koniec else 0))
+
+    def results(self, batch_id):
+        zlecenie = self._api.zlecenia[batch_id]
+        if zlecenie['odpytania'] < self._api.odpytan_do_konca:
+            raise RuntimeError(f'Zlecenie {batch_id} jeszcze trwa')
+        for zapytanie in zlecenie['zapytania']:
+            faktury = self._api.odpowiedz(zapytanie['custom_id'], zapytanie['params'])
+            if faktury is None:
+                wynik = types.SimpleNamespace(type='errored', error=types.SimpleNamespace(type='api_error'))
+            else:
+                blok = types.SimpleNamespace(type='tool_use', id='toolu_atrapa', name='zapisz_faktury',
+                                             input={'faktury': faktury})
+                wynik = types.SimpleNamespace(type='succeeded', message=types.SimpleNamespace(
+                    content=[blok], usage=types.SimpleNamespace(input_tokens=100, output_tokens=50)))
+            yield types.SimpleNamespace(custom_id=zapytanie['custom_id'], result=wynik)
+
+
+class AtrapaBatches:
+    """
+    Message Batches API w pamięci (messages.batches.create/retrieve/results). Zlecenia żyją
+    w tym obiekcie, nie w kliencie, więc klient() po „restarcie” widzi zlecenie sprzed niego.
+    `odpowiedz(custom_id, params)` zwraca listę faktur albo None — wtedy wynik to 'errored'.
+    Zlecenie kończy się przy `odpytan_do_konca`-tym retrieve().
+    """
+
+    def __init__(self, odpowiedz, odpytan_do_konca=2):
+        self.odpowiedz = odpowiedz
+        self.odpytan_do_konca = odpytan_do_konca
+        self.zlecenia = {}
+
+    def klient(self, przerwij_odpytywanie=False):
+        """Klient SDK; przerwij_odpytywanie=True — retrieve() rzuca Restart."""
+        return types.SimpleNamespace(messages=types.SimpleNamespace(batches=_Batches(self, przerwij_odpytywanie)))
+
+
+class AtrapaClaude:
+    """
+    Klient Anthropic z samym messages.create: każde zapytanie trafia do `zapytania`, odpowiedź to
+    wywołanie wymuszonego narzędzia z wejściem `odpowiedz(params)`; `opoznienie` udaje latencję API.
+    """
+
+    def __init__(self, odpowiedz, opoznienie=0):
+        self.odpowiedz = odpowiedz
+        self.opoznienie = opoznienie
+        self.zapytania = []
+        self._numery = itertools.count(1)
+        self._lock = threading.Lock()
+        self.messages = types.SimpleNamespace(create=self._create)
+
+    def _create(self, **params):
+        with self._lock:
+            self.zapytania.append(params)
+            nr = next(self._numery)
+        time.sleep(self.opoznienie)
+        blok = types.SimpleNamespace(type='tool_use', id=f'toolu_{nr}', name=params['tool_choice']['name'],
+                                     input=self.odpowiedz(params))
+        return types.SimpleNamespace(content=[blok], usage=types.SimpleNamespace(input_tokens=100, output_tokens=50))
@@ -0,0 +1,30 @@
+"""
+Wspólne fixture'y: `srodowisko` przekierowuje wszystkie pliki stanu zwrot.py i magazyn.py do
+katalogu tymczasowego, a pobieranie z Dysku do AtrapaPobierania.
+Katalog projektu i testy/ trafiają na sys.path tutaj — pliki testów importują moduły wprost.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import dysk  # noqa: E402
+import magazyn  # noqa: E402
+import zwrot  # noqa: E402
+from atrapy import AtrapaPobierania  # noqa: E402
+
+
+@pytest.fixture
+def srodowisko(tmp_path, monkeypatch):
+    for modul, nazwy in ((zwrot, ('CACHE_PLIK', 'MANIFEST_PLIK', 'WYNIK_PLIK', 'BACKFILL_PLIK')),
+                         (magazyn, ('BAZA_PLIK', 'DANE_PLIK'))):
+        for nazwa in nazwy:
+            monkeypatch.setattr(modul, nazwa, str(tmp_path / os.path.basename(getattr(modul, nazwa))))
+
+    monkeypatch.setattr(zwrot, 'BACKFILL_INTERWAL', 0)
+    monkeypatch.setattr(dysk, 'MediaIoBaseDownload', AtrapaPobierania)
+    monkeypatch.setattr(dysk.MAGAZYN, 'katalog', str(tmp_path / 'bloby'))
+    return tmp_path
@@ -0,0 +1,59 @@
+"""
+przetwarzaj_backfill na AtrapaDysku i AtrapaBatches: wysłanie zlecenia, przerwanie procesu,
+wznowienie z BACKFILL_PLIK bez ponownego wysyłania i odbiór wyników, także z błędnym.
+"""
+
+import json
+import os
+import re
+
+import pytest
+
+import zwrot
+from atrapy import AtrapaBatches, AtrapaDysku, Restart, syntetyczny_pdf
+
+
+def _odpowiedz(custom_id, params):
+    if custom_id == 'uszkodzony':
+        return None
+    numer = re.search(r'FAKTURA nr (\S+)', params['messages'][0]['content']).group(1)
+    return [{'numer': numer, 'liczba_uslug': 1, 'data_wystawienia': '2025-05-31',
+             'data_wykonania_uslugi': '2025-05-30', 'kwota_faktury': 130.0}]
+
+
+def test_wyslanie_restart_wznowienie_odbior(srodowisko):
+    dysk = AtrapaDysku()
+    for nr, file_id in enumerate(('styczen', 'luty', 'uszkodzony')):
+        dysk.dodaj(file_id, syntetyczny_pdf(nr, 1))
+    api = AtrapaBatches(_odpowiedz, odpytan_do_konca=2)
+
+    with pytest.raises(Restart):
+        zwrot.przetwarzaj_backfill(dysk, api.klient(przerwij_odpytywanie=True))
+    assert list(api.zlecenia) == ['msgbatch_1']
+    with open(zwrot.BACKFILL_PLIK, encoding='utf-8') as f:
+        stan = json.load(f)
+    assert stan['batch_id'] == 'msgbatch_1' and sorted(stan['pliki']) == ['luty', 'styczen', 'uszkodzony']
+
+    wynik = zwrot.przetwarzaj_backfill(dysk, api.klient())
+
+    assert list(api.zlecenia) == ['msgbatch_1']  # wznowione, nie wysłane ponownie
+    assert api.zlecenia['msgbatch_1']['odpytania'] == 2
+    assert not os.path.exists(zwrot.BACKFILL_PLIK)
+    with open(zwrot.MANIFEST_PLIK, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['start_page_token'] == stan['start_page_token']
+    assert manifest['pliki']['uszkodzony']['faktury'] is None  # następny --sync ponowi ten plik
+    with open(wynik, encoding='utf-8') as f:
+        assert sorted(f['numer'] for f in json.load(f)) == ['01/01/2025', '01/02/2025']
+
+
+def test_zakonczone_pliki_nie_ida_ponownie(srodowisko):
+    dysk = AtrapaDysku()
+    dysk.dodaj('styczen', syntetyczny_pdf(0, 1))
+    api = AtrapaBatches(_odpowiedz, odpytan_do_konca=1)
+    zwrot.przetwarzaj_backfill(dysk, api.klient())
+
+    dysk.dodaj('luty', syntetyczny_pdf(1, 1))
+    zwrot.przetwarzaj_backfill(dysk, api.klient())
+
+    assert [z['custom_id'] for z in api.zlecenia['msgbatch_2']['zapytania']] == ['luty']
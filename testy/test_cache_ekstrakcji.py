@@ -0,0 +1,28 @@
+"""
+Cache ekstrakcji dla plików bez md5Checksum: po pobraniu sprawdzany po SHA-256 treści,
+więc niezmieniony plik nie idzie ponownie do ekstrakcji ani do Claude.
+"""
+
+import hashlib
+
+import zwrot
+from atrapy import AtrapaDysku, syntetyczny_pdf
+
+
+class _BezClaude:
+    def __getattr__(self, nazwa):
+        raise AssertionError('zapytanie do Claude mimo trafienia w cache')
+
+
+def test_plik_bez_md5_trafia_w_cache_po_sha256(srodowisko):
+    dysk = AtrapaDysku()
+    tresc = syntetyczny_pdf(0, 1)
+    dysk.dodaj('bez_md5', tresc, md5=False)
+    faktury = [{'numer': '01/01/2025', 'kwota_faktury': 130.0}]
+    cache = zwrot.CacheEkstrakcji()
+    cache.dodaj(hashlib.sha256(tresc).hexdigest(), faktury)
+
+    wyniki = zwrot._przetworz_pliki(dysk, _BezClaude(), [dysk.metadane('bez_md5')], cache)
+
+    assert wyniki == {'bez_md5': faktury}
+    assert cache.trafienia == 1
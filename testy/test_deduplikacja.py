@@ -0,0 +1,37 @@
+"""
+deduplikuj_faktury: kopie tej samej faktury są scalane, różne faktury o tej samej dacie
+i kwocie (stała cena za sesję) zostają osobno.
+"""
+
+import zwrot
+
+
+def _f(numer, **pola):
+    return {'numer': numer, 'data_wystawienia': '2025-05-31', 'kwota_faktury': 130.0, **pola}
+
+
+def test_segmenty_numeru_nie_zlewaja_sie():
+    pary = [('a/1', _f('10/5/2025')), ('b/1', _f('01/05/2025')),
+            ('c/1', _f('1/12/2025')), ('d/1', _f('11/2/2025'))]
+    wynik, raport = zwrot.deduplikuj_faktury(pary, {})
+
+    assert [k for k, _ in wynik] == ['a/1', 'b/1', 'c/1', 'd/1']
+    assert raport == []
+
+
+def test_kopie_scalane_z_raportem_plikow():
+    pary = [('a/1', _f('FV/01/2025', miasto_wykonania=None)),
+            ('b/1', _f('fv-1-2025', miasto_wykonania='Szczecin')),
+            ('c/1', _f('FV/0l/2025')),  # OCR: l zamiast 1
+            ('d/1', _f('FV/2/2025'))]
+    wynik, raport = zwrot.deduplikuj_faktury(pary, {'a': 'skan.pdf', 'b': 'mail.pdf', 'c': 'zdjecie.pdf'})
+
+    assert [k for k, _ in wynik] == ['a/1', 'd/1']
+    assert wynik[0][1]['miasto_wykonania'] == 'Szczecin'
+    assert raport == [{'numer': 'FV/01/2025', 'data_wystawienia': '2025-05-31', 'kwota_faktury': 130.0,
+                       'dopasowanie': 'podobny numer', 'pliki': ['skan.pdf', 'mail.pdf', 'zdjecie.pdf']}]
+
+
+def test_faktury_bez_numeru_zostaja():
+    wynik, raport = zwrot.deduplikuj_faktury([('a/#0', _f(None)), ('b/#0', _f(None))], {})
+    assert len(wynik) == 2 and raport == []
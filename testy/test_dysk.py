@@ -0,0 +1,73 @@
+"""
+dysk.py na AtrapaDysku: MagazynBlobow przycina najdawniej używane PDF-y do limitu (odczyt odświeża
+mtime), a listuj_pliki przechodzi po wszystkich stronach listingu, oddając pliki strona po stronie.
+"""
+
+import os
+
+import dysk
+from atrapy import AtrapaDysku
+
+
+def _blob(magazyn, plik, rozmiar, mtime):
+    sciezka = magazyn.sciezka(plik)
+    with open(sciezka, 'wb') as f:
+        f.write(b'%PDF' + b'0' * (rozmiar - 4))
+    os.utime(sciezka, (mtime, mtime))
+    return sciezka
+
+
+def _pliki(*ids):
+    return [{'id': file_id, 'md5Checksum': f'md5-{file_id}'} for file_id in ids]
+
+
+def test_przycina_najdawniej_uzywane(tmp_path):
+    magazyn = dysk.MagazynBlobow(katalog=str(tmp_path), limit=250)
+    sciezki = [_blob(magazyn, plik, 100, mtime) for plik, mtime in zip(_pliki('a', 'b', 'c'), (1000, 3000, 2000))]
+    (tmp_path / 'x.part').write_bytes(b'0' * 1000)  # niedokończone pobranie — nie jest blobem
+
+    magazyn.przytnij()
+
+    assert [os.path.exists(s) for s in sciezki] == [False, True, True]
+    assert (tmp_path / 'x.part').exists()
+
+
+def test_odczyt_chroni_przed_przycieciem(srodowisko):
+    magazyn = dysk.MagazynBlobow(katalog=str(srodowisko / 'bloby'), limit=250)
+    os.makedirs(magazyn.katalog)
+    stary, sredni = _pliki('stary', 'sredni')
+    _blob(magazyn, stary, 100, 1000)
+    _blob(magazyn, sredni, 100, 2000)
+    atrapa = AtrapaDysku()
+    atrapa.dodaj('nowy', b'%PDF' + b'0' * 96)
+
+    magazyn.otworz(atrapa, stary).close()  # trafienie w magazynie — mtime na teraz
+    magazyn.otworz(atrapa, atrapa.metadane('nowy')).close()  # pobranie i przycięcie
+
+    assert os.path.exists(magazyn.sciezka(stary))
+    assert not os.path.exists(magazyn.sciezka(sredni))
+    assert os.path.exists(magazyn.sciezka(atrapa.metadane('nowy')))
+
+
+def test_najswiezszy_zostaje_ponad_limitem(tmp_path):
+    magazyn = dysk.MagazynBlobow(katalog=str(tmp_path), limit=50)
+    stary, duzy = (_blob(magazyn, plik, rozmiar, mtime)
+                   for plik, rozmiar, mtime in zip(_pliki('stary', 'duzy'), (10, 100), (1000, 2000)))
+
+    magazyn.przytnij()
+
+    assert not os.path.exists(stary) and os.path.exists(duzy)
+
+
+def test_listing_po_wszystkich_stronach():
+    atrapa = AtrapaDysku()
+    for nr in range(7):
+        atrapa.dodaj(f'plik{nr}', b'%PDF')
+    atrapa.maks_strona = 3
+
+    pliki = dysk.listuj_pliki(atrapa, dysk.zapytanie_pdf(atrapa.folder_id))
+    assert next(pliki)['id'] == 'plik0'
+    assert atrapa.listowania == 1  # pierwsza strona gotowa przed pobraniem kolejnych
+
+    assert ['plik0'] + [p['id'] for p in pliki] == [f'plik{nr}' for nr in range(7)]
+    assert atrapa.listowania == 3
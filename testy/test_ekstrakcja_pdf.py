@@ -0,0 +1,62 @@
+"""
+odczytaj_tekst_z_pliku_pdf z PulaEkstrakcji: dokument ze ścieżki w zakresach stron, limit czasu
+liczony od startu pracy (nie od kolejki), ubijanie procesu, który limit przekroczył; małe PDF-y
+bez procesów.
+"""
+
+import threading
+
+import pytest
+
+import zwrot
+from atrapy import syntetyczny_pdf
+from ekstrakcja import PulaEkstrakcji
+
+
+@pytest.fixture
+def kazdy_pdf_w_puli(monkeypatch):
+    monkeypatch.setattr(zwrot, 'PROG_PULI_EKSTRAKCJI', 0)
+
+
+def _numery(tekst):
+    return [strona.split('\n', 1)[0] for strona in tekst.split(zwrot.SEPARATOR_STRON)[:-1]]
+
+
+def test_zakresy_stron_ze_sciezki(tmp_path, monkeypatch, kazdy_pdf_w_puli):
+    sciezka = tmp_path / 'faktury.pdf'
+    sciezka.write_bytes(syntetyczny_pdf(0, 7))
+    monkeypatch.setattr(zwrot, 'STRONY_NA_ZADANIE', 3)
+    with PulaEkstrakcji(2) as pula:
+        tekst = zwrot.odczytaj_tekst_z_pliku_pdf(str(sciezka), pula=pula)
+    assert _numery(tekst) == [f'FAKTURA nr {nr:02d}/01/2025' for nr in range(1, 8)]
+
+
+def test_krotki_dokument_nie_czeka_na_dlugi(kazdy_pdf_w_puli):
+    dlugi = {}
+    with PulaEkstrakcji(2) as pula:
+        watek = threading.Thread(target=lambda: dlugi.update(
+            tekst=zwrot.odczytaj_tekst_z_pliku_pdf(syntetyczny_pdf(0, 1000), pula=pula)))
+        watek.start()
+        # Dalsze zakresy długiego PDF-u stoją w kolejce za pierwszym zakresem krótkiego,
+        # a czas w kolejce nie liczy się do limitu.
+        krotki = zwrot.odczytaj_tekst_z_pliku_pdf(syntetyczny_pdf(1, 1), pula=pula, limit_czasu=0.5)
+        w_trakcie = watek.is_alive()
+        watek.join()
+    assert _numery(krotki) == ['FAKTURA nr 01/02/2025']
+    assert w_trakcie
+    assert len(_numery(dlugi['tekst'])) == 1000
+
+
+def test_przekroczony_limit_ubija_proces(kazdy_pdf_w_puli):
+    with PulaEkstrakcji(1) as pula:
+        assert zwrot.odczytaj_tekst_z_pliku_pdf(syntetyczny_pdf(0, 200), pula=pula, limit_czasu=0.001) is None
+        assert not pula._zywe
+        # Następny dokument dostaje nowy proces.
+        assert _numery(zwrot.odczytaj_tekst_z_pliku_pdf(syntetyczny_pdf(1, 1), pula=pula)) == ['FAKTURA nr 01/02/2025']
+
+
+def test_maly_pdf_bez_procesow():
+    with PulaEkstrakcji(2) as pula:
+        assert _numery(zwrot.odczytaj_tekst_z_pliku_pdf(syntetyczny_pdf(1, 2), pula=pula)) == [
+            'FAKTURA nr 01/02/2025', 'FAKTURA nr 02/02/2025']
+        assert not pula._zywe
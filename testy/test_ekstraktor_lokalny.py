@@ -0,0 +1,35 @@
+"""
+wyodrebnij_lokalnie: każdy format daty z _DATA, kilka numerów faktur w dokumencie
+i kara za niezgodność ilość x cena z kwotą faktury.
+"""
+
+import pytest
+
+import zwrot
+
+
+def _dokument(data='31.05.2025', ilosc=4, cena='130,00', kwota='520,00', numery=('03/05/2025',)):
+    naglowki = '\n'.join(f'FAKTURA nr {numer}' for numer in numery)
+    return (f"{naglowki}\nMiejsce wystawienia: Szczecin\nData wystawienia: {data}\n"
+            f"Data wykonania usługi: {data}\nTerapia logopedyczna Ilość: {ilosc} Cena jedn.: {cena} zł\n"
+            f"Do zapłaty: {kwota} zł")
+
+
+@pytest.mark.parametrize('data', ['2025-05-31', '31.05.2025', '31-05-2025', '31/05/2025'])
+def test_formaty_dat(data):
+    faktury, pewnosc = zwrot.wyodrebnij_lokalnie(_dokument(data=data))
+    assert pewnosc == 1.0
+    assert faktury == [{'numer': '03/05/2025', 'liczba_uslug': 4, 'data_wystawienia': '2025-05-31',
+                        'data_wykonania_uslugi': '2025-05-31', 'miasto_wykonania': 'Szczecin',
+                        'cena_jednostkowa': 130.0, 'kwota_faktury': 520.0}]
+
+
+def test_kilka_numerow_zawsze_do_claude():
+    assert zwrot.wyodrebnij_lokalnie(_dokument(numery=('03/05/2025', '04/05/2025'))) == ([], 0.0)
+
+
+def test_niezgodna_kwota_obniza_pewnosc():
+    faktury, pewnosc = zwrot.wyodrebnij_lokalnie(_dokument(kwota='130,00'))
+    assert faktury[0]['kwota_faktury'] == 130.0
+    assert pewnosc == 0.7
+    assert pewnosc < zwrot.PROG_PEWNOSCI_LOKALNEJ
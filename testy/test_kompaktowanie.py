@@ -0,0 +1,85 @@
+"""
+kompaktuj_tekst: nagłówki/stopki znikają, pola faktur zostają — także w PDF-ie z kilkoma
+fakturami z tej samej placówki, gdzie pola powtarzają się na każdej stronie. Tokeny przed i po
+kompaktowaniu liczone są tą samą miarą, także po skróceniu dokumentu.
+"""
+
+import types
+
+import pytest
+
+import zwrot
+
+
+def _strona(nr):
+    return "\n".join([
+        "Gabinet Logopedyczny Mowa, ul. Przykładowa 1, 70-001 Szczecin",
+        f"FAKTURA nr {nr}/05/2025",
+        "Miejsce wystawienia: Szczecin",
+        "Data wystawienia: 2025-05-31",
+        "Nazwa usługi: Terapia logopedyczna",
+        "Cena jedn. netto: 130,00",
+        "Razem do zapłaty: 130,00 zł",
+        "Dokument wygenerowany elektronicznie, nie wymaga podpisu",
+    ])
+
+
+def test_kilka_faktur_zachowuje_pola_kazdej():
+    tekst = zwrot.SEPARATOR_STRON.join(_strona(nr) for nr in (1, 2, 3))
+    wynik, _, _ = zwrot.kompaktuj_tekst(tekst)
+    strony = wynik.split("\n---\n")
+
+    assert len(strony) == 3
+    for strona in strony:
+        assert "Razem do zapłaty: 130,00 zł" in strona
+        assert "Cena jedn. netto: 130,00" in strona
+        assert "Miejsce wystawienia: Szczecin" in strona
+        assert "Data wystawienia: 2025-05-31" in strona
+    # Nagłówek i stopka bez pól faktury zostają tylko na pierwszej stronie.
+    assert wynik.count("Gabinet Logopedyczny Mowa") == 1
+    assert wynik.count("nie wymaga podpisu") == 1
+
+
+def test_linie_ze_srodka_strony_nie_sa_usuwane():
+    srodek = "Terapia prowadzona zgodnie z planem ustalonym z rodzicem"
+    strony = [f"Nagłówek placówki z adresem i NIP\nFAKTURA {nr}\nA\nB\nC\n{srodek}\nD\nE\nF\nStopka" for nr in range(3)]
+    wynik, _, _ = zwrot.kompaktuj_tekst(zwrot.SEPARATOR_STRON.join(strony))
+
+    assert wynik.count(srodek) == 3
+    assert wynik.count("Nagłówek placówki z adresem i NIP") == 1
+
+
+class _Liczacy:
+    """Klient z samym count_tokens: 2 znaki na token (inaczej niż szacuj_tokeny); `awaria` od n-tego wywołania."""
+
+    def __init__(self, awaria=None):
+        self.wywolania = 0
+        self.awaria = awaria
+        self.messages = types.SimpleNamespace(count_tokens=self._count_tokens)
+
+    def _count_tokens(self, model, messages):
+        self.wywolania += 1
+        if self.awaria is not None and self.wywolania >= self.awaria:
+            raise RuntimeError('503')
+        return types.SimpleNamespace(input_tokens=len(messages[0]['content']) // 2)
+
+
+@pytest.mark.parametrize('limit_tokenow', [10_000, 50])
+def test_tokeny_przed_i_po_ta_sama_miara(monkeypatch, limit_tokenow):
+    monkeypatch.setattr(zwrot, 'LICZ_TOKENY_PRZEZ_API', True)
+    tekst = zwrot.SEPARATOR_STRON.join(_strona(nr) for nr in (1, 2, 3))
+
+    wynik, przed, po = zwrot.kompaktuj_tekst(tekst, _Liczacy(), limit_tokenow=limit_tokenow)
+
+    assert ('dokumentu pominięta' in wynik) == (limit_tokenow == 50)
+    assert (przed, po) == (len(tekst) // 2, len(wynik) // 2)
+    assert po < przed
+
+
+def test_awaria_api_to_szacunek_po_obu_stronach(monkeypatch):
+    monkeypatch.setattr(zwrot, 'LICZ_TOKENY_PRZEZ_API', True)
+    tekst = zwrot.SEPARATOR_STRON.join(_strona(nr) for nr in (1, 2, 3))
+
+    wynik, przed, po = zwrot.kompaktuj_tekst(tekst, _Liczacy(awaria=2))
+
+    assert (przed, po) == (zwrot.szacuj_tokeny(tekst), zwrot.szacuj_tokeny(wynik))
@@ -0,0 +1,38 @@
+"""
+_zapytaj_claude oddaje slot KONTROLERA przy każdym wyjściu z próby, także przy wyjątkach
+spoza API (np. APIResponseValidationError, TypeError) — inaczej kolejne zajmij() wisi.
+"""
+
+import types
+
+import pytest
+
+import zwrot
+
+
+def _klient(wyjatek):
+    def create(**_):
+        raise wyjatek
+    return types.SimpleNamespace(messages=types.SimpleNamespace(create=create))
+
+
+def test_nieoczekiwany_wyjatek_zwalnia_slot(monkeypatch):
+    kontroler = zwrot.KontrolerWspolbieznosci(start=2)
+    monkeypatch.setattr(zwrot, 'KONTROLER', kontroler)
+
+    for _ in range(3):
+        with pytest.raises(TypeError):
+            zwrot._zapytaj_claude(_klient(TypeError('zły parametr')), model='x')
+
+    assert kontroler.w_toku == 0
+    assert kontroler.bledy == 3
+
+
+def test_sukces_zwalnia_slot(monkeypatch):
+    kontroler = zwrot.KontrolerWspolbieznosci(start=1)
+    monkeypatch.setattr(zwrot, 'KONTROLER', kontroler)
+    klient = types.SimpleNamespace(messages=types.SimpleNamespace(create=lambda **_: 'odpowiedz'))
+
+    assert zwrot._zapytaj_claude(klient) == 'odpowiedz'
+    assert zwrot._zapytaj_claude(klient) == 'odpowiedz'
+    assert kontroler.w_toku == 0
@@ -0,0 +1,89 @@
+"""
+magazyn.py na tymczasowej bazie: rewizje i nagrobki, agregaty zgodne z przeliczeniem od zera,
+czytelnik w nowym wątku nie czeka na trwający zapis (WAL).
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+import magazyn
+from agregaty import Agregaty
+
+
+def _f(numer, kwota=130.0, data='2025-05-31'):
+    return {'numer': numer, 'data_wystawienia': data, 'data_wykonania_uslugi': data, 'kwota_faktury': kwota}
+
+
+def test_rewizje_i_roznice(tmp_path):
+    baza, eksport = str(tmp_path / 'f.db'), str(tmp_path / 'f.json')
+    pary = [('a/1', _f('1')), ('a/2', _f('2'))]
+
+    assert magazyn.zapisz(pary, sciezka=baza, eksport=eksport) == 1
+    assert magazyn.zapisz(pary, sciezka=baza, eksport=eksport) == 1  # bez zmian — ta sama rewizja
+    assert magazyn.zapisz([('a/2', _f('2', 150.0))], sciezka=baza, eksport=eksport) == 2
+
+    rewizja, zmienione, usuniete = magazyn.zmiany_od(1, sciezka=baza)
+    assert rewizja == 2
+    assert [f['id'] for f in zmienione] == ['a/2'] and usuniete == ['a/1']
+    with open(eksport, encoding='utf-8') as f:
+        assert json.load(f) == [_f('2', 150.0)]
+
+
+def test_agregaty_przyrostowe_jak_od_zera(tmp_path):
+    baza, eksport = str(tmp_path / 'f.db'), str(tmp_path / 'f.json')
+    los = random.Random(1)
+    pula = {}
+    for runda in range(15):
+        for i in los.sample(range(40), 8):
+            miesiac = los.randint(1, 12)
+            pula[i] = _f(str(i), los.choice([130, 130.5, 99.99]), f'{los.choice([2024, 2025])}-{miesiac:02d}-15')
+        klucze = los.sample(sorted(pula), los.randint(0, len(pula)))
+        magazyn.zapisz([(f'p/{i}', pula[i]) for i in klucze], sciezka=baza, eksport=eksport)
+
+        od_zera = Agregaty()
+        for i in klucze:
+            od_zera.dodaj(pula[i])
+        assert magazyn.statystyki(sciezka=baza)[1] == od_zera.slownik(), runda
+        assert [f['id'] for f in magazyn.wszystkie(sciezka=baza)[1]] == [f'p/{i}' for i in klucze]
+
+
+def test_czytelnik_nie_czeka_na_zapis(tmp_path):
+    baza = str(tmp_path / 'f.db')
+    magazyn.zapisz([('a/1', _f('1'))], sciezka=baza, eksport=str(tmp_path / 'f.json'))
+
+    pisarz = sqlite3.connect(baza, isolation_level=None)
+    pisarz.execute('BEGIN IMMEDIATE')
+    try:
+        czasy = []
+
+        def czytaj():
+            start = time.monotonic()
+            magazyn.wszystkie(sciezka=baza)
+            magazyn.statystyki(sciezka=baza)
+            czasy.append(time.monotonic() - start)
+
+        watek = threading.Thread(target=czytaj)  # nowy wątek = nowe połączenie, jak w ThreadingHTTPServer
+        watek.start()
+        watek.join(timeout=5)
+        assert czasy and czasy[0] < 1
+    finally:
+        pisarz.execute('ROLLBACK')
+        pisarz.close()
+
+
+def test_pierwsze_otwarcie_importuje_faktury_dane(tmp_path):
+    with open(tmp_path / 'faktury_dane.json', 'w', encoding='utf-8') as f:
+        json.dump([_f('1'), _f('2', 70.0)], f)
+    baza = str(tmp_path / 'faktury.db')
+
+    rewizja, faktury = magazyn.wszystkie(sciezka=baza)
+    assert rewizja == 1
+    assert [f['id'] for f in faktury] == ['import/#0', 'import/#1']
+    assert magazyn.statystyki(sciezka=baza)[1]['totalAmount'] == 200.0
+
+    # Pierwsze odświeżenie zastępuje importowane wpisy fakturami z prawdziwymi id.
+    magazyn.zapisz([('x/1', _f('1'))], sciezka=baza, eksport=str(tmp_path / 'faktury_dane.json'))
+    assert magazyn.zmiany_od(1, sciezka=baza)[2] == ['import/#0', 'import/#1']
@@ -0,0 +1,49 @@
+"""
+_przetworz_pliki z AtrapaClaude: 30 jednostronicowych plików (pobieranie 0,1 s, Claude 1 s)
+idzie w kilku zapytaniach zbiorczych, a nie w kilkunastu prawie pojedynczych.
+"""
+
+import re
+import time
+
+import dysk as dysk_google
+import zwrot
+from atrapy import AtrapaClaude, AtrapaDysku, AtrapaPobierania, syntetyczny_pdf
+
+
+class _WolnePobieranie(AtrapaPobierania):
+    def next_chunk(self):
+        time.sleep(0.1)
+        return super().next_chunk()
+
+
+def _faktura(numer):
+    return {'numer': numer, 'liczba_uslug': 1, 'data_wystawienia': '2025-05-31',
+            'data_wykonania_uslugi': '2025-05-30', 'miasto_wykonania': 'Szczecin',
+            'cena_jednostkowa': 130.0, 'kwota_faktury': 130.0}
+
+
+def _odpowiedz(params):
+    tresc = params['messages'][0]['content']
+    if params['tool_choice']['name'] == 'zapisz_faktury_dokumentow':
+        dokumenty = re.findall(r'<dokument id="([^"]+)">(.*?)</dokument>', tresc, re.S)
+        return {'dokumenty': [{'id': id_dok, 'faktury': [_faktura(n) for n in re.findall(r'FAKTURA nr (\S+)', tekst)]}
+                              for id_dok, tekst in dokumenty]}
+    return {'faktury': [_faktura(n) for n in re.findall(r'FAKTURA nr (\S+)', tresc)]}
+
+
+def test_male_dokumenty_w_paczkach(srodowisko, monkeypatch):
+    monkeypatch.setattr(zwrot, 'PROG_PEWNOSCI_LOKALNEJ', None)
+    monkeypatch.setattr(zwrot, 'KONTROLER', zwrot.KontrolerWspolbieznosci(start=2))
+    monkeypatch.setattr(dysk_google, 'MediaIoBaseDownload', _WolnePobieranie)
+    dysk = AtrapaDysku()
+    for nr in range(30):
+        dysk.dodaj(f'plik{nr}', syntetyczny_pdf(nr, 1))
+    claude = AtrapaClaude(_odpowiedz, opoznienie=1)
+
+    wyniki = zwrot._przetworz_pliki(dysk, claude, [dysk.metadane(f'plik{nr}') for nr in range(30)],
+                                    zwrot.CacheEkstrakcji())
+
+    assert len(wyniki) == 30 and all(wyniki.values())
+    assert len(claude.zapytania) <= 6, [len(re.findall('<dokument ', z['messages'][0]['content'])) or 1
+                                        for z in claude.zapytania]
@@ -0,0 +1,33 @@
+"""
+Prefiks zapytań do Claude (narzędzia + instrukcje z cache_control) jest dość długi, by API go
+cache'owało, i nie zależy od dokumentu. Odczyt z cache na żywym API: bench/cache_promptu.py.
+"""
+
+import json
+
+import zwrot
+
+
+def _prefiks(parametry):
+    return json.dumps([parametry['tools'], parametry['system']], ensure_ascii=False)
+
+
+def test_instrukcje_powyzej_minimum_cache():
+    # Sam tekst systemowy, bez schematu narzędzia — zapas na niedokładność szacunku.
+    for instrukcje in (zwrot.INSTRUKCJE_EKSTRAKCJI, zwrot.INSTRUKCJE_EKSTRAKCJI_ZBIORCZEJ):
+        assert zwrot.szacuj_tokeny(instrukcje) >= zwrot.MIN_TOKENOW_CACHE
+
+
+def test_prefiks_nie_zalezy_od_dokumentu():
+    pierwsze = zwrot._parametry_faktury("FAKTURA nr 01/05/2025")
+    drugie = zwrot._parametry_faktury("FAKTURA nr 02/05/2025")
+    assert _prefiks(pierwsze) == _prefiks(drugie)
+    assert pierwsze['system'][-1]['cache_control'] == {"type": "ephemeral"}
+    assert pierwsze['messages'] != drugie['messages']
+
+
+def test_prompt_opisuje_separator_po_kompaktowaniu():
+    tekst = zwrot.kompaktuj_tekst(f"FAKTURA nr 1{zwrot.SEPARATOR_STRON}FAKTURA nr 2")[0]
+    assert zwrot.SEPARATOR_STRON_KOMPAKTOWY in tekst
+    assert f'"{zwrot.SEPARATOR_STRON_KOMPAKTOWY.strip()}"' in zwrot.ZASADY_POL
+    assert zwrot.SEPARATOR_STRON.strip() not in zwrot.ZASADY_POL
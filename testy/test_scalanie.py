@@ -0,0 +1,60 @@
+"""
+scal_pdfy na AtrapaDysku: anulowanie nie czeka na resztę pobrań, a każdy otwarty uchwyt
+pliku — odebrany, gotowy czy pobierany w chwili anulowania — zostaje zamknięty.
+"""
+
+import time
+
+import pytest
+
+import dysk
+import server
+from atrapy import AtrapaDysku, AtrapaPobierania, syntetyczny_pdf
+
+
+class _WolnePobieranie(AtrapaPobierania):
+    def next_chunk(self):
+        time.sleep(0.3)
+        return super().next_chunk()
+
+
+@pytest.fixture
+def scalanie(srodowisko, monkeypatch):
+    monkeypatch.setattr(server, 'SCALANIE_STAN_PLIK', str(srodowisko / 'scalanie.json'))
+    uchwyty = []
+    otworz = dysk.MAGAZYN.otworz
+
+    def otworz_i_zapamietaj(*args, **kwargs):
+        fh = otworz(*args, **kwargs)
+        uchwyty.append(fh)
+        return fh
+    monkeypatch.setattr(dysk.MAGAZYN, 'otworz', otworz_i_zapamietaj)
+
+    dysk_google = AtrapaDysku()
+    for nr in range(40):
+        dysk_google.dodaj(f'plik{nr:02d}', syntetyczny_pdf(nr, 1))
+    pliki = [dysk_google.metadane(f'plik{nr:02d}') for nr in range(40)]
+    return dysk_google, pliki, str(srodowisko / 'scalone.pdf'), uchwyty
+
+
+def test_scalanie_zamyka_uchwyty(scalanie):
+    dysk_google, pliki, wynik, uchwyty = scalanie
+    assert server.scal_pdfy(dysk_google, pliki[:3], wynik)['pages'] == 3
+    assert len(uchwyty) == 3 and all(fh.closed for fh in uchwyty)
+
+
+def test_anulowanie_nie_czeka_na_pobrania(scalanie, monkeypatch):
+    monkeypatch.setattr(dysk, 'MediaIoBaseDownload', _WolnePobieranie)
+    dysk_google, pliki, wynik, uchwyty = scalanie
+    zadanie = server.Zadanie('merge')
+    monkeypatch.setattr(zadanie, 'postep', lambda *_: zadanie.anuluj())
+
+    start = time.monotonic()
+    with pytest.raises(server.Anulowano):
+        server.scal_pdfy(dysk_google, pliki, wynik, zadanie=zadanie)
+    # 40 plików po 0,3 s w WATKI_SCALANIA wątkach to 1,5 s; anulowanie po pierwszej fali.
+    assert time.monotonic() - start < 1.0
+
+    time.sleep(0.5)  # pobrania trwające w chwili anulowania kończą się w tle
+    assert len(uchwyty) < len(pliki)
+    assert all(fh.closed for fh in uchwyty)
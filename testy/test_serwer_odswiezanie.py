@@ -0,0 +1,74 @@
+"""
+Zadanie 'refresh' w server.py: brak folderu albo brak wyniku z zwrot.py to porażka zadania,
+nie 'success' z komunikatem „Dane zaktualizowane”. Kolejne odświeżenia dzielą jedną pulę ekstrakcji,
+a pusty folder to pusty zbiór faktur bez dodatkowego listingu.
+"""
+
+import types
+
+import pytest
+
+import ekstrakcja
+import magazyn
+import server
+import zwrot as zwrot_modul
+from atrapy import AtrapaDysku, syntetyczny_pdf
+
+
+@pytest.fixture
+def serwer(monkeypatch):
+    def ustaw(dysk, wynik=None, faktury=()):
+        monkeypatch.setattr(server, '_FOLDER_ID', None)
+        monkeypatch.setattr(server, '_PULA_EKSTRAKCJI', None)
+        monkeypatch.setattr(server, 'get_drive_service', lambda: dysk)
+        zwrot = types.SimpleNamespace(RAPORT_POSTEPU=None, CONFIG_PLIK='config.json', pule=[],
+                                      ekstrakcja=ekstrakcja, PROCESY_EKSTRAKCJI=1)
+
+        def przetwarzaj(*_, pula=None, **__):
+            zwrot.pule.append(pula)
+            if wynik:
+                magazyn.zapisz(list(faktury), eksport=wynik)
+            return wynik
+        zwrot.przetwarzaj_faktury_z_dysku = przetwarzaj
+        monkeypatch.setattr(server, '_zwrot', lambda: zwrot)
+        monkeypatch.setattr(server, 'get_claude_client', lambda z: object())
+        return zwrot
+    yield ustaw
+    if server._PULA_EKSTRAKCJI is not None:
+        server._PULA_EKSTRAKCJI.zamknij()
+
+
+def test_brak_folderu_to_blad(serwer):
+    serwer(AtrapaDysku(folder='Inny folder'))
+    with pytest.raises(RuntimeError, match='Nie znaleziono folderu'):
+        server._odswiez(server.Zadanie('refresh'))
+
+
+def test_brak_wyniku_przetwarzania_to_blad(serwer):
+    dysk = AtrapaDysku()
+    dysk.dodaj('styczen', syntetyczny_pdf(0, 1))
+    serwer(dysk, wynik=None)
+    with pytest.raises(RuntimeError, match='nie zapisało danych'):
+        server._odswiez(server.Zadanie('refresh'))
+
+
+def test_odswiezenia_dziela_pule_ekstrakcji(serwer, srodowisko, monkeypatch):
+    dysk = AtrapaDysku()
+    dysk.dodaj('styczen', syntetyczny_pdf(0, 1))
+    zwrot = serwer(dysk, wynik=str(srodowisko / 'faktury_dane.json'),
+                   faktury=[('styczen/1', {'numer': '1', 'kwota_faktury': 130.0})])
+    monkeypatch.setattr(server, 'STATIC_ROOT', str(srodowisko / 'dist'))
+    for _ in range(2):
+        assert server._odswiez(server.Zadanie('refresh'))['message'] == 'Dane zaktualizowane'
+    assert len(zwrot.pule) == 2 and zwrot.pule[0] is zwrot.pule[1] is not None
+
+
+def test_pusty_folder_bez_dodatkowego_listingu(serwer, srodowisko, monkeypatch):
+    dysk = AtrapaDysku()
+    serwer(dysk)
+    monkeypatch.setattr(server, '_zwrot', lambda: zwrot_modul)
+    monkeypatch.setattr(server, 'STATIC_ROOT', str(srodowisko / 'dist'))
+
+    assert server._odswiez(server.Zadanie('refresh'))['message'] == 'Brak faktur na Drive'
+    assert dysk.listowania == 2  # folder + jeden listing PDF-ów w przebiegu
+    assert magazyn.wszystkie()[1] == []
@@ -0,0 +1,122 @@
+"""
+Statyka z web/dist przez CacheStatyki: silny ETag per reprezentacja, 304 na If-None-Match,
+wybór kodowania z Accept-Encoding (q=0 wyklucza) i `immutable` tylko dla assets/ z Vite.
+"""
+
+import gzip
+import http.client
+import http.server
+import os
+import threading
+
+import pytest
+
+import server
+
+DUZY_JS = b'console.log("faktury");\n' * 200  # powyżej MIN_ROZMIAR_KOMPRESJI
+
+
+class _CichyHandler(server.Handler):
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def statyka(tmp_path, monkeypatch):
+    dist = tmp_path / 'dist'
+    (dist / 'assets').mkdir(parents=True)
+    (dist / 'index.html').write_bytes(b'<!doctype html><div id="root"></div>')
+    (dist / 'assets' / 'index-3f2a1b.js').write_bytes(DUZY_JS)
+    monkeypatch.setattr(server, 'STATIC_ROOT', str(dist))
+    monkeypatch.setattr(server, 'STATYKA', server.CacheStatyki(str(dist)))
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _CichyHandler)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def pobierz(sciezka, **naglowki):
+        polaczenie = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+        polaczenie.request('GET', server.STATIC_PREFIX + sciezka, headers=naglowki)
+        odpowiedz = polaczenie.getresponse()
+        tresc = odpowiedz.read()
+        polaczenie.close()
+        return odpowiedz, tresc
+    pobierz.dist = dist
+    yield pobierz
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_etag_i_304(statyka):
+    odp, tresc = statyka('index.html')
+    etag = odp.getheader('ETag')
+    assert odp.status == 200 and tresc.startswith(b'<!doctype html>')
+    assert odp.getheader('Cache-Control') == server.CACHE_POZOSTALYCH
+
+    for znany in (etag, f'W/{etag}', f'"inny", {etag}'):
+        odp, tresc = statyka('index.html', **{'If-None-Match': znany})
+        assert odp.status == 304 and tresc == b''
+        assert odp.getheader('ETag') == etag
+
+    odp, _ = statyka('index.html', **{'If-None-Match': '"inny"'})
+    assert odp.status == 200
+
+
+def test_nowa_tresc_to_nowy_etag(statyka):
+    odp, _ = statyka('index.html')
+    etag = odp.getheader('ETag')
+    (statyka.dist / 'index.html').write_bytes(b'<!doctype html><div id="root" class="nowy-build"></div>')
+
+    odp, tresc = statyka('index.html', **{'If-None-Match': etag})
+    assert odp.status == 200 and b'nowy-build' in tresc
+    assert odp.getheader('ETag') != etag
+
+
+def test_skompresowany_wariant_ma_wlasny_etag(statyka):
+    odp, tresc = statyka('assets/index-3f2a1b.js', **{'Accept-Encoding': 'gzip'})
+    assert odp.status == 200 and odp.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(tresc) == DUZY_JS
+    assert odp.getheader('ETag').endswith('-gzip"') and odp.getheader('Vary') == 'Accept-Encoding'
+
+    # ETag oryginału nie pasuje do wariantu gzip — klient dostaje pełną odpowiedź.
+    surowy, _ = statyka('assets/index-3f2a1b.js', **{'Accept-Encoding': 'identity'})
+    assert surowy.getheader('Content-Encoding') is None
+    odp, _ = statyka('assets/index-3f2a1b.js', **{'Accept-Encoding': 'gzip', 'If-None-Match': surowy.getheader('ETag')})
+    assert odp.status == 200
+
+
+def test_immutable_tylko_dla_assets(statyka):
+    (statyka.dist / 'faktury_dane.json').write_text('[]')
+
+    assert statyka('assets/index-3f2a1b.js')[0].getheader('Cache-Control') == server.CACHE_ZASOBOW
+    assert 'immutable' in server.CACHE_ZASOBOW
+    for sciezka in ('index.html', 'faktury_dane.json'):
+        assert statyka(sciezka)[0].getheader('Cache-Control') == server.CACHE_POZOSTALYCH
+
+
+def test_sciezka_poza_dist(statyka):
+    (statyka.dist.parent / 'sekret.txt').write_text('x')
+    assert statyka('../sekret.txt')[0].status == 403
+    assert statyka('brak.js')[0].status == 404
+
+
+WSZYSTKIE = {'identity': b'', 'gzip': b'', 'br': b''}
+
+
+@pytest.mark.parametrize('accept_encoding, dostepne, oczekiwane', [
+    ('gzip, deflate, br', WSZYSTKIE, 'br'),
+    ('gzip, br;q=0', WSZYSTKIE, 'gzip'),
+    ('gzip;q=0', WSZYSTKIE, 'identity'),
+    ('GZIP;q=0.5', WSZYSTKIE, 'gzip'),
+    ('gzip;q=x', WSZYSTKIE, 'identity'),
+    ('*', WSZYSTKIE, 'br'),
+    ('*;q=0', WSZYSTKIE, 'identity'),
+    ('br', {'identity': b'', 'gzip': b''}, 'identity'),
+    (None, WSZYSTKIE, 'identity'),
+])
+def test_wybor_kodowania(accept_encoding, dostepne, oczekiwane):
+    assert server._wybierz_kodowanie(accept_encoding, dostepne) == oczekiwane
+
+
+def test_maly_plik_bez_kompresji(statyka):
+    wpis = server.STATYKA.pobierz(os.path.join(server.STATIC_ROOT, 'index.html'))
+    assert set(wpis['warianty']) == {'identity'}
+    assert statyka('index.html', **{'Accept-Encoding': 'gzip'})[0].getheader('Vary') is None
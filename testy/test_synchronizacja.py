@@ -0,0 +1,57 @@
+"""
+pobierz_zmiany_z_dysku na AtrapaDysku: która zmiana w folderze daje ponowne przetworzenie,
+która tylko aktualizuje manifest, a która usuwa plik z wyników.
+"""
+
+import zwrot
+from atrapy import AtrapaDysku, syntetyczny_pdf
+
+
+def _po_pelnej_synchronizacji(dysk, nieudane=()):
+    """Manifest jak po pełnym przebiegu: każdy plik z folderu z fakturami (albo None przy błędzie)."""
+    pliki = {}
+    for file_id, plik in dysk.pliki.items():
+        if plik['mimeType'] == 'application/pdf':
+            pliki[file_id] = {'name': plik['name'], 'md5Checksum': plik['md5Checksum'],
+                              'modifiedTime': plik['modifiedTime'],
+                              'faktury': None if file_id in nieudane else [{'numer': file_id}]}
+    token = dysk.changes().getStartPageToken().execute()['startPageToken']
+    return {'folder_id': dysk.folder_id, 'start_page_token': token, 'pliki': pliki}
+
+
+def test_delta_obejmuje_kazdy_rodzaj_zmiany():
+    dysk = AtrapaDysku()
+    for file_id in ('zmieniony', 'przemianowany', 'w_koszu', 'przeniesiony', 'nieudany', 'bez_zmian'):
+        dysk.dodaj(file_id, syntetyczny_pdf(1, 1))
+    manifest = _po_pelnej_synchronizacji(dysk, nieudane={'nieudany'})
+
+    dysk.dodaj('nowy', syntetyczny_pdf(2, 1))
+    dysk.zmien_tresc('zmieniony', syntetyczny_pdf(3, 1))
+    dysk.zmien_nazwe('przemianowany', 'faktura-maj.pdf')
+    dysk.do_kosza('w_koszu')
+    dysk.przenies('przeniesiony', 'INNY_FOLDER')
+    dysk.dodaj('chwilowy', syntetyczny_pdf(4, 1))
+    dysk.usun('chwilowy')  # dodany i usunięty między przebiegami — nie ma czego przetwarzać
+    dysk.maks_strona = 2  # dziennik na kilku stronach
+
+    pliki, usuniete, nowy_token = zwrot.pobierz_zmiany_z_dysku(dysk, dysk.folder_id, manifest)
+
+    assert sorted(p['id'] for p in pliki) == ['nieudany', 'nowy', 'zmieniony']
+    assert usuniete == {'w_koszu', 'przeniesiony'}
+    assert nowy_token == str(len(dysk.dziennik))
+    # Sama zmiana nazwy: manifest zaktualizowany, faktury z poprzedniego przebiegu zostają.
+    assert manifest['pliki']['przemianowany']['name'] == 'faktura-maj.pdf'
+    assert manifest['pliki']['przemianowany']['faktury'] == [{'numer': 'przemianowany'}]
+
+
+def test_bez_zmian_tylko_ponowienia():
+    dysk = AtrapaDysku()
+    dysk.dodaj('ok', syntetyczny_pdf(1, 1))
+    dysk.dodaj('nieudany', syntetyczny_pdf(2, 1))
+    manifest = _po_pelnej_synchronizacji(dysk, nieudane={'nieudany'})
+
+    pliki, usuniete, nowy_token = zwrot.pobierz_zmiany_z_dysku(dysk, dysk.folder_id, manifest)
+
+    assert [p['id'] for p in pliki] == ['nieudany']
+    assert usuniete == set()
+    assert nowy_token == manifest['start_page_token']
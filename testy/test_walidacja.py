@@ -0,0 +1,67 @@
+"""
+waliduj_faktury normalizuje typy pól z odpowiedzi modelu i zbiera błędy, a wyodrebnij_dane_z_faktury
+odsyła je modelowi w jednej próbie naprawczej — po nieudanej poprawce dokument daje None.
+"""
+
+import pytest
+
+import zwrot
+from atrapy import AtrapaClaude
+
+
+def _faktura(**pola):
+    return {'numer': 'FV/1/2025', 'liczba_uslug': 1, 'data_wystawienia': '2025-05-31',
+            'data_wykonania_uslugi': '2025-05-30', 'miasto_wykonania': 'Szczecin',
+            'cena_jednostkowa': 130.0, 'kwota_faktury': 130.0, **pola}
+
+
+def test_normalizuje_typy_pol():
+    faktury, bledy = zwrot.waliduj_faktury([_faktura(numer=123, liczba_uslug='2', miasto_wykonania='',
+                                                     cena_jednostkowa='650,25', kwota_faktury='1 300,50')])
+
+    assert bledy == []
+    assert faktury == [_faktura(numer='123', liczba_uslug=2, miasto_wykonania=None,
+                                cena_jednostkowa=650.25, kwota_faktury=1300.5)]
+
+
+@pytest.mark.parametrize('faktury, blad', [
+    ({'numer': '1'}, "'faktury' musi być listą"),
+    (['FV/1/2025'], 'faktura 1: oczekiwano obiektu'),
+    ([_faktura(numer='')], 'faktura 1: brak numeru'),
+    ([_faktura(), _faktura(data_wystawienia='31.05.2025')], 'faktura 2: data_wystawienia musi mieć format'),
+    ([_faktura(liczba_uslug='dwie')], 'faktura 1: liczba_uslug musi być liczbą całkowitą'),
+    ([_faktura(kwota_faktury=None)], 'faktura 1: kwota_faktury musi być liczbą'),
+    ([_faktura(cena_jednostkowa='130 zł')], 'faktura 1: cena_jednostkowa musi być liczbą'),
+])
+def test_bledy_walidacji(faktury, blad):
+    _, bledy = zwrot.waliduj_faktury(faktury)
+    assert len(bledy) == 1 and bledy[0].startswith(blad)
+
+
+@pytest.fixture
+def kontroler(monkeypatch):
+    monkeypatch.setattr(zwrot, 'KONTROLER', zwrot.KontrolerWspolbieznosci(start=1))
+
+
+def test_poprawka_po_bledzie_walidacji(kontroler):
+    def odpowiedz(params):
+        if len(params['messages']) == 1:
+            return {'faktury': [_faktura(data_wystawienia='31.05.2025')]}
+        return {'faktury': [_faktura()]}
+    claude = AtrapaClaude(odpowiedz)
+
+    assert zwrot.wyodrebnij_dane_z_faktury(claude, 'FAKTURA nr FV/1/2025') == [_faktura()]
+
+    assert len(claude.zapytania) == 2
+    asystent, wynik = claude.zapytania[1]['messages'][1:]
+    assert asystent['content'][0]['id'] == 'toolu_1'
+    assert asystent['content'][0]['input']['faktury'][0]['data_wystawienia'] == '31.05.2025'
+    assert wynik['content'][0]['tool_use_id'] == 'toolu_1' and wynik['content'][0]['is_error']
+    assert 'data_wystawienia musi mieć format YYYY-MM-DD' in wynik['content'][0]['content']
+
+
+def test_bledna_poprawka_daje_none(kontroler):
+    claude = AtrapaClaude(lambda params: {'faktury': [_faktura(kwota_faktury='sto trzydzieści')]})
+
+    assert zwrot.wyodrebnij_dane_z_faktury(claude, 'FAKTURA nr FV/1/2025') is None
+    assert len(claude.zapytania) == 2  # jedna próba naprawcza, bez kolejnych
@@ -5,6 +5,7 @@ import { StepTwo } from '@/components/dashboard/StepTwo'
 import { StepThree } from '@/components/dashboard/StepThree'
 import { Summary } from '@/components/dashboard/Summary'
 import { useInvoiceData } from '@/hooks/useInvoiceData'
+import { useServerEvents } from '@/hooks/useServerEvents'
 
 type Step = 'home' | 'step1' | 'step2' | 'step3' | 'summary'
 
@@ -17,7 +18,8 @@ function getStepFromHash(): Step {
 
 function App() {
   const [step, setStep] = useState<Step>(getStepFromHash)
-  const { invoices, stats, loading, error, refetch } = useInvoiceData()
+  const { invoices, stats, loading, error, refetch, addInvoices } = useInvoiceData()
+  const { jobs } = useServerEvents(addInvoices)
 
   const navigate = useCallback((to: Step) => {
     window.location.hash = to === 'home' ? '' : to
@@ -52,7 +54,7 @@ function App() {
         ) : (
           <>
             {step === 'home' && (
-              <HomeView invoices={invoices} stats={stats} refetch={refetch} onNext={() => navigate('step1')} />
+              <HomeView invoices={invoices} stats={stats} refreshJob={jobs.refresh ?? null} refetch={refetch} onNext={() => navigate('step1')} />
             )}
             {step === 'step1' && (
               <StepOne invoices={invoices} onBack={() => navigate('home')} onNext={() => navigate('step2')} />
@@ -1,46 +1,34 @@
-import { useState, useEffect, useRef, useCallback } from 'react'
+import { useState, useEffect } from 'react'
 import { RefreshCw, Globe, Loader2, Check, AlertCircle, FileText, ExternalLink, ArrowRight } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { formatPLN, formatDate } from '@/lib/utils'
-import type { Invoice, DashboardStats } from '@/types'
+import { LOCAL_SERVER, cancelJob, formatJobProgress } from '@/lib/jobs'
+import type { Invoice, DashboardStats, Job } from '@/types'
 
 interface HomeViewProps {
   invoices: Invoice[]
   stats: DashboardStats
+  refreshJob: Job | null
   refetch: () => Promise<void>
   onNext: () => void
 }
 
-const LOCAL_SERVER = 'http://localhost:8765'
-const POLL_INTERVAL = 1500
-
 type ActionStatus = 'idle' | 'loading' | 'started' | 'already_running' | 'error'
-type RefreshStatus = ActionStatus | 'polling' | 'done'
+type RefreshStatus = ActionStatus | 'waiting' | 'done'
 
 const LUXMED_FORM_URL = 'https://portalpacjenta.luxmed.pl/PatientPortal/NewPortal/Page/UserProfile/statements/refund/performed-services'
 
-export function HomeView({ invoices, stats, refetch, onNext }: HomeViewProps) {
+export function HomeView({ invoices, stats, refreshJob, refetch, onNext }: HomeViewProps) {
   const [refreshStatus, setRefreshStatus] = useState<RefreshStatus>('idle')
-  const pollRef = useRef<ReturnType<typeof setInterval> | null>(null)
-
-  const stopPolling = useCallback(() => {
-    if (pollRef.current) clearInterval(pollRef.current)
-    pollRef.current = null
-  }, [])
+  const [jobId, setJobId] = useState<string | null>(null)
 
-  useEffect(() => () => stopPolling(), [stopPolling])
-
-  const checkWorkflow = useCallback(async () => {
-    try {
-      const res = await fetch(`${LOCAL_SERVER}/workflow-status`)
-      const data = await res.json()
-      if (data.status === 'completed') {
-        stopPolling()
-        await refetch()
-        setRefreshStatus(data.conclusion === 'success' ? 'done' : 'error')
-      }
-    } catch { /* keep polling */ }
-  }, [stopPolling, refetch])
+  // Stan zadania przychodzi przez /events (useServerEvents) — bez odpytywania /workflow-status.
+  useEffect(() => {
+    if (!jobId || refreshJob?.id !== jobId || refreshJob.state === 'running') return
+    const succeeded = refreshJob.state === 'success'
+    setJobId(null)
+    refetch().then(() => setRefreshStatus(succeeded ? 'done' : 'error'))
+  }, [refreshJob, jobId, refetch])
 
   const triggerRefresh = async () => {
     setRefreshStatus('loading')
@@ -52,14 +40,15 @@ export function HomeView({ invoices, stats, refetch, onNext }: HomeViewProps) {
         return
       }
 
-      setRefreshStatus('polling')
-      checkWorkflow()
-      pollRef.current = setInterval(checkWorkflow, POLL_INTERVAL)
+      setJobId(data.job)
+      setRefreshStatus('waiting')
     } catch {
       setRefreshStatus('error')
     }
   }
 
+  const activeJob = jobId && refreshJob?.id === jobId ? refreshJob : null
+
   return (
     <div className="flex flex-col flex-1">
       <div className="flex-1 flex flex-col justify-center gap-6">
@@ -106,9 +95,9 @@ export function HomeView({ invoices, stats, refetch, onNext }: HomeViewProps) {
               onClick={triggerRefresh}
               variant="outline"
               className="mt-3 gap-2 cursor-pointer"
-              disabled={refreshStatus === 'loading' || refreshStatus === 'polling'}
+              disabled={refreshStatus === 'loading' || refreshStatus === 'waiting'}
             >
-              {(refreshStatus === 'loading' || refreshStatus === 'polling') && <Loader2 className="w-4 h-4 animate-spin" />}
+              {(refreshStatus === 'loading' || refreshStatus === 'waiting') && <Loader2 className="w-4 h-4 animate-spin" />}
               {refreshStatus === 'started' && <Check className="w-4 h-4 text-green-500" />}
               {refreshStatus === 'done' && invoices.length > 0 && <Check className="w-4 h-4 text-green-500" />}
               {refreshStatus === 'done' && invoices.length === 0 && <AlertCircle className="w-4 h-4 text-amber-500" />}
@@ -116,16 +105,23 @@ export function HomeView({ invoices, stats, refetch, onNext }: HomeViewProps) {
               {refreshStatus === 'idle' && <RefreshCw className="w-4 h-4" />}
               {refreshStatus === 'idle' && 'Odśwież dane'}
               {refreshStatus === 'loading' && 'Uruchamiam...'}
-              {refreshStatus === 'polling' && 'Czekam na dane...'}
+              {refreshStatus === 'waiting' && 'Czekam na dane...'}
               {refreshStatus === 'started' && 'Odświeżanie uruchomione'}
               {refreshStatus === 'done' && invoices.length > 0 && 'Dane zaktualizowane!'}
               {refreshStatus === 'done' && invoices.length === 0 && 'Drive pusty'}
               {refreshStatus === 'error' && 'Błąd'}
             </Button>
 
-            {refreshStatus === 'polling' && (
+            {refreshStatus === 'waiting' && (
               <p className="text-xs text-purple-600 mt-2">
-                Trwa odświeżanie — dane zaktualizują się automatycznie
+                {formatJobProgress(activeJob)
+                  ? `Przetworzono ${formatJobProgress(activeJob)} plików${activeJob?.file ? ` — ${activeJob.file}` : ''}`
+                  : 'Trwa odświeżanie — dane zaktualizują się automatycznie'}
+                {activeJob && (
+                  <button onClick={() => cancelJob(activeJob.id)} className="ml-2 underline cursor-pointer">
+                    Anuluj
+                  </button>
+                )}
               </p>
             )}
             {refreshStatus === 'done' && invoices.length > 0 && (
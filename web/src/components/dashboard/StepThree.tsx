@@ -2,6 +2,8 @@ import { useState } from 'react'
 import { ArrowLeft, ArrowRight, Landmark, Check, Copy, Download, Loader2 } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { playSuccessDing } from '@/lib/sounds'
+import { runJob, formatJobProgress } from '@/lib/jobs'
+import type { Job } from '@/types'
 
 interface StepThreeProps {
   onBack: () => void
@@ -39,13 +41,14 @@ const WLASCICIEL = 'Emilia Chodorowska'
 
 export function StepThree({ onBack, onNext, onHome }: StepThreeProps) {
   const [mergeState, setMergeState] = useState<MergeState>('idle')
+  const [mergeJob, setMergeJob] = useState<Job | null>(null)
 
   const handleMerge = async () => {
     setMergeState('loading')
+    setMergeJob(null)
     try {
-      const res = await fetch('http://localhost:8765/merge-pdfs')
-      const data = await res.json()
-      if (data.status === 'ok') {
+      const job = await runJob('/merge-pdfs', setMergeJob)
+      if (job.state === 'success') {
         setMergeState('done')
         playSuccessDing()
       } else {
@@ -107,7 +110,7 @@ export function StepThree({ onBack, onNext, onHome }: StepThreeProps) {
             <Download className="w-4 h-4 text-gray-400 shrink-0" />
           )}
           <span className={`text-sm ${mergeState === 'done' ? 'text-green-700' : mergeState === 'error' ? 'text-red-600' : 'text-gray-700'}`}>
-            {mergeState === 'loading' ? 'Scalanie...' : mergeState === 'done' ? 'Ściągnięto faktury' : mergeState === 'error' ? 'Błąd — spróbuj ponownie' : 'Ściągnij faktury'}
+            {mergeState === 'loading' ? `Scalanie... ${formatJobProgress(mergeJob)}`.trim() : mergeState === 'done' ? 'Ściągnięto faktury' : mergeState === 'error' ? 'Błąd — spróbuj ponownie' : 'Ściągnij faktury'}
           </span>
         </button>
       </div>
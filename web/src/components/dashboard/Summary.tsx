@@ -3,6 +3,7 @@ import { AlertCircle, ArrowLeft, CircleCheckBig, Check, Copy, ExternalLink, Load
 import { Button } from '@/components/ui/button'
 import { formatPLN, formatDate } from '@/lib/utils'
 import { playSuccessDing } from '@/lib/sounds'
+import { runJob } from '@/lib/jobs'
 import type { Invoice, DashboardStats } from '@/types'
 
 interface SummaryProps {
@@ -77,12 +78,11 @@ export function Summary({ invoices, stats, onBack, onHome }: SummaryProps) {
     setDriveLoading(true)
     setDriveError(null)
     try {
-      const res = await fetch('http://localhost:8765/delete-drive-files')
-      const data = await res.json()
-      if (data.status === 'ok') {
+      const job = await runJob('/delete-drive-files')
+      if (job.state === 'success') {
         setDriveDeleted(true)
         playSuccessDing()
-      } else setDriveError(data.message || 'Nie udało się usunąć')
+      } else setDriveError(job.error || 'Nie udało się usunąć')
     } catch (e) {
       setDriveError(e instanceof Error ? e.message : 'Błąd połączenia')
     }
@@ -1,21 +1,66 @@
-import { useState, useEffect, useMemo } from 'react'
+import { useState, useEffect, useMemo, useCallback, useRef } from 'react'
+import { LOCAL_SERVER } from '@/lib/jobs'
 import type { Invoice, DashboardStats, MonthlyStats } from '@/types'
 
+type InvoicesResponse =
+  | { revision: number; invoices: Invoice[] }
+  | { revision: number; changed: Invoice[]; removed: string[] }
+
+type StatsResponse = DashboardStats & { revision: number }
+
+// Miesiące przychodzą jako 'RRRR-MM' (sortowalne); na wykresie 'styczeń 2025'.
+const monthLabel = (key: string) =>
+  new Date(`${key}-01T00:00:00`).toLocaleDateString('pl-PL', { month: 'long', year: 'numeric' })
+
+const byServiceDate = (a: Invoice, b: Invoice) =>
+  (a.data_wykonania_uslugi || '').localeCompare(b.data_wykonania_uslugi || '')
+
 export function useInvoiceData() {
   const [invoices, setInvoices] = useState<Invoice[]>([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
   const [lastUpdated, setLastUpdated] = useState<Date | null>(null)
+  const revisionRef = useRef<number | null>(null)
+  const byIdRef = useRef(new Map<string, Invoice>())
+  // Agregaty z /stats razem z listą, której dotyczą — faktury dopisane z /events liczymy już lokalnie.
+  const [serverStats, setServerStats] = useState<{ stats: DashboardStats; invoices: Invoice[] } | null>(null)
+
+  // /invoices?since=<rewizja> zwraca tylko różnicę — bez zmian to kilkadziesiąt bajtów zamiast całego pliku.
+  const fetchFromServer = async () => {
+    const since = revisionRef.current
+    const response = await fetch(`${LOCAL_SERVER}/invoices${since !== null ? `?since=${since}` : ''}`)
+    if (!response.ok) throw new Error('Nie udalo sie zaladowac danych')
+    const data: InvoicesResponse = await response.json()
+    if ('invoices' in data) {
+      byIdRef.current = new Map(data.invoices.map(inv => [inv.id!, inv]))
+    } else if (data.changed.length > 0 || data.removed.length > 0) {
+      for (const inv of data.changed) byIdRef.current.set(inv.id!, inv)
+      for (const id of data.removed) byIdRef.current.delete(id)
+    } else if (data.revision === since) {
+      return
+    }
+    revisionRef.current = data.revision
+    const list = Array.from(byIdRef.current.values()).sort(byServiceDate)
+    setInvoices(list)
+    const stats: StatsResponse | null = await fetch(`${LOCAL_SERVER}/stats`)
+      .then(r => (r.ok ? r.json() : null))
+      .catch(() => null)
+    if (stats && stats.revision === data.revision) setServerStats({ stats, invoices: list })
+  }
+
+  // UI bez lokalnego serwera (statyczny hosting): sam plik JSON, rewalidowany przez ETag zamiast ?t=.
+  const fetchStatic = async () => {
+    const response = await fetch(`${import.meta.env.BASE_URL}faktury_dane.json`, { cache: 'no-cache' })
+    if (!response.ok) throw new Error('Nie udalo sie zaladowac danych')
+    const data: Invoice[] = await response.json()
+    revisionRef.current = null
+    setInvoices(data)
+  }
 
   const fetchData = async (silent = false) => {
     if (!silent) setLoading(true)
     try {
-      const response = await fetch(
-        `${import.meta.env.BASE_URL}faktury_dane.json?t=${Date.now()}`
-      )
-      if (!response.ok) throw new Error('Nie udalo sie zaladowac danych')
-      const data: Invoice[] = await response.json()
-      setInvoices(data)
+      await fetchFromServer().catch(fetchStatic)
       setLastUpdated(new Date())
       setError(null)
     } catch (e) {
@@ -27,9 +72,28 @@ export function useInvoiceData() {
 
   const refetch = () => fetchData(true)
 
+  const invoiceKey = (inv: Invoice) => `${inv.numer}|${inv.data_wystawienia}|${inv.kwota_faktury}`
+
+  // Faktury z /events w trakcie odświeżania — pojawiają się w tabeli zanim powstanie faktury_dane.json.
+  const addInvoices = useCallback((incoming: Invoice[]) => {
+    setInvoices(prev => {
+      const known = new Set(prev.map(invoiceKey))
+      const fresh = incoming.filter(inv => !known.has(invoiceKey(inv)))
+      if (fresh.length === 0) return prev
+      return [...prev, ...fresh].sort(byServiceDate)
+    })
+  }, [])
+
   useEffect(() => { fetchData() }, [])
 
   const stats: DashboardStats = useMemo(() => {
+    if (serverStats && serverStats.invoices === invoices) {
+      const { totalAmount, invoiceCount, averageAmount, dateRange, monthlyBreakdown } = serverStats.stats
+      return {
+        totalAmount, invoiceCount, averageAmount, dateRange,
+        monthlyBreakdown: monthlyBreakdown.map(m => ({ ...m, month: monthLabel(m.month) })),
+      }
+    }
     if (invoices.length === 0) {
       return {
         totalAmount: 0,
@@ -49,18 +113,17 @@ export function useInvoiceData() {
 
     const monthMap = new Map<string, { total: number; count: number }>()
     for (const inv of invoices) {
-      const date = new Date(inv.data_wykonania_uslugi)
-      const key = date.toLocaleDateString('pl-PL', { month: 'long', year: 'numeric' })
+      const key = (inv.data_wykonania_uslugi || '').slice(0, 7)
       const existing = monthMap.get(key) || { total: 0, count: 0 }
       monthMap.set(key, { total: existing.total + inv.kwota_faktury, count: existing.count + 1 })
     }
 
-    const monthlyBreakdown: MonthlyStats[] = Array.from(monthMap.entries()).map(
-      ([month, data]) => ({ month, ...data })
-    )
+    const monthlyBreakdown: MonthlyStats[] = Array.from(monthMap.entries())
+      .sort(([a], [b]) => a.localeCompare(b))
+      .map(([month, data]) => ({ month: monthLabel(month), ...data }))
 
     return { totalAmount, invoiceCount, averageAmount, dateRange, monthlyBreakdown }
-  }, [invoices])
+  }, [invoices, serverStats])
 
-  return { invoices, stats, loading, error, lastUpdated, refetch }
+  return { invoices, stats, loading, error, lastUpdated, refetch, addInvoices }
 }
@@ -0,0 +1,28 @@
+import { useEffect, useRef, useState } from 'react'
+import { LOCAL_SERVER } from '@/lib/jobs'
+import type { Invoice, Job } from '@/types'
+
+type JobsByKind = Partial<Record<Job['kind'], Job>>
+
+/** Jedno połączenie SSE z serwerem: ostatnie zadanie każdego rodzaju i faktury z plików na bieżąco. */
+export function useServerEvents(onInvoices?: (invoices: Invoice[]) => void) {
+  const [jobs, setJobs] = useState<JobsByKind>({})
+  const onInvoicesRef = useRef(onInvoices)
+  onInvoicesRef.current = onInvoices
+
+  useEffect(() => {
+    // EventSource sam wznawia połączenie; po wznowieniu serwer wysyła migawkę zadań.
+    const source = new EventSource(`${LOCAL_SERVER}/events`)
+    source.addEventListener('job', (e) => {
+      const job: Job = JSON.parse((e as MessageEvent).data)
+      setJobs(prev => ({ ...prev, [job.kind]: job }))
+    })
+    source.addEventListener('invoices', (e) => {
+      const data: { invoices: Invoice[] } = JSON.parse((e as MessageEvent).data)
+      onInvoicesRef.current?.(data.invoices)
+    })
+    return () => source.close()
+  }, [])
+
+  return { jobs }
+}
@@ -0,0 +1,36 @@
+import type { Job } from '@/types'
+
+export const LOCAL_SERVER = 'http://localhost:8765'
+
+export function formatJobProgress(job: Job | null): string {
+  if (!job || job.done === 0) return ''
+  return job.total ? `${job.done}/${job.total}` : `${job.done}`
+}
+
+/** Startuje zadanie w tle (GET endpoint zwraca { job }) i czeka na jego koniec przez /events, raportując postęp. */
+export async function runJob(endpoint: string, onProgress?: (job: Job) => void): Promise<Job> {
+  const res = await fetch(`${LOCAL_SERVER}${endpoint}`)
+  const data = await res.json()
+  if (!data.job) throw new Error(data.message || 'Nie udało się uruchomić zadania')
+
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(`${LOCAL_SERVER}/events`)
+    source.addEventListener('job', (e) => {
+      const job: Job = JSON.parse((e as MessageEvent).data)
+      if (job.id !== data.job) return
+      if (job.state === 'running') {
+        onProgress?.(job)
+        return
+      }
+      source.close()
+      resolve(job)
+    })
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) reject(new Error('Utracono połączenie z serwerem'))
+    }
+  })
+}
+
+export function cancelJob(id: string) {
+  return fetch(`${LOCAL_SERVER}/jobs/${id}/cancel`)
+}
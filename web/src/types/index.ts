@@ -1,4 +1,5 @@
 export interface Invoice {
+  id?: string
   numer: string
   liczba_uslug: number
   data_wystawienia: string
@@ -21,3 +22,19 @@ export interface DashboardStats {
   dateRange: { from: string; to: string }
   monthlyBreakdown: MonthlyStats[]
 }
+
+export type JobState = 'running' | 'success' | 'failure' | 'cancelled'
+
+export interface Job {
+  id: string
+  kind: 'refresh' | 'merge' | 'delete'
+  state: JobState
+  stage: string | null
+  done: number
+  total: number | null
+  file: string | null
+  stages: Record<string, number>
+  elapsed: number
+  result: Record<string, unknown> | null
+  error: string | null
+}
@@ -1,9 +1,13 @@
 # @title Lokalny Asystent do Przetwarzania Faktur z Dostępem do Dysku Google
 
 import os
-import io
+import argparse
 import json
-from concurrent.futures import ThreadPoolExecutor
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 # Biblioteki Google
@@ -13,22 +17,212 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
 
-# Biblioteki AI i PDF
+# Biblioteka AI
 import anthropic
-import PyPDF2
+
+import dysk
+import ekstrakcja
+import magazyn
 
 # --- ZMIENNE KONFIGURACYJNE ---
 
+# Pliki obok skryptu, niezależnie od cwd — server.py importuje ten moduł i woła go w swoim procesie.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # 1. Ustawienia dostępu do Dysku Google
 SCOPES = ['https://www.googleapis.com/auth/drive']
 FOLDER_NAZWA = 'Faktury logopeda'
-TOKEN_PLIK = 'token.json'
-CREDS_PLIK = 'credentials.json'
+TOKEN_PLIK = os.path.join(SCRIPT_DIR, 'token.json')
+CREDS_PLIK = os.path.join(SCRIPT_DIR, 'credentials.json')
 
 # 2. Plik konfiguracyjny dla klucza API
-CONFIG_PLIK = 'config.json'
+CONFIG_PLIK = os.path.join(SCRIPT_DIR, 'config.json')
+
+# 3. Model AI i cache wyników ekstrakcji
+MODEL = 'claude-sonnet-4-20250514'
+WERSJA_PROMPTU = 6  # podbij przy każdej zmianie promptu — unieważnia wpisy w cache
+CACHE_PLIK = os.path.join(SCRIPT_DIR, 'cache_ekstrakcji.json')
+CACHE_LIMIT_WPISOW = 2000
+MANIFEST_PLIK = os.path.join(SCRIPT_DIR, 'manifest_dysku.json')
+WYNIK_PLIK = os.path.join(SCRIPT_DIR, 'faktury_dane.json')
+BACKFILL_PLIK = os.path.join(SCRIPT_DIR, 'backfill_stan.json')  # id zlecenia Message Batches API w toku
+BACKFILL_INTERWAL = 60  # sekundy między sprawdzeniami stanu zlecenia
+MIN_TOKENOW_CACHE = 1024  # krótszego prefiksu (narzędzia + system) API nie cache'uje
+
+# 4. Potok przetwarzania: liczba wątków na etap i pojemność kolejek między etapami
+WATKI_POBIERANIA = 4
+WATKI_CLAUDE = 16  # górny limit; faktyczną współbieżność ustala KONTROLER
+CEL_LATENCJI_CLAUDE = 30.0  # sekundy; wolniejsze odpowiedzi hamują wzrost współbieżności
+PROBY_CLAUDE = 5
+ROZMIAR_KOLEJKI = 8
+BUDZET_TOKENOW_PACZKI = 12000  # małe dokumenty pakujemy do jednego zapytania; 0 = wyłączone
+MAKS_DOKUMENTOW_W_PACZCE = 10
+OKNO_PACZKI = 0.5  # sekundy, przez które wątek ze slotem Claude dobiera kolejne dokumenty do paczki
+LIMIT_TOKENOW_DOKUMENTU = 8000  # dłuższy tekst jest przycinany przed wysłaniem do Claude
+LINIE_BRZEGU_STRONY = 3  # nagłówek/stopka: tylko tyle linii z góry i z dołu strony może zostać usunięte
+# Kwoty, daty i pola "etykieta: wartość" nie są nigdy usuwane jako nagłówek/stopka — w PDF-ie z kilkoma
+# fakturami z tej samej placówki powtarzają się na każdej stronie, a to dane faktury.
+POLE_FAKTURY = re.compile(r'\d[,.]\d{2}\b|\d{1,4}[-./]\d{1,2}[-./]\d{1,4}|:\s*\S')
+LICZ_TOKENY_PRZEZ_API = False  # True: dokładne liczenie przez count_tokens (dodatkowe zapytanie na dokument)
+PROG_PEWNOSCI_LOKALNEJ = 0.95  # od tej pewności ufamy ekstraktorowi regułowemu; None = zawsze Claude
+
+# 5. Ekstrakcja tekstu z PDF w puli procesów (ekstrakcja.PulaEkstrakcji)
+PROCESY_EKSTRAKCJI = os.cpu_count() or 2
+WATKI_EKSTRAKCJI = PROCESY_EKSTRAKCJI  # ile dokumentów naraz czeka na pulę
+STRONY_NA_ZADANIE = 20  # dłuższe PDF-y dzielimy na zakresy stron
+LIMIT_CZASU_EKSTRAKCJI = 60  # sekundy pracy procesu nad jednym zakresem stron; dłużej = proces ubijany
+PROG_PULI_EKSTRAKCJI = 256 * 1024  # mniejsze PDF-y (typowa faktura) czytane w wątku — bez narzutu procesu
+
+# 6. Raportowanie postępu: server.py podpina własną funkcję, --postep wypisuje zdarzenia na stdout
+RAPORT_POSTEPU = None
+PREFIKS_POSTEPU = '@@postep '  # linie stdout z tym prefiksem to JSON zdarzenia
+
+# 7. Deduplikacja: ta sama faktura z kilku plików (skan + PDF z maila) liczona raz
+SEGMENT_NUMERU = re.compile(r'\d+|[^\W\d_]+')  # ciągi cyfr albo liter; separatory tylko rozdzielają
+MYLONE_ZNAKI = str.maketrans('OQILSBZ', '0011582')  # typowe pomyłki OCR w numerach
+
+
+def raportuj(**zdarzenie):
+    """
+    Zdarzenie postępu: {'etap': nazwa} na początku etapu albo {'gotowe', 'wszystkie', 'plik', 'ok', 'faktury'} po pliku.
+    Wołane tylko z wątku głównego. Wyjątek z RAPORT_POSTEPU przerywa przebieg (anulowanie).
+    """
+    if RAPORT_POSTEPU is not None:
+        RAPORT_POSTEPU(zdarzenie)
+
+
+class CacheEkstrakcji:
+    """Trwały cache: (suma kontrolna PDF-a, model, wersja promptu) -> lista faktur. Eviction LRU."""
+
+    def __init__(self, sciezka=None, limit=CACHE_LIMIT_WPISOW):
+        self.sciezka = sciezka = sciezka or CACHE_PLIK
+        self.limit = limit
+        self.wpisy = OrderedDict()
+        self.trafienia = 0
+        self.chybienia = 0
+        self._lock = threading.Lock()
+        if os.path.exists(sciezka):
+            try:
+                with open(sciezka, 'r', encoding='utf-8') as f:
+                    self.wpisy = OrderedDict(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Ostrzeżenie: nie udało się wczytać cache '{sciezka}', zaczynam od zera. Błąd: {e}")
+
+    @staticmethod
+    def klucz(suma_kontrolna):
+        return f"{suma_kontrolna}:{MODEL}:v{WERSJA_PROMPTU}"
+
+    def pobierz(self, suma_kontrolna):
+        """Zwraca listę faktur z cache albo None. Trafienie przesuwa wpis na koniec kolejki LRU."""
+        if not suma_kontrolna:
+            return None
+        klucz = self.klucz(suma_kontrolna)
+        with self._lock:
+            if klucz in self.wpisy:
+                self.wpisy.move_to_end(klucz)
+                self.trafienia += 1
+                return self.wpisy[klucz]
+            self.chybienia += 1
+            return None
+
+    def dodaj(self, suma_kontrolna, faktury):
+        with self._lock:
+            klucz = self.klucz(suma_kontrolna)
+            self.wpisy[klucz] = faktury
+            self.wpisy.move_to_end(klucz)
+            while len(self.wpisy) > self.limit:
+                self.wpisy.popitem(last=False)
+
+    def zapisz(self):
+        """Atomowy zapis na dysk (tmp + rename) — przerwany proces nie zostawi uciętego pliku."""
+        with self._lock:
+            tmp = self.sciezka + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.wpisy, f, ensure_ascii=False)
+            os.replace(tmp, self.sciezka)
+
+
+class KontrolerWspolbieznosci:
+    """
+    Adaptacyjny limit równoległych zapytań do Claude (AIMD): po każdej „rundzie” udanych
+    zapytań o zdrowej latencji limit rośnie o 1, przy 429/529 spada o połowę, a nowe
+    zapytania czekają do upływu retry-after. Slot należy do wątku: zajmij() w wątku, który już
+    ma slot, czeka tylko na koniec pauzy (etap Claude trzyma slot na całą paczkę, a
+    _zapytaj_claude zajmuje go ponownie przy każdej próbie).
+    """
+
+    def __init__(self, start=2, minimum=1, maksimum=WATKI_CLAUDE, cel_latencji=CEL_LATENCJI_CLAUDE):
+        self.limit = float(start)
+        self.minimum = minimum
+        self.maksimum = maksimum
+        self.cel_latencji = cel_latencji
+        self.w_toku = 0
+        self.wstrzymane_do = 0.0
+        self.zapytania = 0
+        self.ponowienia = 0
+        self.przeciazenia = 0
+        self.bledy = 0
+        self._zajete = {}  # id wątku -> głębokość zagnieżdżenia zajmij()
+        self._warunek = threading.Condition()
+
+    def zajmij(self):
+        watek = threading.get_ident()
+        with self._warunek:
+            while True:
+                pauza = self.wstrzymane_do - time.monotonic()
+                if pauza <= 0 and (watek in self._zajete or self.w_toku < int(self.limit)):
+                    if watek not in self._zajete:
+                        self.w_toku += 1
+                    self._zajete[watek] = self._zajete.get(watek, 0) + 1
+                    return
+                self._warunek.wait(timeout=pauza if pauza > 0 else None)
+
+    def zwolnij(self):
+        watek = threading.get_ident()
+        with self._warunek:
+            self._zajete[watek] -= 1
+            if not self._zajete[watek]:
+                del self._zajete[watek]
+                self.w_toku -= 1
+                self._warunek.notify_all()
+
+    def sukces(self, latencja):
+        with self._warunek:
+            self.zapytania += 1
+            if latencja <= self.cel_latencji:
+                self.limit = min(self.maksimum, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit * 0.9)
+            self._warunek.notify_all()
+
+    def przeciazenie(self, odczekaj, status=None):
+        with self._warunek:
+            self.ponowienia += 1
+            if status in (429, 529):
+                self.przeciazenia += 1
+                self.limit = max(self.minimum, self.limit / 2)
+            self.wstrzymane_do = max(self.wstrzymane_do, time.monotonic() + odczekaj)
+        print(f"⏸️ Claude {status or 'sieć'}: czekam {odczekaj:.1f}s, limit współbieżności {int(self.limit)}")
+
+    def blad(self):
+        with self._warunek:
+            self.bledy += 1
+
+    def statystyki(self):
+        with self._warunek:
+            return {
+                'wspolbieznosc': int(self.limit),
+                'w_toku': self.w_toku,
+                'zapytania': self.zapytania,
+                'ponowienia': self.ponowienia,
+                'przeciazenia': self.przeciazenia,
+                'bledy': self.bledy,
+            }
+
+
+KONTROLER = KontrolerWspolbieznosci()
+
 
 def autoryzuj_dysk_google():
     """OAuth user-flow. Refresh_token w Testing mode wygasa po ~7 dniach — wtedy odpalamy browser."""
@@ -78,203 +272,1079 @@ def skonfiguruj_model_ai():
         if not api_key:
             raise ValueError(f"Nie znaleziono klucza ANTHROPIC_API_KEY w pliku '{CONFIG_PLIK}'.")
 
-        client = anthropic.Anthropic(api_key=api_key)
+        # Ponowienia robi _zapytaj_claude — SDK nie może ich ukrywać przed kontrolerem współbieżności.
+        client = anthropic.Anthropic(api_key=api_key, max_retries=0)
         print("✅ Klient Claude został pomyślnie skonfigurowany.")
         return client
     except Exception as e:
         print(f"BŁĄD: Nie udało się skonfigurować API Claude. Szczegóły: {e}")
         return None
 
-def odczytaj_tekst_z_pliku_pdf(pdf_bytes):
-    """Odczytuje surowy tekst z danych bajtowych pliku PDF."""
-    text = ""
+SEPARATOR_STRON = "\n--- KONIEC STRONY ---\n"
+SEPARATOR_STRON_KOMPAKTOWY = "\n---\n"  # po kompaktuj_tekst — ten opisuje prompt (ZASADY_POL)
+
+
+def odczytaj_tekst_z_pliku_pdf(zrodlo, pula=None, limit_czasu=LIMIT_CZASU_EKSTRAKCJI):
+    """
+    Odczytuje surowy tekst z pliku PDF: `zrodlo` to ścieżka albo bajty.
+    Mniejsze niż PROG_PULI_EKSTRAKCJI czytane są w wątku wywołującym. Większe, z `pula`
+    (ekstrakcja.PulaEkstrakcji), w procesach roboczych: pierwsze zadanie liczy strony i czyta
+    pierwszy zakres, reszta po STRONY_NA_ZADANIE stron, za pierwszymi zakresami innych dokumentów.
+    Zakres, który pracuje dłużej niż `limit_czasu`, porzuca dokument.
+    """
     try:
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PyPDF2.PdfReader(pdf_file)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n--- KONIEC STRONY ---\n" # Dodajemy separator stron
-        return text
+        rozmiar = os.path.getsize(zrodlo) if isinstance(zrodlo, str) else len(zrodlo)
+        if pula is None or rozmiar < PROG_PULI_EKSTRAKCJI:
+            czesci = ekstrakcja.tekst_ze_stron(zrodlo)
+        else:
+            liczba_stron, czesci = pula.zlec(ekstrakcja.pierwszy_zakres, (zrodlo, STRONY_NA_ZADANIE),
+                                             limit_czasu).result()
+            zadania = [pula.zlec(ekstrakcja.tekst_ze_stron, (zrodlo, od, od + STRONY_NA_ZADANIE),
+                                 limit_czasu, priorytet=ekstrakcja.DALSZY_ZAKRES)
+                       for od in range(STRONY_NA_ZADANIE, liczba_stron, STRONY_NA_ZADANIE)]
+            try:
+                for zadanie in zadania:
+                    czesci.extend(zadanie.result())
+            finally:
+                for zadanie in zadania:
+                    zadanie.cancel()  # porzucony dokument nie zajmuje procesów resztą zakresów
+        return "".join(czesc + SEPARATOR_STRON for czesc in czesci)  # Dodajemy separator stron
+    except TimeoutError:
+        print(f"Przekroczono limit {limit_czasu}s na odczyt PDF — pomijam dokument.")
+        return None
     except Exception as e:
         print(f"Błąd podczas odczytu strumienia PDF: {e}")
         return None
 
+_SCHEMAT_FAKTURY = {
+    "type": "object",
+    "properties": {
+        "numer": {"type": "string", "description": "numer faktury, np. 01/05/2025"},
+        "liczba_uslug": {"type": "integer", "description": "ilość usług, zazwyczaj 1"},
+        "data_wystawienia": {"type": "string", "description": "data wystawienia w formacie YYYY-MM-DD"},
+        "data_wykonania_uslugi": {"type": "string",
+                                  "description": "data sprzedaży/wykonania usługi w formacie YYYY-MM-DD"},
+        "miasto_wykonania": {"type": ["string", "null"], "description": "miasto wykonania usługi, np. Szczecin"},
+        "cena_jednostkowa": {"type": ["number", "null"], "description": "cena netto za jedną usługę, np. 130.00"},
+        "kwota_faktury": {"type": "number", "description": "łączna kwota do zapłaty/brutto, np. 130.00"},
+    },
+    "required": ["numer", "liczba_uslug", "data_wystawienia", "data_wykonania_uslugi",
+                 "miasto_wykonania", "cena_jednostkowa", "kwota_faktury"],
+}
+
+NARZEDZIE_FAKTURY = {
+    "name": "zapisz_faktury",
+    "description": "Zapisuje wszystkie faktury znalezione w dokumencie (pusta lista, jeśli nie ma żadnej).",
+    "input_schema": {
+        "type": "object",
+        "properties": {"faktury": {"type": "array", "items": _SCHEMAT_FAKTURY}},
+        "required": ["faktury"],
+    },
+}
+
+NARZEDZIE_FAKTURY_ZBIORCZE = {
+    "name": "zapisz_faktury_dokumentow",
+    "description": "Zapisuje faktury z każdego dokumentu osobno, pod id dokumentu.",
+    "input_schema": {
+        "type": "object",
+        "properties": {"dokumenty": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"id": {"type": "string"}, "faktury": {"type": "array", "items": _SCHEMAT_FAKTURY}},
+            "required": ["id", "faktury"],
+        }}},
+        "required": ["dokumenty"],
+    },
+}
+
+
+_DATA = r'(\d{4}-\d{2}-\d{2}|\d{2}[./-]\d{2}[./-]\d{4})'
+_KWOTA = r'(\d{1,3}(?:[ \u00a0]?\d{3})*[.,]\d{2})'
+_WZORCE = {
+    'numer': re.compile(r'Faktura(?:\s+VAT)?\s*(?:nr|numer)\.?\s*:?\s*([A-Z0-9][\w/-]*\d)', re.IGNORECASE),
+    'liczba_uslug': re.compile(r'(?:Ilo[śs][ćc]|Liczba)(?:\s+us[łl]ug)?\s*:?\s*(\d{1,3})\b', re.IGNORECASE),
+    'data_wystawienia': re.compile(r'Data\s+wystawienia\s*:?\s*' + _DATA, re.IGNORECASE),
+    'data_wykonania_uslugi': re.compile(
+        r'Data\s+(?:sprzeda[żz]y|wykonania(?:\s+us[łl]ugi)?|zako[ńn]czenia\s+(?:dostawy|us[łl]ugi))\s*:?\s*' + _DATA,
+        re.IGNORECASE),
+    'miasto_wykonania': re.compile(
+        r'Miejsce\s+(?:wystawienia|wykonania(?:\s+us[łl]ugi)?)\s*:?\s*([A-ZĄĆĘŁŃÓŚŹŻ][a-ząćęłńóśźż-]+)'),
+    'cena_jednostkowa': re.compile(r'Cena\s+(?:jedn\.?|jednostkowa)(?:\s+netto)?\s*:?\s*' + _KWOTA, re.IGNORECASE),
+    'kwota_faktury': re.compile(r'(?:Razem\s+|Kwota\s+)?do\s+zap[łl]aty\s*:?\s*' + _KWOTA, re.IGNORECASE),
+}
+# Waga pola w ocenie pewności; suma = 1.0.
+_WAGI_POL = {'numer': 0.2, 'data_wystawienia': 0.15, 'data_wykonania_uslugi': 0.15, 'miasto_wykonania': 0.1,
+             'cena_jednostkowa': 0.1, 'kwota_faktury': 0.25, 'liczba_uslug': 0.05}
+
+
+def _data_iso(tekst):
+    if tekst[4] == '-':  # już RRRR-MM-DD; '31-05-2025' też ma '-' na początku
+        return tekst
+    dzien, miesiac, rok = re.split(r'[./-]', tekst)
+    return f"{rok}-{miesiac}-{dzien}"
+
+
+def _kwota(tekst):
+    return float(tekst.replace(' ', '').replace('\u00a0', '').replace(',', '.'))
+
+
+def wyodrebnij_lokalnie(tekst):
+    """
+    Deterministyczny ekstraktor regułowy dla stałego układu faktur z gabinetu.
+    Zwraca (lista faktur w schemacie Claude, pewność 0..1). Dokument z kilkoma
+    numerami faktur dostaje pewność 0 — takie zawsze idą do Claude.
+    """
+    numery = {m.group(1) for m in _WZORCE['numer'].finditer(tekst)}
+    if len(numery) != 1:
+        return [], 0.0
+    faktura = {}
+    pewnosc = 0.0
+    for pole, wzorzec in _WZORCE.items():
+        dopasowanie = wzorzec.search(tekst)
+        wartosc = None
+        if dopasowanie:
+            surowa = dopasowanie.group(1)
+            try:
+                if pole.startswith('data_'):
+                    wartosc = datetime.strptime(_data_iso(surowa), '%Y-%m-%d').strftime('%Y-%m-%d')
+                elif pole in ('cena_jednostkowa', 'kwota_faktury'):
+                    wartosc = _kwota(surowa)
+                elif pole == 'liczba_uslug':
+                    wartosc = int(surowa)
+                else:
+                    wartosc = surowa
+            except ValueError:
+                wartosc = None
+        if wartosc is not None:
+            pewnosc += _WAGI_POL[pole]
+        faktura[pole] = wartosc
+    if faktura['liczba_uslug'] is None:
+        faktura['liczba_uslug'] = 1
+    # Spójność kwot: liczba x cena musi dać kwotę faktury, inaczej coś źle dopasowaliśmy.
+    if faktura['cena_jednostkowa'] is not None and faktura['kwota_faktury'] is not None:
+        if abs(faktura['cena_jednostkowa'] * faktura['liczba_uslug'] - faktura['kwota_faktury']) > 0.01:
+            pewnosc -= 0.3
+    return [faktura], round(max(0.0, pewnosc), 2)
+
+
+def waliduj_faktury(faktury):
+    """
+    Sprawdza i normalizuje typy pól faktur z odpowiedzi modelu.
+    Zwraca (lista znormalizowanych faktur, lista błędów); błędy nadają się do komunikatu naprawczego.
+    """
+    if not isinstance(faktury, list):
+        return [], ["'faktury' musi być listą"]
+    wynik, bledy = [], []
+    for i, faktura in enumerate(faktury, start=1):
+        if not isinstance(faktura, dict):
+            bledy.append(f"faktura {i}: oczekiwano obiektu")
+            continue
+        f = {}
+        numer = faktura.get('numer')
+        f['numer'] = str(numer).strip() if numer not in (None, '') else None
+        if not f['numer']:
+            bledy.append(f"faktura {i}: brak numeru")
+        try:
+            f['liczba_uslug'] = int(faktura.get('liczba_uslug') or 1)
+        except (TypeError, ValueError):
+            bledy.append(f"faktura {i}: liczba_uslug musi być liczbą całkowitą")
+        for pole in ('data_wystawienia', 'data_wykonania_uslugi'):
+            try:
+                f[pole] = datetime.strptime(str(faktura.get(pole)), '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                bledy.append(f"faktura {i}: {pole} musi mieć format YYYY-MM-DD (jest {faktura.get(pole)!r})")
+        f['miasto_wykonania'] = faktura.get('miasto_wykonania') or None
+        for pole, wymagane in (('cena_jednostkowa', False), ('kwota_faktury', True)):
+            wartosc = faktura.get(pole)
+            try:
+                f[pole] = _kwota(wartosc) if isinstance(wartosc, str) else (
+                    float(wartosc) if wartosc is not None else None)
+            except ValueError:
+                f[pole] = None
+            if f[pole] is None and (wymagane or wartosc is not None):
+                bledy.append(f"faktura {i}: {pole} musi być liczbą (jest {wartosc!r})")
+        wynik.append(f)
+    return wynik, bledy
+
+
+def szacuj_tokeny(tekst):
+    """Zgrubny, lokalny szacunek tokenów wejściowych (polski tekst: ~3 znaki na token)."""
+    return len(tekst) // 3 + 1
+
+
+def policz_tokeny(client, *teksty):
+    """
+    Tokeny tekstów jedną miarą: wszystkie przez endpoint count_tokens (LICZ_TOKENY_PRZEZ_API)
+    albo — także gdy API zawiedzie przy którymkolwiek — wszystkie lokalnym szacunkiem.
+    """
+    if LICZ_TOKENY_PRZEZ_API and client is not None:
+        try:
+            return [client.messages.count_tokens(
+                model=MODEL, messages=[{"role": "user", "content": tekst}]).input_tokens for tekst in teksty]
+        except Exception as e:
+            print(f"Ostrzeżenie: count_tokens niedostępne, używam szacunku. Błąd: {e}")
+    return [szacuj_tokeny(tekst) for tekst in teksty]
+
+
+def kompaktuj_tekst(tekst, client=None, limit_tokenow=LIMIT_TOKENOW_DOKUMENTU):
+    """
+    Odchudza surowy tekst z PyPDF2 przed wysłaniem: zwija białe znaki, usuwa puste linie,
+    zostawia tylko pierwsze wystąpienie nagłówków/stopek (linie z brzegu każdej strony, bez pól
+    faktury — patrz POLE_FAKTURY) i skraca dokument do `limit_tokenow`.
+    Zwraca (tekst, tokeny_przed, tokeny_po) — obie liczby tą samą miarą (policz_tokeny).
+    """
+    strony = []
+    for strona in tekst.split(SEPARATOR_STRON):
+        linie = [re.sub(r'\s+', ' ', linia).strip() for linia in strona.splitlines()]
+        linie = [linia for linia in linie if linia]
+        if linie:
+            strony.append(linie)
+
+    def brzeg(linie):
+        return set(linie[:LINIE_BRZEGU_STRONY] + linie[-LINIE_BRZEGU_STRONY:])
+
+    if len(strony) > 1:
+        wystapienia = {}
+        for linie in strony:
+            for linia in brzeg(linie):
+                wystapienia[linia] = wystapienia.get(linia, 0) + 1
+        powtarzane = {linia for linia, ile in wystapienia.items()
+                      if ile == len(strony) and len(linia) >= 15 and not POLE_FAKTURY.search(linia)}
+        for linie in strony[1:]:
+            n = len(linie)
+            linie[:] = [linia for j, linia in enumerate(linie)
+                        if linia not in powtarzane or LINIE_BRZEGU_STRONY <= j < n - LINIE_BRZEGU_STRONY]
+
+    wynik = SEPARATOR_STRON_KOMPAKTOWY.join("\n".join(linie) for linie in strony)
+    tokeny_przed, tokeny_po = policz_tokeny(client, tekst, wynik)
+    if tokeny_po > limit_tokenow:
+        wynik = wynik[:len(wynik) * limit_tokenow // tokeny_po] + "\n[... dalsza część dokumentu pominięta ...]"
+        tokeny_przed, tokeny_po = policz_tokeny(client, tekst, wynik)
+    return wynik, tokeny_przed, tokeny_po
+
+
+def _retry_after(blad):
+    """Sekundy z nagłówka retry-after odpowiedzi 429/529 albo None."""
+    try:
+        return float(blad.response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _zapytaj_claude(client, **parametry):
+    """
+    client.messages.create przez KONTROLER: czeka na wolny slot współbieżności, a przy
+    429/529/5xx i błędach sieci zgłasza przeciążenie i ponawia (do PROBY_CLAUDE razy).
+    """
+    for proba in range(1, PROBY_CLAUDE + 1):
+        KONTROLER.zajmij()
+        start = time.monotonic()
+        try:
+            odpowiedz = client.messages.create(**parametry)
+        except anthropic.APIStatusError as e:
+            if (e.status_code not in (429, 529) and e.status_code < 500) or proba == PROBY_CLAUDE:
+                KONTROLER.blad()
+                raise
+            KONTROLER.przeciazenie(_retry_after(e) or min(60, 2 ** proba), status=e.status_code)
+            continue
+        except anthropic.APIConnectionError:
+            if proba == PROBY_CLAUDE:
+                KONTROLER.blad()
+                raise
+            KONTROLER.przeciazenie(min(60, 2 ** proba))
+            continue
+        except Exception:
+            KONTROLER.blad()
+            raise
+        finally:
+            # Każde wyjście z próby oddaje slot — KONTROLER żyje tyle co proces serwera.
+            KONTROLER.zwolnij()
+        KONTROLER.sukces(time.monotonic() - start)
+        return odpowiedz
+
+
+ZASADY_POL = """
+    Zasady dla poszczególnych pól faktury:
+    - numer: przepisz numer dokładnie tak, jak na fakturze, razem z ukośnikami, myślnikami i zerami wiodącymi (np. "01/05/2025", "FV 7/2025", "12-2025-LOG"). Nie dopisuj słowa "Faktura", "nr" ani "VAT". Jeśli ten sam numer pojawia się w nagłówku i stopce, to nadal jest jedna faktura.
+    - liczba_uslug: liczba z kolumny "Ilość" / "Ilość usług" / "Liczba sesji". Jeśli faktura ma kilka pozycji tej samej usługi, zsumuj ilości. Brak kolumny ilości oznacza 1.
+    - data_wystawienia: data przy etykiecie "Data wystawienia" lub "Wystawiono dnia". Zawsze zapisuj jako YYYY-MM-DD, także gdy w tekście jest "31.05.2025", "31-05-2025", "31/05/2025" albo "31 maja 2025 r.". W polskich fakturach dzień stoi przed miesiącem.
+    - data_wykonania_uslugi: data przy etykiecie "Data wykonania usługi", "Data sprzedaży", "Data zakończenia dostawy/usługi" albo okres rozliczeniowy. Dla okresu (np. "maj 2025" lub "01.05.2025 - 31.05.2025") podaj ostatni dzień okresu. Jeśli faktura nie podaje tej daty osobno, użyj daty wystawienia.
+    - miasto_wykonania: miasto, w którym wykonano usługę; zwykle stoi obok daty ("Szczecin, dnia 31.05.2025") albo w polu "Miejsce wystawienia". Nie bierz miasta z adresu nabywcy. Podaj samą nazwę miasta, bez kodu pocztowego i ulicy.
+    - cena_jednostkowa: cena netto jednej usługi z kolumny "Cena jedn." / "Cena netto". Gdy jest tylko kwota łączna i ilość, podziel kwotę przez ilość. Gdy nie da się jej ustalić, użyj null.
+    - kwota_faktury: łączna kwota brutto do zapłaty ("Do zapłaty", "Razem", "Wartość brutto", "Suma"). Nie myl jej z ceną jednostkową ani z kwotą podatku. Kwotę słownie ("sto trzydzieści złotych 00/100") traktuj tylko jako potwierdzenie liczby.
+
+    Zasady dla kwot: zapisuj liczby z kropką dziesiętną i bez separatorów tysięcy, bez waluty: "1 250,00 zł" to 1250.00, "130,00 PLN" to 130.00, "99,99" to 99.99. Zwolnienie z VAT ("zw.", "ZW", "art. 43 ust. 1") oznacza, że kwota netto równa się brutto.
+
+    Zasady dla tekstu z PDF: odczyt może rozbić jedną linię na kilka, skleić sąsiednie kolumny tabeli ("Ilość1Cena130,00") albo zgubić polskie znaki ("uslugi", "zaplaty"). Strony dokumentu są rozdzielone linią zawierającą tylko "---"; faktura może zaczynać się na jednej stronie i kończyć na następnej. Powtarzające się na każdej stronie nagłówki i stopki (nazwa gabinetu, adres, numer konta, "Strona 1 z 3") nie są osobnymi fakturami. Osobną fakturą jest każdy blok z własnym numerem faktury. Korekta faktury lub duplikat z tym samym numerem nie są nową fakturą, jeśli kwota i daty się zgadzają.
+
+    Przykład. Fragment tekstu:
+    Gabinet Logopedyczny, ul. Przykladowa 1, 70-001 Szczecin
+    FAKTURA nr 03/05/2025 Szczecin, dnia 31.05.2025
+    Data wykonania uslugi: 30.05.2025
+    Terapia logopedyczna Ilosc: 4 Cena jedn.: 130,00 zl Wartosc: 520,00 zl
+    Do zaplaty: 520,00 zl Slownie: piecset dwadziescia zlotych 00/100
+    daje jedną fakturę: numer "03/05/2025", liczba_uslug 4, data_wystawienia "2025-05-31", data_wykonania_uslugi "2025-05-30", miasto_wykonania "Szczecin", cena_jednostkowa 130.00, kwota_faktury 520.00.
+    Nie wymyślaj wartości: każda liczba i data w wyniku musi pochodzić z tekstu dokumentu albo wynikać z reguł powyżej (np. cena jednostkowa z kwoty i ilości).
+    """
+
+INSTRUKCJE_EKSTRAKCJI = """
+    Przeanalizuj tekst dokumentu z wiadomości użytkownika, który może zawierać jedną lub więcej faktur. Tekst może być chaotyczny z powodu błędów w odczycie PDF. Postaraj się zidentyfikować kluczowe informacje mimo to.
+    Dla KAŻDEJ znalezionej faktury wyodrębnij dane opisane w schemacie narzędzia zapisz_faktury i zapisz je tym narzędziem, nawet jeśli w tekście jest tylko jedna faktura.
+    Jeśli nie znajdziesz żadnych faktur, wywołaj narzędzie z pustą listą.
+    Jeśli jakaś opcjonalna dana w konkretnej fakturze nie jest dostępna, użyj wartości null. Zwróć szczególną uwagę na daty i kwoty.
+    """ + ZASADY_POL
+
+INSTRUKCJE_EKSTRAKCJI_ZBIORCZEJ = """
+    Wiadomość użytkownika zawiera kilka osobnych dokumentów, każdy w znaczniku <dokument id="...">. Każdy może zawierać jedną lub więcej faktur. Tekst może być chaotyczny z powodu błędów w odczycie PDF.
+    Dla KAŻDEJ faktury w KAŻDYM dokumencie wyodrębnij dane opisane w schemacie narzędzia zapisz_faktury_dokumentow. Nie mieszaj danych między dokumentami.
+    Zapisz wynik narzędziem, podając każdy dokument z jego id; dokument bez faktur ma pustą listę faktur.
+    Jeśli jakaś opcjonalna dana w konkretnej fakturze nie jest dostępna, użyj wartości null. Zwróć szczególną uwagę na daty i kwoty.
+    """ + ZASADY_POL
+
+
+class LicznikTokenow:
+    """Sumuje usage z odpowiedzi Claude: ile wejścia poszło z cache promptu, a ile bez."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.resetuj()
+
+    def resetuj(self):
+        with self._lock:
+            self.wejsciowe = 0
+            self.z_cache = 0
+            self.zapis_cache = 0
+            self.wyjsciowe = 0
+
+    def dodaj(self, usage):
+        with self._lock:
+            self.wejsciowe += getattr(usage, 'input_tokens', 0) or 0
+            self.z_cache += getattr(usage, 'cache_read_input_tokens', 0) or 0
+            self.zapis_cache += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            self.wyjsciowe += getattr(usage, 'output_tokens', 0) or 0
+
+    def podsumowanie(self):
+        with self._lock:
+            return (f"wejście bez cache {self.wejsciowe}, odczyt z cache {self.z_cache}, "
+                    f"zapis do cache {self.zapis_cache}, wyjście {self.wyjsciowe}")
+
+
+TOKENY = LicznikTokenow()
+
+
+def _parametry_zapytania(instrukcje, narzedzie, tresc, max_tokens):
+    """
+    Stałe instrukcje i schemat narzędzia idą jako prefiks z cache_control (prompt caching),
+    zmienny jest tylko tekst dokumentu. Odpowiedź wymuszona jako wywołanie `narzedzie`.
+    API cache'uje prefiks dopiero od MIN_TOKENOW_CACHE tokenów — stąd pełne ZASADY_POL
+    w instrukcjach (sprawdzenie na żywym API: bench/cache_promptu.py).
+    """
+    return {
+        'model': MODEL,
+        'max_tokens': max_tokens,
+        'tools': [narzedzie],
+        'tool_choice': {"type": "tool", "name": narzedzie['name']},
+        'system': [{"type": "text", "text": instrukcje, "cache_control": {"type": "ephemeral"}}],
+        'messages': [{"role": "user", "content": tresc}],
+    }
+
+
+def _parametry_faktury(tekst_faktury):
+    return _parametry_zapytania(INSTRUKCJE_EKSTRAKCJI, NARZEDZIE_FAKTURY,
+                                f"--- TEKST DOKUMENTU ---\n{tekst_faktury}", 4096)
+
+
+def _blok_narzedzia(tresc_odpowiedzi):
+    for blok in tresc_odpowiedzi:
+        if getattr(blok, 'type', None) == 'tool_use':
+            return blok
+    raise ValueError("Odpowiedź bez wywołania narzędzia")
+
+
+def _wywolaj_narzedzie(client, parametry):
+    response = _zapytaj_claude(client, **parametry)
+    TOKENY.dodaj(getattr(response, 'usage', None))
+    return _blok_narzedzia(response.content)
+
+
 def wyodrebnij_dane_z_faktury(client, tekst_faktury):
     """
     Wysyła tekst do AI w celu ekstrakcji danych.
-    Zwraca listę obiektów JSON, po jednym dla każdej znalezionej faktury.
-    """
-    prompt = f"""
-    Przeanalizuj poniższy tekst, który może zawierać jedną lub więcej faktur. Tekst może być chaotyczny z powodu błędów w odczycie PDF. Postaraj się zidentyfikować kluczowe informacje mimo to.
-    Dla KAŻDEJ znalezionej faktury wyodrębnij następujące dane.
-    Zwróć odpowiedź WYŁĄCZNIE w formacie JSON, jako tablicę (listę) obiektów, nawet jeśli w tekście jest tylko jedna faktura.
-    Jeśli nie znajdziesz żadnych faktur, zwróć pustą tablicę [].
-
-    Struktura każdego obiektu w tablicy:
-    {{
-      "numer": "string (numer faktury, np. 01/05/2025)",
-      "liczba_uslug": "integer (ilość usług, zazwyczaj 1)",
-      "data_wystawienia": "string (w formacie YYYY-MM-DD)",
-      "data_wykonania_uslugi": "string (data sprzedaży/wykonania usługi w formacie YYYY-MM-DD)",
-      "miasto_wykonania": "string (miasto wykonania usługi, np. Szczecin)",
-      "cena_jednostkowa": "float (cena netto za jedną usługę, np. 130.00)",
-      "kwota_faktury": "float (łączna kwota do zapłaty/brutto, np. 130.00)"
-    }}
-
-    Jeśli jakaś dana w konkretnej fakturze nie jest dostępna, użyj wartości null. Zwróć szczególną uwagę na daty i kwoty.
-
-    --- TEKST DOKUMENTU ---
-    {tekst_faktury}
-    """
-    cleaned_response = ""
+    Zwraca listę faktur (dict), po jednej dla każdej znalezionej faktury, albo None przy błędzie.
+    Gdy walidacja pól się nie powiedzie, robi jedną próbę naprawczą: odsyła modelowi
+    jego wywołanie narzędzia z listą błędów jako tool_result.
+    """
+    parametry = _parametry_faktury(tekst_faktury)
     try:
-        response = client.messages.create(
-            model='claude-sonnet-4-20250514',
-            max_tokens=4096,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        cleaned_response = response.content[0].text.strip().replace("```json", "").replace("```", "").strip()
-        # Spodziewamy się listy obiektów
-        return json.loads(cleaned_response)
+        blok = _wywolaj_narzedzie(client, parametry)
+        faktury, bledy = waliduj_faktury(blok.input.get('faktury'))
+        if bledy:
+            print(f"⚠️ Walidacja nieudana ({'; '.join(bledy)}) — prośba o poprawkę")
+            parametry['messages'] = parametry['messages'] + [
+                {"role": "assistant", "content": [
+                    {"type": "tool_use", "id": blok.id, "name": blok.name, "input": blok.input}]},
+                {"role": "user", "content": [
+                    {"type": "tool_result", "tool_use_id": blok.id, "is_error": True,
+                     "content": "Popraw dane i wywołaj narzędzie ponownie. Błędy: " + "; ".join(bledy)}]},
+            ]
+            blok = _wywolaj_narzedzie(client, parametry)
+            faktury, bledy = waliduj_faktury(blok.input.get('faktury'))
+            if bledy:
+                print(f"Błąd walidacji po poprawce: {'; '.join(bledy)}")
+                return None
+        return faktury
     except Exception as e:
-        print(f"Błąd podczas komunikacji z API Claude lub parsowania JSON: {e}")
-        print(f"Otrzymana odpowiedź od AI (nieudane parsowanie): \n---\n{cleaned_response}\n---")
+        print(f"Błąd podczas komunikacji z API Claude lub walidacji odpowiedzi: {e}")
         return None # Zwracamy None w przypadku błędu
 
-def przetwarzaj_faktury_z_dysku(drive_service, client):
-    """Główna funkcja orkiestrująca cały proces."""
-    output_json_path = 'faktury_dane.json'
-    wszystkie_faktury = []
 
+def wyodrebnij_dane_z_wielu_faktur(client, dokumenty):
+    """
+    Jedno zapytanie do AI dla kilku dokumentów [(id, tekst), ...].
+    Zwraca {id: lista faktur}; dokumentów, których nie udało się rozdzielić
+    lub zwalidować, w słowniku brak (idą potem pojedynczo, z próbą naprawczą).
+    """
+    bloki = "\n".join(f'<dokument id="{id_dok}">\n{tekst}\n</dokument>' for id_dok, tekst in dokumenty)
     try:
-        # 1. Znajdź ID folderu
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{FOLDER_NAZWA}' and trashed=false"
-        results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-        items = results.get('files', [])
+        blok = _wywolaj_narzedzie(client, _parametry_zapytania(
+            INSTRUKCJE_EKSTRAKCJI_ZBIORCZEJ, NARZEDZIE_FAKTURY_ZBIORCZE, bloki, 8192))
+    except Exception as e:
+        print(f"Błąd zapytania zbiorczego do Claude ({len(dokumenty)} dok.): {e}")
+        return {}
+    wynik = {}
+    for dokument in blok.input.get('dokumenty') or []:
+        if not isinstance(dokument, dict):
+            continue
+        faktury, bledy = waliduj_faktury(dokument.get('faktury'))
+        if not bledy:
+            wynik[dokument.get('id')] = faktury
+    return wynik
 
-        if not items:
-            print(f"BŁĄD: Nie znaleziono folderu o nazwie '{FOLDER_NAZWA}' na Twoim Dysku Google.")
-            return None
 
-        folder_id = items[0]['id']
-        print(f"Znaleziono folder '{items[0]['name']}' (ID: {folder_id})")
+def wczytaj_manifest():
+    """Manifest ostatniej synchronizacji: token Changes API + stan każdego pliku z folderu."""
+    pusty = {'folder_id': None, 'start_page_token': None, 'pliki': {}}
+    if not os.path.exists(MANIFEST_PLIK):
+        return pusty
+    try:
+        with open(MANIFEST_PLIK, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return {**pusty, **manifest}
+    except (OSError, ValueError) as e:
+        print(f"Ostrzeżenie: uszkodzony manifest '{MANIFEST_PLIK}', robię pełną synchronizację. Błąd: {e}")
+        return pusty
+
+
+def zapisz_manifest(manifest):
+    tmp = MANIFEST_PLIK + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST_PLIK)
+
+
+def pobierz_zmiany_z_dysku(drive_service, folder_id, manifest):
+    """
+    Delta od ostatniego przebiegu przez Drive Changes API.
+    Zwraca (pliki_do_przetworzenia, id_usunietych, nowy_start_page_token).
+    """
+    token = manifest['start_page_token']
+    znane = manifest['pliki']
+    zmienione = {}
+    usuniete = set()
+    nowy_token = token
+    while token:
+        odp = drive_service.changes().list(
+            pageToken=token, spaces='drive', pageSize=1000,
+            fields="nextPageToken, newStartPageToken, "
+                   "changes(fileId, removed, file(id, name, mimeType, parents, trashed, md5Checksum, modifiedTime))"
+        ).execute()
+        for zmiana in odp.get('changes', []):
+            file_id = zmiana.get('fileId')
+            plik = zmiana.get('file') or {}
+            w_folderze = (not zmiana.get('removed') and not plik.get('trashed')
+                          and folder_id in plik.get('parents', [])
+                          and plik.get('mimeType') == 'application/pdf')
+            if not w_folderze:
+                zmienione.pop(file_id, None)
+                if file_id in znane:
+                    usuniete.add(file_id)
+                continue
+            usuniete.discard(file_id)
+            wpis = znane.get(file_id)
+            if wpis and wpis.get('md5Checksum') == plik.get('md5Checksum') and wpis.get('faktury') is not None:
+                # Sama zmiana metadanych (np. nazwy) — treść bez zmian.
+                wpis['name'] = plik.get('name', wpis.get('name'))
+                wpis['modifiedTime'] = plik.get('modifiedTime', wpis.get('modifiedTime'))
+                continue
+            zmienione[file_id] = plik
+        if 'newStartPageToken' in odp:
+            nowy_token = odp['newStartPageToken']
+            break
+        token = odp.get('nextPageToken')
+
+    # Pliki, których poprzednio nie udało się sparsować, ponawiamy mimo braku zmian.
+    for file_id, wpis in znane.items():
+        if wpis.get('faktury') is None and file_id not in zmienione and file_id not in usuniete:
+            zmienione[file_id] = {'id': file_id, 'name': wpis.get('name'),
+                                  'md5Checksum': wpis.get('md5Checksum'), 'modifiedTime': wpis.get('modifiedTime')}
+    return list(zmienione.values()), usuniete, nowy_token
+
+
+_KONIEC = object()  # znacznik końca strumienia w kolejkach potoku
+
+
+def _pobierz_pdf(drive_service, plik):
+    """PDF przez wspólny magazyn blobów (pobiera tylko przy braku lokalnej kopii). Zwraca (uchwyt, suma kontrolna)."""
+    print(f"--- Pobieram: {plik['name']} ---")
+    fh = dysk.MAGAZYN.otworz(drive_service, plik, http=dysk.http_watku(drive_service))
+    return fh, plik.get('md5Checksum') or dysk.sha256_pliku(fh)
+
+
+def _zrodlo_pdf(plik, fh):
+    """
+    Co dostaje proces ekstrakcji: ścieżkę bloba z dysk.MAGAZYN (czyta plik sam, bez kopii bajtów
+    w potoku i w pickle), a dla pliku spoza magazynu (bez md5 albo już przycięty) — treść uchwytu.
+    """
+    sciezka = dysk.MAGAZYN.sciezka(plik)
+    if sciezka and os.path.exists(sciezka):
+        return sciezka
+    return fh.read()
+
+
+def _pobierz_lub_z_cache(drive_service, plik, cache):
+    """
+    Zwraca (faktury z cache | None, uchwyt | None, suma kontrolna). Z md5Checksum cache sprawdzany
+    jest przed pobraniem; bez niego (np. pliki Google) — po pobraniu, po SHA-256 treści.
+    """
+    dane = cache.pobierz(plik.get('md5Checksum'))
+    if dane is not None:
+        return dane, None, plik['md5Checksum']
+    fh, suma_kontrolna = _pobierz_pdf(drive_service, plik)
+    if not plik.get('md5Checksum'):
+        dane = cache.pobierz(suma_kontrolna)
+        if dane is not None:
+            fh.close()
+            return dane, None, suma_kontrolna
+    return None, fh, suma_kontrolna
+
+
+def _etap(funkcja, wejscie, wyjscie, liczba_watkow, wyniki, budzet=None, koszt=None, slot=None, okno=0):
+    """
+    Startuje `liczba_watkow` wątków jednego etapu potoku. Każdy czyta z `wejscie`,
+    a wynik funkcji (jeśli nie None) wkłada do `wyjscie`. Elementy to krotki (plik, ...);
+    wyjątek kończy dany plik wpisem (plik, None) w `wyniki`. Ostatni wątek przekazuje _KONIEC dalej.
+    Z `budzet` wątek dobiera z kolejki to, co czeka albo przyjdzie w ciągu `okno` sekund,
+    do łącznego `koszt` <= budzet — wtedy funkcja dostaje listę elementów i zwraca listę wyników.
+    Z `slot` (KONTROLER) wątek zajmuje slot, ZANIM weźmie element: wolne wątki nie rozbierają
+    kolejki po jednym elemencie, więc to, co przyszło w czasie trwających zapytań, trafia do jednej paczki.
+    """
+    pozostale = [liczba_watkow]
+    lock = threading.Lock()
+
+    def _paczka(pierwszy):
+        paczka, suma, odlozony = [pierwszy], koszt(pierwszy), None
+        termin = time.monotonic() + okno
+        while len(paczka) < MAKS_DOKUMENTOW_W_PACZCE:
+            try:
+                nastepny = wejscie.get(timeout=max(0, termin - time.monotonic()))
+            except queue.Empty:
+                break
+            if nastepny is _KONIEC or suma + koszt(nastepny) > budzet:
+                odlozony = nastepny
+                break
+            paczka.append(nastepny)
+            suma += koszt(nastepny)
+        return paczka, odlozony
 
-        # 2. Wylistuj pliki PDF w folderze
-        query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
-        results = drive_service.files().list(q=query, pageSize=100, fields="files(id, name)").execute()
-        pliki = results.get('files', [])
+    def _watek():
+        odlozony = None
+        while True:
+            if slot is not None:
+                slot.zajmij()
+            try:
+                element, odlozony = (odlozony, None) if odlozony is not None else (wejscie.get(), None)
+                if element is _KONIEC:
+                    wejscie.put(_KONIEC)  # obudź pozostałe wątki tego etapu
+                    break
+                paczka = [element]
+                try:
+                    if budzet is None:
+                        rezultaty = [funkcja(element)]
+                    else:
+                        paczka, odlozony = _paczka(element)
+                        rezultaty = funkcja(paczka)
+                except Exception as e:
+                    for el in paczka:
+                        print(f"❌ {el[0]['name']}: {e}")
+                        wyniki.put((el[0], None))
+                    continue
+            finally:
+                if slot is not None:
+                    slot.zwolnij()
+            for wynik in rezultaty:
+                if wynik is not None:
+                    wyjscie.put(wynik)
+        with lock:
+            pozostale[0] -= 1
+            ostatni = pozostale[0] == 0
+        if ostatni:
+            wyjscie.put(_KONIEC)
+
+    for _ in range(liczba_watkow):
+        threading.Thread(target=_watek, daemon=True).start()
+
+
+def _przetworz_pliki(drive_service, client, pliki, cache, pula=None):
+    """
+    Potok: pobieranie -> ekstrakcja tekstu -> Claude, każdy etap z własną pulą wątków
+    i ograniczoną kolejką, więc plik trafia do Claude zaraz po odczytaniu tekstu,
+    a w pamięci jest naraz co najwyżej kilka PDF-ów. Zwraca {file_id: lista faktur | None}.
+    `pula`: długo żyjąca ekstrakcja.PulaEkstrakcji (serwer); bez niej potok tworzy własną na czas przebiegu.
+    """
+    do_pobrania = queue.Queue(maxsize=ROZMIAR_KOLEJKI)
+    do_odczytu = queue.Queue(maxsize=ROZMIAR_KOLEJKI)
+    do_claude = queue.Queue(maxsize=ROZMIAR_KOLEJKI)
+    gotowe = queue.Queue()  # (plik, lista faktur | None) — małe, bez limitu
+    statystyki = {'dokumenty': 0, 'lokalnie': 0, 'tokeny_przed': 0, 'tokeny_po': 0}
+    lock_statystyk = threading.Lock()
+
+    def _pobierz(element):
+        plik, = element
+        dane, fh, suma_kontrolna = _pobierz_lub_z_cache(drive_service, plik, cache)
+        if dane is not None:
+            print(f"♻️ {plik['name']}: {len(dane)} faktur(y) z cache")
+            gotowe.put((plik, dane))
+            return None
+        # W kolejce czeka uchwyt, nie bajty — duże pliki siedzą na dysku, nie w RAM.
+        return plik, suma_kontrolna, fh
 
-        if not pliki:
-            print("Nie znaleziono żadnych plików PDF w folderze.")
+    def _odczytaj(element):
+        plik, suma_kontrolna, fh = element
+        with fh:
+            tekst = odczytaj_tekst_z_pliku_pdf(_zrodlo_pdf(plik, fh), pula=pula)
+        if not tekst:
+            print(f"❌ Nie udało się odczytać tekstu: {plik['name']}")
+            gotowe.put((plik, None))
             return None
+        tekst, tokeny_przed, tokeny_po = kompaktuj_tekst(tekst, client)
+        with lock_statystyk:
+            statystyki['tokeny_przed'] += tokeny_przed
+            statystyki['tokeny_po'] += tokeny_po
+        if PROG_PEWNOSCI_LOKALNEJ is not None:
+            dane, pewnosc = wyodrebnij_lokalnie(tekst)
+            with lock_statystyk:
+                statystyki['dokumenty'] += 1
+                if pewnosc >= PROG_PEWNOSCI_LOKALNEJ:
+                    statystyki['lokalnie'] += 1
+            if pewnosc >= PROG_PEWNOSCI_LOKALNEJ:
+                cache.dodaj(suma_kontrolna, dane)
+                print(f"⚡ {plik['name']}: {len(dane)} faktur(y) lokalnie (pewność {pewnosc})")
+                gotowe.put((plik, dane))
+                return None
+        return plik, suma_kontrolna, tekst
 
-        print(f"\nZnaleziono {len(pliki)} plików PDF. Rozpoczynam przetwarzanie...\n")
-
-        # 3a. Pobierz PDF-y i wyciągnij tekst (sekwencyjnie — szybkie).
-        downloaded = []  # [(nazwa, tekst), ...]
-        for plik in pliki:
-            print(f"--- Pobieram: {plik['name']} ---")
-            request = drive_service.files().get_media(fileId=plik['id'])
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-            tekst = odczytaj_tekst_z_pliku_pdf(fh.getvalue())
-            if tekst:
-                downloaded.append((plik['name'], tekst))
+    def _parsuj(paczka):
+        # Kilka dokumentów naraz -> jedno zapytanie; czego nie dało się rozdzielić, idzie pojedynczo.
+        zbiorczo = {}
+        if len(paczka) > 1:
+            zbiorczo = wyodrebnij_dane_z_wielu_faktur(
+                client, [(f"d{i}", tekst) for i, (_, _, tekst) in enumerate(paczka, start=1)])
+            print(f"📦 Paczka {len(paczka)} dokumentów: rozdzielono {len(zbiorczo)}")
+        rezultaty = []
+        for i, (plik, suma_kontrolna, tekst) in enumerate(paczka, start=1):
+            dane = zbiorczo.get(f"d{i}")
+            if dane is None:
+                dane = wyodrebnij_dane_z_faktury(client, tekst)
+            if dane is not None and isinstance(dane, list):
+                cache.dodaj(suma_kontrolna, dane)
+                print(f"✅ {plik['name']}: {len(dane)} faktur(y)" if dane else f"ℹ️ {plik['name']}: brak faktur")
+                rezultaty.append((plik, dane))
             else:
-                print(f"❌ Nie udało się odczytać tekstu: {plik['name']}")
-
-        # 3b. Claude API równolegle — główny bottleneck.
-        if downloaded:
-            print(f"\nWysyłam {len(downloaded)} dokumentów do Claude równolegle...")
-            def _parse(item):
-                nazwa, tekst = item
-                return nazwa, wyodrebnij_dane_z_faktury(client, tekst)
-            with ThreadPoolExecutor(max_workers=min(6, len(downloaded))) as ex:
-                results = list(ex.map(_parse, downloaded))
-            for nazwa, dane in results:
-                if dane is not None and isinstance(dane, list):
-                    if dane:
-                        wszystkie_faktury.extend(dane)
-                        print(f"✅ {nazwa}: {len(dane)} faktur(y)")
-                    else:
-                        print(f"ℹ️ {nazwa}: brak faktur")
-                else:
-                    print(f"❌ {nazwa}: błąd parsowania")
+                print(f"❌ {plik['name']}: błąd parsowania")
+                rezultaty.append((plik, None))
+        return rezultaty
 
-    except HttpError as error:
-        print(f"Wystąpił błąd podczas komunikacji z API Dysku Google: {error}")
+    # Procesy puli startują dopiero przy pierwszym dużym PDF-ie — przy trafieniach cache nie powstają.
+    wlasna_pula = pula is None
+    if wlasna_pula:
+        pula = ekstrakcja.PulaEkstrakcji(PROCESY_EKSTRAKCJI)
+
+    _etap(_pobierz, do_pobrania, do_odczytu, WATKI_POBIERANIA, gotowe)
+    _etap(_odczytaj, do_odczytu, do_claude, WATKI_EKSTRAKCJI, gotowe)
+    _etap(_parsuj, do_claude, gotowe, WATKI_CLAUDE, gotowe,
+          budzet=BUDZET_TOKENOW_PACZKI, koszt=lambda element: szacuj_tokeny(element[2]),
+          slot=KONTROLER, okno=OKNO_PACZKI)
+
+    bledy_zasilania = []
+    zasilone = [0]  # ile plików weszło do potoku; rośnie razem ze strumieniowanym listingiem
+    przerwane = threading.Event()
+
+    def _zasilaj():
+        # `pliki` może być generatorem listingu z Dysku — błąd API przekazujemy do wątku głównego.
+        try:
+            for plik in pliki:
+                if przerwane.is_set():
+                    break
+                do_pobrania.put((plik,))
+                zasilone[0] += 1
+        except Exception as e:
+            bledy_zasilania.append(e)
+        finally:
+            do_pobrania.put(_KONIEC)
+    threading.Thread(target=_zasilaj, daemon=True).start()
+
+    # _KONIEC w `gotowe` pojawia się dopiero po zakończeniu wszystkich trzech etapów.
+    wyniki = {}
+    try:
+        while True:
+            element = gotowe.get()
+            if element is _KONIEC:
+                break
+            plik, dane = element
+            wyniki[plik['id']] = dane
+            raportuj(gotowe=len(wyniki), wszystkie=zasilone[0], plik=plik['name'], ok=dane is not None, faktury=dane)
+    except BaseException:
+        # Przerwanie (np. anulowanie z serwera): zasilanie staje, a wątki etapów kończą to, co mają
+        # w kolejkach — ktoś musi odbierać `gotowe`, inaczej zawisłyby na put() w długo żyjącym procesie.
+        przerwane.set()
+        def _oproznij():
+            while gotowe.get() is not _KONIEC:
+                pass
+        threading.Thread(target=_oproznij, daemon=True).start()
+        raise
+    finally:
+        if wlasna_pula:
+            pula.zamknij()
+    if bledy_zasilania:
+        raise bledy_zasilania[0]
+    if statystyki['tokeny_przed']:
+        print(f"\nKompaktowanie tekstu: {statystyki['tokeny_przed']} -> {statystyki['tokeny_po']} tokenów "
+              f"(-{100 - 100 * statystyki['tokeny_po'] // statystyki['tokeny_przed']}%)")
+    if statystyki['dokumenty']:
+        print(f"Ekstraktor lokalny: {statystyki['lokalnie']}/{statystyki['dokumenty']} dokumentów "
+              f"({100 * statystyki['lokalnie'] // statystyki['dokumenty']}%) bez Claude")
+    return wyniki
+
+
+def znajdz_folder(drive_service):
+    """ID folderu FOLDER_NAZWA na Dysku albo None."""
+    query = f"mimeType='application/vnd.google-apps.folder' and name='{FOLDER_NAZWA}' and trashed=false"
+    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+    items = results.get('files', [])
+
+    if not items:
+        print(f"BŁĄD: Nie znaleziono folderu o nazwie '{FOLDER_NAZWA}' na Twoim Dysku Google.")
         return None
 
+    print(f"Znaleziono folder '{items[0]['name']}' (ID: {items[0]['id']})")
+    return items[0]['id']
+
+
+def _klucz_numeru(numer, mylone=False):
+    """
+    Numer faktury jako segmenty: 'FV/01/2025' i 'fv-1-2025' -> 'FV/1/2025'. Zera wiodące
+    zdejmowane w obrębie segmentu, więc '10/5/2025' i '01/05/2025' zostają różne.
+    `mylone` ujednolica najpierw znaki mylone przez OCR (O/0, I/L/1, ...).
+    """
+    numer = str(numer or '').upper()
+    if mylone:
+        numer = numer.translate(MYLONE_ZNAKI)
+    return '/'.join((s.lstrip('0') or '0') if s.isdigit() else s for s in SEGMENT_NUMERU.findall(numer))
+
+
+def deduplikuj_faktury(faktury, nazwy_plikow):
+    """
+    Scala duplikaty w liście (id w magazynie, faktura) jednym przejściem przez indeksy haszujące.
+    Klucz dokładny: segmenty numeru (_klucz_numeru), data wystawienia, kwota w groszach. Bez trafienia —
+    klucz przybliżony: to samo po ujednoliceniu znaków mylonych przez OCR.
+    Faktury bez numeru zostają (dwie wizyty tego samego dnia za tę samą kwotę to nie duplikat).
+    Pierwsze wystąpienie zostaje i dostaje z duplikatu pola, których nie miało.
+    Zwraca (faktury, raport [{'numer', 'data_wystawienia', 'kwota_faktury', 'pliki', 'dopasowanie'}]).
+    """
+    dokladne, przyblizone = {}, {}  # klucz -> pozycja w wyniku
+    wynik, raport = [], {}
+    for klucz, faktura in faktury:
+        numer = _klucz_numeru(faktura.get('numer'))
+        if not numer:
+            wynik.append((klucz, faktura))
+            continue
+        try:
+            grosze = round(float(faktura.get('kwota_faktury') or 0) * 100)
+        except (TypeError, ValueError):
+            grosze = None
+        dokladny = (numer, faktura.get('data_wystawienia'), grosze)
+        przyblizony = (_klucz_numeru(faktura.get('numer'), mylone=True),) + dokladny[1:]
+
+        if dokladny in dokladne:
+            i, dopasowanie = dokladne[dokladny], 'dokładne'
+        elif przyblizony in przyblizone:
+            i, dopasowanie = przyblizone[przyblizony], 'podobny numer'
+        else:
+            dokladne[dokladny] = przyblizone[przyblizony] = len(wynik)
+            wynik.append((klucz, faktura))
+            continue
+
+        klucz_zachowanej, zachowana = wynik[i]
+        braki = {k: v for k, v in faktura.items() if zachowana.get(k) in (None, '') and v not in (None, '')}
+        if braki:
+            wynik[i] = (klucz_zachowanej, {**zachowana, **braki})
+        if i not in raport:
+            raport[i] = {'numer': zachowana.get('numer'), 'data_wystawienia': zachowana.get('data_wystawienia'),
+                         'kwota_faktury': zachowana.get('kwota_faktury'), 'dopasowanie': dopasowanie,
+                         'pliki': [nazwy_plikow.get(klucz_zachowanej.split('/', 1)[0]) or klucz_zachowanej]}
+        elif dopasowanie != 'dokładne':
+            raport[i]['dopasowanie'] = dopasowanie
+        raport[i]['pliki'].append(nazwy_plikow.get(klucz.split('/', 1)[0]) or klucz)
+    return wynik, list(raport.values())
+
+
+def zapisz_faktury_z_manifestu(manifest, output_json_path=None):
+    """
+    Składa faktury ze wszystkich plików manifestu, scala duplikaty, sortuje i zapisuje przez magazyn
+    (nowa rewizja + JSON). Zwraca ścieżkę albo None. Pusty manifest (folder bez PDF-ów) to pusty
+    zbiór faktur, nie błąd.
+    """
+    output_json_path = output_json_path or WYNIK_PLIK
+    if not manifest['pliki']:
+        rewizja = magazyn.zapisz([], eksport=output_json_path)
+        print(f"\nBrak plików PDF — zapisano pusty zbiór faktur (rewizja {rewizja}).")
+        return output_json_path
+
+    wszystkie_faktury = []  # (id w magazynie, faktura)
+    for file_id, wpis in manifest['pliki'].items():
+        faktury = wpis.get('faktury') or []
+        wszystkie_faktury.extend(zip(magazyn.klucze_faktur(file_id, faktury), faktury))
+
+    wszystkie_faktury, duplikaty = deduplikuj_faktury(
+        wszystkie_faktury, {file_id: wpis.get('name') for file_id, wpis in manifest['pliki'].items()})
+    if duplikaty:
+        print(f"\n🔁 Scalono duplikaty: {sum(len(d['pliki']) - 1 for d in duplikaty)} "
+              f"(faktur z kopiami: {len(duplikaty)})")
+        for d in duplikaty:
+            print(f"   - {d['numer']} z {d['data_wystawienia']}, {d['kwota_faktury']} PLN "
+                  f"({d['dopasowanie']}): {', '.join(d['pliki'])}")
+
     if wszystkie_faktury:
         # Sortowanie faktur po dacie wykonania usługi
         try:
             print("\nSortowanie wszystkich faktur według daty wykonania usługi...")
-            wszystkie_faktury.sort(key=lambda x: datetime.strptime(x.get('data_wykonania_uslugi') or '1900-01-01', '%Y-%m-%d'))
+            wszystkie_faktury.sort(key=lambda x: datetime.strptime(x[1].get('data_wykonania_uslugi') or '1900-01-01', '%Y-%m-%d'))
             print("Sortowanie zakończone pomyślnie.")
         except (ValueError, TypeError) as e:
             print(f"Ostrzeżenie: Wystąpił błąd podczas sortowania faktur, dane mogą nie być posortowane. Błąd: {e}")
 
-        with open(output_json_path, 'w', encoding='utf-8') as f:
-            json.dump(wszystkie_faktury, f, ensure_ascii=False, indent=4)
-        print(f"\n✅ Przetwarzanie zakończone. Dane zostały zapisane w pliku: {output_json_path}")
+        rewizja = magazyn.zapisz(wszystkie_faktury, eksport=output_json_path)
+        print(f"\n✅ Przetwarzanie zakończone. Dane zostały zapisane w pliku: {output_json_path} (rewizja {rewizja})")
         return output_json_path
     else:
         print("\nNie udało się przetworzyć żadnych faktur.")
         return None
 
 
-def generuj_podsumowanie_kwartalne(json_path):
-    """Czyta plik JSON i generuje rozbudowane podsumowanie analityczne."""
-    if not json_path or not os.path.exists(json_path):
-        print("Nie można wygenerować podsumowania, ponieważ plik z danymi nie istnieje.")
-        return
+def przetwarzaj_faktury_z_dysku(drive_service, client, tryb_sync=False, folder_id=None, pula=None):
+    """
+    Główna funkcja orkiestrująca cały proces.
+    tryb_sync=True: zamiast listować cały folder, bierze z Changes API tylko pliki
+    dodane/zmienione/usunięte od ostatniego przebiegu (stan w MANIFEST_PLIK).
+    folder_id: znane już ID folderu (serwer trzyma je w pamięci) — pomija wyszukiwanie.
+    pula: pula ekstrakcji PDF współdzielona przez kolejne przebiegi (serwer).
+    """
+    manifest = wczytaj_manifest()
+
+    try:
+        # 1. Znajdź ID folderu
+        raportuj(etap='listowanie')
+        folder_id = folder_id or znajdz_folder(drive_service)
+        if not folder_id:
+            return None
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        dane_faktur = json.load(f)
+        # 2. Ustal pliki do przetworzenia: delta z Changes API albo pełny listing folderu.
+        znane = manifest['pliki']
+        pelny_listing = not (tryb_sync and manifest['start_page_token'] and manifest['folder_id'] == folder_id)
+        if not pelny_listing:
+            pliki, usuniete, nowy_token = pobierz_zmiany_z_dysku(drive_service, folder_id, manifest)
+            for file_id in usuniete:
+                znane.pop(file_id, None)
+            print(f"Synchronizacja przyrostowa: {len(pliki)} nowych/zmienionych, {len(usuniete)} usuniętych plików.")
+        else:
+            # Token pobieramy PRZED listingiem — zmiany w trakcie listingu trafią do następnej delty.
+            nowy_token = drive_service.changes().getStartPageToken().execute().get('startPageToken')
+            pliki = dysk.listuj_pliki(drive_service, dysk.zapytanie_pdf(folder_id))
 
-    if not dane_faktur:
-        print("Plik z danymi jest pusty. Brak danych do analizy.")
-        return
+        # Listing jest strumieniowany: pobieranie rusza po pierwszej stronie wyników.
+        widziane = {}
+
+        def _do_pobrania():
+            for plik in pliki:
+                widziane[plik['id']] = plik
+                wpis = znane.get(plik['id'])
+                if wpis and wpis.get('faktury') is not None and wpis.get('md5Checksum') == plik.get('md5Checksum'):
+                    continue
+                yield plik
 
-    # Inicjalizacja zmiennych do analizy
-    liczba_faktur = len(dane_faktur)
-    laczna_kwota = 0
-    daty_wykonania = []
-    podsumowanie_kwartalne = {'Q1': {'kwota': 0, 'lata': set()}, 'Q2': {'kwota': 0, 'lata': set()},
-                              'Q3': {'kwota': 0, 'lata': set()}, 'Q4': {'kwota': 0, 'lata': set()}}
+        print("\nRozpoczynam przetwarzanie...\n")
+        raportuj(etap='przetwarzanie')
+        cache = CacheEkstrakcji()
+        TOKENY.resetuj()
+        wyniki = _przetworz_pliki(drive_service, client, _do_pobrania(), cache, pula=pula)
 
-    for faktura in dane_faktur:
+        if pelny_listing:
+            if not widziane:
+                print("Nie znaleziono żadnych plików PDF w folderze.")
+            manifest['pliki'] = znane = {k: v for k, v in znane.items() if k in widziane}
+        for file_id, dane in wyniki.items():
+            plik = widziane[file_id]
+            znane[file_id] = {
+                'name': plik.get('name'),
+                'modifiedTime': plik.get('modifiedTime'),
+                'md5Checksum': plik.get('md5Checksum'),
+                'faktury': dane,
+            }
+        print(f"\nPliki PDF: {len(znane)}, przetworzone w tym przebiegu: {len(wyniki)}")
+
+        print(f"\nCache ekstrakcji: {cache.trafienia} trafień, {cache.chybienia} chybień")
+        print(f"Claude: {KONTROLER.statystyki()}")
+        print(f"Tokeny: {TOKENY.podsumowanie()}")
+        raportuj(etap='zapis')
         try:
-            # Obliczenia ogólne
-            kwota = float(faktura.get("kwota_faktury") or 0)
-            laczna_kwota += kwota
-            
-            data_wykonania_str = faktura.get("data_wykonania_uslugi")
-            if data_wykonania_str:
-                daty_wykonania.append(datetime.strptime(data_wykonania_str, '%Y-%m-%d'))
-
-            # Obliczenia kwartalne na podstawie daty wystawienia
-            data_wystawienia_str = faktura.get("data_wystawienia")
-            if data_wystawienia_str and kwota is not None:
-                data_obj = datetime.strptime(data_wystawienia_str, '%Y-%m-%d')
-                kwartal = (data_obj.month - 1) // 3 + 1
-                rok = data_obj.year
-                
-                klucz_kwartalu = f'Q{kwartal}'
-                podsumowanie_kwartalne[klucz_kwartalu]['kwota'] += kwota
-                podsumowanie_kwartalne[klucz_kwartalu]['lata'].add(rok)
+            cache.zapisz()
+            manifest['folder_id'] = folder_id
+            manifest['start_page_token'] = nowy_token
+            zapisz_manifest(manifest)
+        except OSError as e:
+            print(f"Ostrzeżenie: nie udało się zapisać cache/manifestu. Błąd: {e}")
 
-        except (ValueError, TypeError) as e:
-            print(f"Ostrzeżenie: Pomijam fakturę z powodu błędu danych: {faktura.get('numer')}. Błąd: {e}")
+    except HttpError as error:
+        print(f"Wystąpił błąd podczas komunikacji z API Dysku Google: {error}")
+        return None
+
+    return zapisz_faktury_z_manifestu(manifest)
+
+
+def przetwarzaj_backfill(drive_service, client):
+    """
+    Tryb --backfill dla dużych archiwów: wszystkie nowe dokumenty idą jednym zleceniem
+    przez Message Batches API (taniej i bez limitów zapytań na minutę). Id zlecenia trafia
+    do BACKFILL_PLIK, więc po restarcie procesu wznawiamy odpytywanie zamiast wysyłać ponownie.
+    """
+    manifest = wczytaj_manifest()
+    stan = None
+    if os.path.exists(BACKFILL_PLIK):
+        with open(BACKFILL_PLIK, 'r', encoding='utf-8') as f:
+            stan = json.load(f)
+        print(f"Wznawiam backfill: zlecenie {stan['batch_id']} ({len(stan['pliki'])} dokumentów).")
 
-    # Obliczenia końcowe
-    srednia_wartosc_faktury = laczna_kwota / liczba_faktur if liczba_faktur > 0 else 0
-    pierwsza_data = min(daty_wykonania) if daty_wykonania else None
-    ostatnia_data = max(daty_wykonania) if daty_wykonania else None
+    try:
+        if stan is None:
+            folder_id = znajdz_folder(drive_service)
+            if not folder_id:
+                return None
+            nowy_token = drive_service.changes().getStartPageToken().execute().get('startPageToken')
+            pliki = list(dysk.listuj_pliki(drive_service, dysk.zapytanie_pdf(folder_id)))
+            obecne = {plik['id'] for plik in pliki}
+            manifest['pliki'] = {k: v for k, v in manifest['pliki'].items() if k in obecne}
+            manifest['folder_id'] = folder_id
+
+            cache = CacheEkstrakcji()
+            zlecenia = []
+            wyslane = {}
+            with ekstrakcja.PulaEkstrakcji(PROCESY_EKSTRAKCJI) as pula:
+                for plik in pliki:
+                    wpis = manifest['pliki'].get(plik['id'])
+                    if wpis and wpis.get('faktury') is not None and wpis.get('md5Checksum') == plik.get('md5Checksum'):
+                        continue
+                    meta = {'name': plik.get('name'), 'modifiedTime': plik.get('modifiedTime'),
+                            'md5Checksum': plik.get('md5Checksum')}
+                    dane, fh, suma_kontrolna = _pobierz_lub_z_cache(drive_service, plik, cache)
+                    if dane is not None:
+                        manifest['pliki'][plik['id']] = {**meta, 'faktury': dane}
+                        continue
+                    with fh:
+                        tekst = odczytaj_tekst_z_pliku_pdf(_zrodlo_pdf(plik, fh), pula=pula)
+                    if not tekst:
+                        print(f"❌ Nie udało się odczytać tekstu: {plik['name']}")
+                        manifest['pliki'][plik['id']] = {**meta, 'faktury': None}
+                        continue
+                    tekst, tokeny_przed, tokeny_po = kompaktuj_tekst(tekst, client)
+                    print(f"   {plik['name']}: {tokeny_przed} -> {tokeny_po} tokenów po kompaktowaniu")
+                    meta['suma_kontrolna'] = suma_kontrolna
+                    wyslane[plik['id']] = meta
+                    zlecenia.append({
+                        'custom_id': plik['id'],  # id z Drive spełnia format custom_id ([A-Za-z0-9_-])
+                        'params': _parametry_faktury(tekst),
+                    })
+
+            if not zlecenia:
+                print("Brak nowych dokumentów do backfillu.")
+                manifest['start_page_token'] = nowy_token
+                zapisz_manifest(manifest)
+                return zapisz_faktury_z_manifestu(manifest)
+
+            batch = client.messages.batches.create(requests=zlecenia)
+            stan = {'batch_id': batch.id, 'start_page_token': nowy_token, 'pliki': wyslane}
+            # Token zapisujemy dopiero po odebraniu wyników — wcześniejszy --sync nie zgubi tych plików.
+            zapisz_manifest(manifest)
+            tmp = BACKFILL_PLIK + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(stan, f, ensure_ascii=False)
+            os.replace(tmp, BACKFILL_PLIK)
+            print(f"📨 Wysłano zlecenie {batch.id}: {len(zlecenia)} dokumentów.")
+    except HttpError as error:
+        print(f"Wystąpił błąd podczas komunikacji z API Dysku Google: {error}")
+        return None
+
+    while True:
+        batch = client.messages.batches.retrieve(stan['batch_id'])
+        if batch.processing_status == 'ended':
+            break
+        licznik = batch.request_counts
+        print(f"⏳ Zlecenie {batch.id}: w toku {licznik.processing}, gotowe {licznik.succeeded}, błędy {licznik.errored}")
+        time.sleep(BACKFILL_INTERWAL)
+
+    cache = CacheEkstrakcji()
+    TOKENY.resetuj()
+    for wynik in client.messages.batches.results(stan['batch_id']):
+        meta = stan['pliki'].get(wynik.custom_id)
+        if meta is None:
+            continue
+        dane = None
+        if wynik.result.type == 'succeeded':
+            TOKENY.dodaj(getattr(wynik.result.message, 'usage', None))
+            try:
+                dane, bledy = waliduj_faktury(_blok_narzedzia(wynik.result.message.content).input.get('faktury'))
+                if bledy:
+                    print(f"⚠️ {meta['name']}: {'; '.join(bledy)}")
+                    dane = None
+            except ValueError:
+                pass
+        if isinstance(dane, list):
+            cache.dodaj(meta['suma_kontrolna'], dane)
+            print(f"✅ {meta['name']}: {len(dane)} faktur(y)")
+        else:
+            dane = None
+            print(f"❌ {meta['name']}: {wynik.result.type}")
+        manifest['pliki'][wynik.custom_id] = {
+            'name': meta['name'], 'modifiedTime': meta['modifiedTime'],
+            'md5Checksum': meta['md5Checksum'], 'faktury': dane,
+        }
+
+    print(f"Tokeny: {TOKENY.podsumowanie()}")
+    cache.zapisz()
+    manifest['start_page_token'] = stan['start_page_token']
+    zapisz_manifest(manifest)
+    os.remove(BACKFILL_PLIK)
+    return zapisz_faktury_z_manifestu(manifest)
+
+
+def generuj_podsumowanie_kwartalne(json_path):
+    """Rozbudowane podsumowanie analityczne z agregatów magazynu (te same liczby co /stats w UI)."""
+    if not json_path or not os.path.exists(json_path):
+        print("Nie można wygenerować podsumowania, ponieważ plik z danymi nie istnieje.")
+        return
+
+    _, statystyki = magazyn.statystyki()
+    if not statystyki['invoiceCount']:
+        print("Plik z danymi jest pusty. Brak danych do analizy.")
+        return
 
     # Wyświetlanie rozbudowanego podsumowania
     print("\n\n" + "="*50)
@@ -282,27 +1352,43 @@ def generuj_podsumowanie_kwartalne(json_path):
     print("="*50)
     
     print("\n--- PODSUMOWANIE OGÓLNE ---")
-    print(f"  - Przetworzono faktur:       {liczba_faktur}")
-    print(f"  - Łączna kwota faktur:        {laczna_kwota:.2f} PLN")
-    print(f"  - Średnia wartość faktury:    {srednia_wartosc_faktury:.2f} PLN")
-    if pierwsza_data and ostatnia_data:
-        print(f"  - Zakres usług (od-do):     {pierwsza_data.strftime('%Y-%m-%d')} - {ostatnia_data.strftime('%Y-%m-%d')}")
+    print(f"  - Przetworzono faktur:       {statystyki['invoiceCount']}")
+    print(f"  - Łączna kwota faktur:        {statystyki['totalAmount']:.2f} PLN")
+    print(f"  - Średnia wartość faktury:    {statystyki['averageAmount']:.2f} PLN")
+    if statystyki['dateRange']['from']:
+        print(f"  - Zakres usług (od-do):     {statystyki['dateRange']['from']} - {statystyki['dateRange']['to']}")
 
+    # Kwartały z rokiem w kluczu — Q1 2024 i Q1 2025 to osobne rozliczenia.
     print("\n--- PODSUMOWANIE KWARTALNE (wg daty wystawienia) ---")
-    for kwartal, dane in podsumowanie_kwartalne.items():
-        if dane['kwota'] > 0:
-            lata_str = ", ".join(map(str, sorted(list(dane['lata']))))
-            print(f"  - {kwartal} ({lata_str}): {dane['kwota']:.2f} PLN")
+    for kwartal in statystyki['quarterlyBreakdown']:
+        if kwartal['total'] > 0:
+            print(f"  - Q{kwartal['quarter']} {kwartal['year']}: {kwartal['total']:.2f} PLN "
+                  f"(faktur: {kwartal['count']})")
     
     print("\n" + "="*50)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ekstrakcja danych z faktur z Dysku Google.")
+    tryb = parser.add_mutually_exclusive_group()
+    tryb.add_argument('--sync', action='store_true',
+                        help="przetwarzaj tylko pliki zmienione od ostatniego przebiegu (Drive Changes API)")
+    tryb.add_argument('--backfill', action='store_true',
+                        help="duże archiwum: wyślij wszystko przez Message Batches API (wznawialne)")
+    parser.add_argument('--postep', action='store_true',
+                        help=f"wypisuj zdarzenia postępu jako JSON (linie z prefiksem '{PREFIKS_POSTEPU.strip()}')")
+    args = parser.parse_args()
+    if args.postep:
+        RAPORT_POSTEPU = lambda zdarzenie: print(PREFIKS_POSTEPU + json.dumps(zdarzenie, ensure_ascii=False), flush=True)
+
     drive_service = autoryzuj_dysk_google()
     ai_model = skonfiguruj_model_ai()
 
     if drive_service and ai_model:
-        wynikowy_json = przetwarzaj_faktury_z_dysku(drive_service, ai_model)
+        if args.backfill:
+            wynikowy_json = przetwarzaj_backfill(drive_service, ai_model)
+        else:
+            wynikowy_json = przetwarzaj_faktury_z_dysku(drive_service, ai_model, tryb_sync=args.sync)
         generuj_podsumowanie_kwartalne(wynikowy_json)
     else:
         print("\nSkrypt nie może kontynuować z powodu błędów konfiguracji.")